@@ -4,6 +4,7 @@ import { useEffect, useState, useRef } from 'react';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import * as Notifications from 'expo-notifications';
 import * as Device from 'expo-device';
+import { deviceAPI } from './services/api';
 
 export default function RootLayout() {
   const [loggedIn, setLoggedIn] = useState(null);
@@ -32,7 +33,12 @@ export default function RootLayout() {
         if (finalStatus === 'granted') {
           const { data: expoPushToken } = await Notifications.getExpoPushTokenAsync();
           console.log('Expo Push Token:', expoPushToken);
-          // TODO: send `expoPushToken` up to your backend tied to the current user
+          if (token) {
+            const result = await deviceAPI.register(expoPushToken, Device.osName);
+            if (result.error) {
+              console.error('Error registering push token:', result.error);
+            }
+          }
         } else {
           console.warn('Push notification permission not granted!');
         }
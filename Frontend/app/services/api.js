@@ -209,6 +209,16 @@ export const choresAPI = {
   },
 };
 
+// Push notification device API calls
+export const deviceAPI = {
+  register: (token, platform) => {
+    return apiRequest('/devices/register', {
+      method: 'POST',
+      body: JSON.stringify({ token, platform }),
+    });
+  },
+};
+
 // Utility to test if the API is reachable
 export const testConnection = async () => {
   try {
@@ -235,6 +245,7 @@ export default {
   calendarAPI,
   inventoryAPI,
   choresAPI,
+  deviceAPI,
   getAuthToken,
   testConnection,
   BASE_URL: API_BASE_URL,
@@ -0,0 +1,147 @@
+import asyncio, threading
+from datetime import datetime
+
+from flask import Blueprint, current_app, g, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select
+
+import config as app_config
+from ledger import balance_statements
+from models import CalendarEvent, CheckpointBalance, Chore, LedgerCheckpoint, User
+from serializers import CHORE_FIELDS, EVENT_FIELDS, select_columns, serialize_rows
+from splits import from_cents
+
+# Read-only aggregate endpoints that run their independent queries
+# concurrently on SQLAlchemy's asyncio engine, mounted under /async next to
+# the sync blueprints. Opt in with ASYNC_READS; the sync routes stay the
+# reference implementation.
+async_reads = Blueprint('async_reads', __name__, url_prefix='/async')
+
+DASHBOARD_EVENTS = 10
+DASHBOARD_CHORES = 20
+# A request thread gives up waiting on the event loop after this long.
+RESULT_TIMEOUT = 30
+
+
+class AsyncReader:
+    # One event loop per process, on its own thread. Request threads hand it
+    # coroutines and block on the result, so every pooled async connection
+    # stays on the loop that created it and one loop multiplexes the database
+    # round-trips of all in-flight requests.
+    def __init__(self, profile, urls):
+        from sqlalchemy.ext.asyncio import create_async_engine
+        self.loop = asyncio.new_event_loop()
+        self.engines = {}
+        for key, url in urls.items():
+            engine = create_async_engine(app_config.async_url(url), **app_config.async_engine_options(profile, url))
+            app_config.tune_engine(engine.sync_engine)
+            self.engines[key] = engine
+        self._thread = threading.Thread(target=self.loop.run_forever, name='async-reads', daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(RESULT_TIMEOUT)
+
+    # Same routing as the sync session: the replica unless this request was
+    # pinned to the primary for read-your-writes.
+    def engine(self):
+        if g.get('read_replica') and 'replica' in self.engines:
+            return self.engines['replica']
+        return self.engines[None]
+
+    def close(self):
+        for engine in self.engines.values():
+            self.run(engine.dispose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+# Each statement gets its own pooled connection: a single connection can't
+# run queries concurrently.
+async def fetch(engine, stmt):
+    async with engine.connect() as conn:
+        return (await conn.execute(stmt)).all()
+
+
+async def fetch_all(engine, *stmts):
+    return await asyncio.gather(*(fetch(engine, stmt) for stmt in stmts))
+
+
+async def group_balances(engine, group_id):
+    checkpoint = await fetch(engine, select(
+        LedgerCheckpoint.id, LedgerCheckpoint.last_expense_id, LedgerCheckpoint.last_payment_id)
+        .where(LedgerCheckpoint.group_id == group_id).order_by(LedgerCheckpoint.id.desc()).limit(1))
+    after_expense, after_payment = 0, 0
+    stmts = []
+    if checkpoint:
+        checkpoint_id, after_expense, after_payment = checkpoint[0]
+        stmts.append((select(CheckpointBalance.user_id, CheckpointBalance.balance_cents)
+                      .where(CheckpointBalance.checkpoint_id == checkpoint_id), None))
+    stmts += balance_statements(group_id, after_expense, after_payment)
+
+    balances = {}
+    for (_, sign), rows in zip(stmts, await fetch_all(engine, *(stmt for stmt, _ in stmts))):
+        for user_id, total in rows:
+            cents = total if sign is None else sign * int(round((total or 0) * 100))
+            balances[user_id] = balances.get(user_id, 0) + cents
+    return balances
+
+
+def _members_query(group_id):
+    return select(User.id, User.name, User.status).where(User.group_id == group_id).order_by(User.id)
+
+
+async def balances_view(engine, group_id):
+    members, balances = await asyncio.gather(fetch(engine, _members_query(group_id)),
+                                             group_balances(engine, group_id))
+    return [{'user_id': user_id, 'name': name, 'balance': from_cents(balances.get(user_id, 0))}
+            for user_id, name, _ in members]
+
+
+async def dashboard_view(engine, group_id, now):
+    event_fields, chore_fields = list(EVENT_FIELDS), ['id', 'name', 'assigned_to', 'type', 'due_date', 'version']
+    members, balances, events, chores = await asyncio.gather(
+        fetch(engine, _members_query(group_id)),
+        group_balances(engine, group_id),
+        fetch(engine, select(*select_columns(EVENT_FIELDS, event_fields))
+              .where(CalendarEvent.group_id == group_id, CalendarEvent.start_time >= now)
+              .order_by(CalendarEvent.start_time, CalendarEvent.id).limit(DASHBOARD_EVENTS)),
+        fetch(engine, select(*select_columns(CHORE_FIELDS, chore_fields))
+              .where(Chore.group_id == group_id, Chore.completed.isnot(True))
+              .order_by(Chore.due_date, Chore.id).limit(DASHBOARD_CHORES)),
+    )
+    return {
+        'members': [{'user_id': user_id, 'name': name, 'status': status,
+                     'balance': from_cents(balances.get(user_id, 0))}
+                    for user_id, name, status in members],
+        'upcoming_events': serialize_rows(events, EVENT_FIELDS, event_fields),
+        'open_chores': serialize_rows(chores, CHORE_FIELDS, chore_fields),
+    }
+
+
+# Same response as /expenses/balances/<group_id>.
+@async_reads.route('/expenses/balances/<int:group_id>', methods=['GET'])
+@jwt_required()
+def balances(group_id):
+    reader = current_app.extensions['async_reads']
+    return jsonify(reader.run(balances_view(reader.engine(), group_id)))
+
+
+# Everything the dashboard screen shows for a group in one round-trip:
+# roommates with status and balance, the next events and the open chores.
+@async_reads.route('/dashboard/<int:group_id>', methods=['GET'])
+@jwt_required()
+def dashboard(group_id):
+    reader = current_app.extensions['async_reads']
+    return jsonify(reader.run(dashboard_view(reader.engine(), group_id, datetime.utcnow())))
+
+
+def init_async_reads(app):
+    if not app.config.get('ASYNC_READS'):
+        return
+    urls = {None: app.config['SQLALCHEMY_DATABASE_URI']}
+    replica = app.config.get('SQLALCHEMY_BINDS', {}).get('replica')
+    if replica:
+        urls['replica'] = replica['url'] if isinstance(replica, dict) else replica
+    app.extensions['async_reads'] = AsyncReader(app.config['PROFILE'], urls)
+    app.register_blueprint(async_reads)
@@ -0,0 +1,129 @@
+"""Throughput of the sync and asyncio read paths at high concurrency.
+
+Serves the app from a threaded server in a child process and hammers it from
+--concurrency client threads, comparing:
+
+  balances   GET /expenses/balances/<g>  vs  GET /async/expenses/balances/<g>
+  dashboard  the dashboard screen's sync calls (roster, events, balances) in
+             sequence  vs  GET /async/dashboard/<g>
+
+Uses a throwaway SQLite file unless --database-url points at a scratch
+Postgres database; round-trip latency is where the async path pays off, so
+Postgres over a network is the representative setup. Needs aiosqlite or
+asyncpg.
+
+    python benchmarks/bench_async_reads.py [--concurrency 64] [--seconds 10] [--expenses 20000]
+"""
+import argparse, os, subprocess, sys, tempfile, time, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+SERVER = """
+from werkzeug.serving import run_simple
+from app import create_app
+app = create_app({'ASYNC_READS': True, 'RATELIMIT_ENABLED': False, 'JWT_VERIFY_SUB': False})
+run_simple('127.0.0.1', %(port)d, app, threaded=True)
+"""
+
+
+def seed(expenses, members):
+    from app import create_app
+    from extensions import db
+    from models import CalendarEvent, Chore, Expense, ExpenseSplit, Group, User
+    from datetime import datetime, timedelta
+    from flask_jwt_extended import create_access_token
+
+    app = create_app({'JWT_VERIFY_SUB': False})
+    with app.app_context():
+        db.create_all()
+        group = Group(name='bench', invite_code='BENCH')
+        db.session.add(group)
+        db.session.flush()
+        db.session.execute(db.insert(User), [
+            {'name': f'm{i}', 'email': f'm{i}@bench', 'password_hash': 'x', 'group_id': group.id, 'status': 'home'}
+            for i in range(members)])
+        user_ids = [u.id for u in User.query.filter_by(group_id=group.id)]
+        now = datetime.utcnow()
+        db.session.execute(db.insert(Expense), [
+            {'description': f'e{i}', 'amount': 12.0, 'group_id': group.id, 'paid_by': user_ids[i % members],
+             'created_at': now} for i in range(expenses)])
+        expense_ids = [row.id for row in db.session.query(Expense.id)]
+        db.session.execute(db.insert(ExpenseSplit), [
+            {'expense_id': e, 'user_id': u, 'amount': 12.0 / members} for e in expense_ids for u in user_ids])
+        db.session.execute(db.insert(CalendarEvent), [
+            {'title': f'ev{i}', 'group_id': group.id, 'created_by': user_ids[0],
+             'start_time': now + timedelta(hours=i)} for i in range(200)])
+        db.session.execute(db.insert(Chore), [
+            {'name': f'c{i}', 'group_id': group.id, 'type': 'one_time', 'completed': False,
+             'assigned_to': user_ids[i % members]} for i in range(200)])
+        db.session.commit()
+        return group.id, create_access_token(identity=user_ids[0])
+
+
+def hammer(base, paths, token, concurrency, seconds):
+    headers = {'Authorization': 'Bearer ' + token}
+    stop = time.perf_counter() + seconds
+    counts = [0] * concurrency
+    latencies = [[] for _ in range(concurrency)]
+
+    def client(i):
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            for path in paths:
+                with urllib.request.urlopen(urllib.request.Request(base + path, headers=headers)) as resp:
+                    resp.read()
+            latencies[i].append(time.perf_counter() - start)
+            counts[i] += 1
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    samples = sorted(x for per_client in latencies for x in per_client)
+    return sum(counts) / seconds, samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--expenses', type=int, default=20000)
+    parser.add_argument('--members', type=int, default=6)
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--database-url', help='Scratch database; default is a temporary SQLite file.')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('MAX_CONCURRENT_REQUESTS', str(args.concurrency * 4))
+    group_id, token = seed(args.expenses, args.members)
+
+    server = subprocess.Popen([sys.executable, '-c', SERVER % {'port': args.port}], cwd=BACKEND,
+                              stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{args.port}'
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base + '/healthz').read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        cases = [
+            ('balances', 'sync', [f'/expenses/balances/{group_id}']),
+            ('balances', 'async', [f'/async/expenses/balances/{group_id}']),
+            ('dashboard', 'sync', [f'/groups/{group_id}/users', f'/calendar/group/{group_id}?limit=10',
+                                   f'/expenses/balances/{group_id}']),
+            ('dashboard', 'async', [f'/async/dashboard/{group_id}']),
+        ]
+        print(f'concurrency={args.concurrency} expenses={args.expenses} db={os.environ["DATABASE_URL"].split(":")[0]}')
+        print(f"{'case':>10}{'path':>7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, kind, paths in cases:
+            hammer(base, paths, token, min(args.concurrency, 4), 1)  # warm the pools
+            throughput, p50, p95 = hammer(base, paths, token, args.concurrency, args.seconds)
+            print(f'{name:>10}{kind:>7}{throughput:>10.1f}{p50:>10.1f}{p95:>10.1f}')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
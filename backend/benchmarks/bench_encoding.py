@@ -0,0 +1,89 @@
+"""Bytes on the wire and server CPU per response encoding.
+
+Builds roster- and history-shaped payloads like the ones the API returns and
+times each encoding (and compression on top of it) over several rounds.
+
+    python benchmarks/bench_encoding.py [--rows 2000] [--rounds 20]
+"""
+import argparse, gzip, json, os, sys, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import GZIP_LEVEL, BROTLI_QUALITY, brotli, msgpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def roster_payload(rows):
+    base = datetime(2025, 1, 1)
+    users = []
+    for u in range(max(rows // 20, 1)):
+        users.append({
+            'id': u, 'name': f'Roommate {u}', 'email': f'roommate{u}@example.com', 'status': 'home',
+            'chores': [{
+                'id': u * 20 + c, 'name': f'Chore {c}', 'group_id': 1, 'assigned_to': u,
+                'created_by': 1, 'last_updated_by': 1, 'type': 'recurring', 'repeat_type': 'weekly',
+                'recurring_days': '["Monday", "Thursday"]', 'custom_days': None,
+                'due_date': (base + timedelta(days=c)).strftime('%Y-%m-%d'), 'status': 'active',
+                'completed': False, 'created_at': base.isoformat(), 'completed_at': None,
+            } for c in range(20)]
+        })
+    return {'group_id': 1, 'group_name': 'House', 'invite_code': 'ABC123', 'chores': users}
+
+
+def history_payload(rows):
+    base = datetime(2025, 1, 1)
+    return [{
+        'expense_id': i, 'description': f'Groceries run {i % 17}', 'total_amount': 84.25,
+        'paid_by': {'user_id': 1, 'name': 'Roommate 1'},
+        'created_at': (base + timedelta(hours=i)).isoformat(),
+        'owes': [{'from': {'user_id': d, 'name': f'Roommate {d}'},
+                  'to': {'user_id': 1, 'name': 'Roommate 1'}, 'amount': 21.06} for d in range(2, 5)],
+    } for i in range(rows)]
+
+
+def encoders():
+    out = {'json': lambda obj: json.dumps(obj).encode()}
+    if orjson is not None:
+        out['orjson'] = orjson.dumps
+    if msgpack is not None:
+        out['msgpack'] = lambda obj: msgpack.packb(obj, use_bin_type=True)
+    return out
+
+
+def codecs():
+    out = {'identity': lambda body: body,
+           'gzip': lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        out['br'] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+    return out
+
+
+def measure(fn, arg, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        result = fn(arg)
+    return result, (time.process_time() - start) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'payload':<10}{'encoding':<10}{'codec':<10}{'bytes':>12}{'encode ms':>12}{'codec ms':>12}")
+    for name, payload in (('roster', roster_payload(args.rows)), ('history', history_payload(args.rows))):
+        for enc_name, encode in encoders().items():
+            body, encode_ms = measure(encode, payload, args.rounds)
+            for codec_name, codec in codecs().items():
+                wire, codec_ms = measure(codec, body, args.rounds)
+                print(f'{name:<10}{enc_name:<10}{codec_name:<10}{len(wire):>12}{encode_ms:>12.2f}{codec_ms:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Import cost of building the app, with a budget for CI.
+
+Runs `python -X importtime` on create_app() in fresh interpreters and reports
+the total and the slowest top-level imports. Exits non-zero when the median
+total is over --budget-ms or when a module that should load lazily was
+imported, so it can gate a build.
+
+    python benchmarks/bench_importtime.py [--runs 5] [--budget-ms 1200] [--top 15]
+"""
+import argparse, os, re, statistics, subprocess, sys, tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed by migration commands or a single job; importing them at
+# startup is a regression.
+LAZY_MODULES = ['alembic', 'flask_migrate', 'dateutil']
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(env):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+                            cwd=BACKEND, env=env, capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1200)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_importtime.db'),
+               PYTHONWARNINGS='ignore')
+    runs = [import_times(env) for _ in range(args.runs)]
+    totals = [sum(self_us for _, _, self_us, _ in run) / 1000 for run in runs]
+    total = statistics.median(totals)
+
+    top_level = sorted((m for m in runs[-1] if m[1] == 0), key=lambda m: m[3], reverse=True)
+    print(f"{'module':<32}{'cumulative ms':>15}")
+    for name, _, _, cumulative_us in top_level[:args.top]:
+        print(f'{name:<32}{cumulative_us / 1000:>15.1f}')
+    print(f'\ntotal import time: {total:.1f} ms (median of {args.runs}, budget {args.budget_ms:.0f} ms)')
+
+    failures = []
+    if total > args.budget_ms:
+        failures.append(f'import time {total:.1f} ms is over the {args.budget_ms:.0f} ms budget')
+    imported = {name.split('.')[0] for name, _, _, _ in runs[-1]}
+    for name in LAZY_MODULES:
+        if name in imported:
+            failures.append(f'{name} is imported at startup but should load lazily')
+    for failure in failures:
+        print('FAIL: ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Rate limiter overhead: bucket operations and per-request cost.
+
+Times MemoryBackend.take() for the user-only and user+group cases across many
+distinct callers, then GET /me through the test client with the limiter hooks
+installed and removed, against a throwaway SQLite database.
+
+    python benchmarks/bench_ratelimit.py [--callers 1000] [--ops 200000] [--requests 2000]
+"""
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def bench_backend(callers, ops):
+    from ratelimit import MemoryBackend
+
+    print(f"{'buckets':>10}{'ns/take':>12}{'takes/s':>14}")
+    for with_group in (False, True):
+        backend = MemoryBackend()
+        keys = [[(f'user:{i}', 10 ** 9, 10 ** 6)] + ([(f'group:{i % 50}', 10 ** 9, 10 ** 6)] if with_group else [])
+                for i in range(callers)]
+        start = time.perf_counter()
+        for i in range(ops):
+            backend.take(keys[i % callers], 1, time.time())
+        elapsed = time.perf_counter() - start
+        print(f"{'user+group' if with_group else 'user':>10}{elapsed / ops * 1e9:>12.0f}{ops / elapsed:>14,.0f}")
+
+
+def bench_requests(requests):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_ratelimit.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from app import create_app
+    from extensions import db
+    from ratelimit import check_limits
+
+    app = create_app({'JWT_VERIFY_SUB': False})
+    limiter = app.extensions['ratelimit']
+    limiter.user_limit = limiter.group_limit = (10 ** 9, 10 ** 6)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    token = client.post('/auth/register', json={'name': 'b', 'email': 'b@bench', 'password': 'p'}).json['access_token']
+    headers = {'Authorization': 'Bearer ' + token}
+
+    def run():
+        for _ in range(100):
+            client.get('/me', headers=headers)
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get('/me', headers=headers)
+        return (time.perf_counter() - start) / requests * 1e6
+
+    hooks = app.before_request_funcs[None]
+    with_limiter = run()
+    hooks.remove(check_limits)
+    without_limiter = run()
+    hooks.append(check_limits)
+
+    print(f"\n{'GET /me':>10}{'us/request':>12}")
+    print(f"{'limited':>10}{with_limiter:>12.1f}")
+    print(f"{'unlimited':>10}{without_limiter:>12.1f}")
+    print(f"{'overhead':>10}{with_limiter - without_limiter:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--callers', type=int, default=1000)
+    parser.add_argument('--ops', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    bench_backend(args.callers, args.ops)
+    bench_requests(args.requests)
+
+
+if __name__ == '__main__':
+    main()
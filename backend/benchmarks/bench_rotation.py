@@ -0,0 +1,79 @@
+"""Chore rotation planning and bulk-write cost at large chore counts.
+
+Times plan_rotation() on synthetic chores, then the full rotate_group() pass
+(one SELECT plus one bulk UPDATE) against a throwaway SQLite database.
+
+    python benchmarks/bench_rotation.py [--chores 1000 10000 100000] [--members 8]
+"""
+import argparse, json, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPEATS = [('daily', None, None), ('weekly', json.dumps(['Monday', 'Thursday']), None),
+           ('monthly', None, None), ('custom', None, 3)]
+
+
+def synthetic_chores(n, rng):
+    chores = []
+    for i in range(n):
+        if rng.random() < 0.7:
+            repeat_type, days, custom = rng.choice(REPEATS)
+            chores.append(('recurring', repeat_type, days, custom))
+        else:
+            chores.append((rng.choice(['one_time', 'as_needed']), None, None, None))
+    return chores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chores', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--members', type=int, default=8)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_rotation.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from app import create_app
+    from extensions import db
+    from models import Chore, Group, User
+    from chore_rotation import chore_weight, plan_rotation, rotate_group
+
+    app = create_app()
+
+    rng = random.Random(42)
+    print(f"{'chores':>8}{'plan ms':>12}{'rotate ms':>12}{'changed':>10}{'load spread':>14}")
+    with app.app_context():
+        db.create_all()
+        for n in args.chores:
+            db.session.query(Chore).delete()
+            db.session.query(User).delete()
+            db.session.query(Group).delete()
+            group = Group(name='bench', invite_code=f'B{n}'[:10])
+            db.session.add(group)
+            db.session.flush()
+            db.session.execute(db.insert(User), [
+                {'name': f'm{i}', 'email': f'm{i}-{n}@bench', 'password_hash': 'x', 'group_id': group.id,
+                 'status': 'away' if i == 0 else 'home'} for i in range(args.members)])
+            chores = synthetic_chores(n, rng)
+            db.session.execute(db.insert(Chore), [
+                {'name': f'c{i}', 'group_id': group.id, 'type': t, 'repeat_type': r,
+                 'recurring_days': d, 'custom_days': c, 'completed': False}
+                for i, (t, r, d, c) in enumerate(chores)])
+            db.session.commit()
+
+            weights = [(i, chore_weight(*c)) for i, c in enumerate(chores)]
+            start = time.perf_counter()
+            plan_rotation(weights, {u: 0.0 for u in range(args.members - 1)})
+            plan_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            result = rotate_group(group.id, None)
+            db.session.commit()
+            rotate_ms = (time.perf_counter() - start) * 1000
+
+            loads = [l['load'] for l in result['loads']]
+            print(f'{n:>8}{plan_ms:>12.1f}{rotate_ms:>12.1f}{result["changed"]:>10}{max(loads) - min(loads):>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
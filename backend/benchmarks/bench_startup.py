@@ -0,0 +1,58 @@
+"""Cold start to first served request, with and without warm-up.
+
+Each run is a fresh interpreter against a prepared SQLite database. It times
+importing and building the app, then the first and second requests (a login
+lookup, which goes through the limiter, the mappers and the pool).
+
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({'WARM_UP': %(warm)r})
+created = time.perf_counter()
+client = app.test_client()
+body = {'email': 'nobody@bench', 'password': 'x'}
+client.post('/auth/login', json=body)
+first = time.perf_counter()
+client.post('/auth/login', json=body)
+second = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create': created - imported,
+                  'first': first - created, 'second': second - first}))
+"""
+
+
+def run_child(warm, env):
+    out = subprocess.run([sys.executable, '-c', CHILD % {'warm': warm}], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_startup.db')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path, PYTHONWARNINGS='ignore')
+    subprocess.run([sys.executable, '-c', 'from app import create_app; from extensions import db\n'
+                    'app = create_app()\nwith app.app_context(): db.create_all()'],
+                   cwd=BACKEND, env=env, check=True)
+
+    print(f"{'warm-up':>8}{'import ms':>11}{'create ms':>11}{'1st req ms':>12}{'2nd req ms':>12}{'to 1st ms':>11}")
+    for warm in (False, True):
+        runs = [run_child(warm, env) for _ in range(args.runs)]
+        median = {k: statistics.median(r[k] for r in runs) * 1000 for k in runs[0]}
+        total = median['import'] + median['create'] + median['first']
+        print(f"{'yes' if warm else 'no':>8}{median['import']:>11.1f}{median['create']:>11.1f}"
+              f"{median['first']:>12.2f}{median['second']:>12.2f}{total:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""Load test: concurrent user journeys against a locally launched server.
+
+Seeds a scratch database with groups of roommates (real password hashes,
+recurring chores, some ledger history), starts the app and runs --users
+virtual users for --seconds. Each virtual user logs in as its own roommate
+and repeats journeys drawn from --mix:
+
+  daily    login, dashboard, complete a chore, add an expense, check balances
+  browse   login, dashboard, balances, settle-up summary
+  chores   login, complete three chores, chore stats
+
+Reports throughput, p50/p95/p99 latency, status counts and error rates per
+route (and per journey) as JSON, to stdout or --output, with a summary
+table on stderr. Any response >= 400 or failed connection is an error.
+
+    python benchmarks/loadtest.py [--users 50] [--seconds 30] [--mix daily=6,browse=3,chores=1]
+        [--groups 20] [--roommates 5] [--server werkzeug|gunicorn] [--workers 4] [--threads 8]
+        [--database-url URL] [--url http://host:port] [--rate-limits] [--output report.json]
+
+With --url the journeys run against an already running server, which must
+be using the database that --database-url seeds.
+"""
+import argparse, json, os, random, subprocess, sys, tempfile, threading, time, urllib.error, urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+PASSWORD = 'loadtest-password'
+CHORES_PER_USER = 3
+EXPENSES_PER_GROUP = 200
+
+WERKZEUG_SERVER = """
+from werkzeug.serving import run_simple
+from wsgi import app
+run_simple('127.0.0.1', %(port)d, app, threaded=True)
+"""
+
+
+# Roommates as (email, group_id, chore_ids), all with PASSWORD.
+def seed(groups, roommates):
+    from app import create_app
+    from extensions import db
+    from models import Chore, Expense, ExpenseSplit, Group, User
+    from werkzeug.security import generate_password_hash
+
+    app = create_app()
+    password_hash = generate_password_hash(PASSWORD)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Group), [{'name': f'load {g}', 'invite_code': f'LT{g:06d}'}
+                                              for g in range(groups)])
+        group_ids = [g.id for g in Group.query.filter(Group.invite_code.like('LT%')).order_by(Group.id)]
+        db.session.execute(db.insert(User), [
+            {'name': f'roommate {g}-{u}', 'email': f'lt{g}-{u}@load.test', 'password_hash': password_hash,
+             'group_id': group_id, 'status': 'home'}
+            for g, group_id in enumerate(group_ids) for u in range(roommates)])
+        users = db.session.query(User.id, User.email, User.group_id).filter(User.email.like('%@load.test')).all()
+        db.session.execute(db.insert(Chore), [
+            {'name': f'chore {c}', 'group_id': group_id, 'assigned_to': user_id, 'created_by': user_id,
+             'type': 'recurring', 'repeat_type': 'daily', 'due_date': now.strftime('%Y-%m-%d'), 'completed': False}
+            for user_id, _, group_id in users for c in range(CHORES_PER_USER)])
+        members = defaultdict(list)
+        for user_id, _, group_id in users:
+            members[group_id].append(user_id)
+        db.session.execute(db.insert(Expense), [
+            {'description': f'seed {i}', 'amount': 30.0, 'group_id': group_id,
+             'paid_by': members[group_id][i % roommates], 'created_at': now - timedelta(days=i % 60)}
+            for group_id in group_ids for i in range(EXPENSES_PER_GROUP)])
+        db.session.execute(db.insert(ExpenseSplit), [
+            {'expense_id': expense_id, 'user_id': user_id, 'amount': 30.0 / roommates}
+            for expense_id, group_id in db.session.query(Expense.id, Expense.group_id)
+            .filter(Expense.description.like('seed %'))
+            for user_id in members[group_id]])
+        db.session.commit()
+
+        chores = defaultdict(list)
+        for chore_id, user_id in db.session.query(Chore.id, Chore.assigned_to) \
+                .filter(Chore.assigned_to.in_([u.id for u in users])):
+            chores[user_id].append(chore_id)
+        return [(email, group_id, chores[user_id]) for user_id, email, group_id in users]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.journeys = defaultdict(lambda: {'count': 0, 'errors': 0, 'latencies': []})
+
+    def request(self, route, status, seconds):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            self.statuses[route][status] += 1
+
+    def journey(self, name, ok, seconds):
+        with self.lock:
+            entry = self.journeys[name]
+            entry['count'] += 1
+            entry['errors'] += 0 if ok else 1
+            entry['latencies'].append(seconds)
+
+
+class JourneyFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, base, recorder, email, group_id, chore_ids, rng):
+        self.base = base
+        self.recorder = recorder
+        self.email = email
+        self.group_id = group_id
+        self.chore_ids = chore_ids
+        self.rng = rng
+        self.token = None
+
+    # `route` is the templated path used as the report key.
+    def call(self, method, route, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                status, payload = resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError:
+            status, payload = 'connection_error', b''
+        self.recorder.request(f'{method} {route}', status, time.perf_counter() - start)
+        if status == 'connection_error' or status >= 400:
+            raise JourneyFailed(f'{method} {path}: {status}')
+        return json.loads(payload) if payload else None
+
+    def login(self):
+        self.token = None
+        self.token = self.call('POST', '/auth/login', '/auth/login',
+                               {'email': self.email, 'password': PASSWORD})['access_token']
+
+    def dashboard(self):
+        g = self.group_id
+        self.call('GET', '/me', '/me')
+        self.call('GET', '/groups/{id}/users', f'/groups/{g}/users')
+        self.call('GET', '/calendar/group/{id}', f'/calendar/group/{g}?limit=20')
+        self.call('GET', '/expenses/me', '/expenses/me')
+
+    def complete_chore(self):
+        chore_id = self.rng.choice(self.chore_ids)
+        self.call('POST', '/chores/{id}/complete', f'/chores/{chore_id}/complete', {})
+
+    def add_expense(self):
+        self.call('POST', '/expense/create', '/expense/create',
+                  {'description': 'groceries', 'amount': round(self.rng.uniform(5, 120), 2),
+                   'group_id': self.group_id})
+
+    def balances(self):
+        self.call('GET', '/expenses/balances/{id}', f'/expenses/balances/{self.group_id}')
+
+    def daily(self):
+        self.login()
+        self.dashboard()
+        self.complete_chore()
+        self.add_expense()
+        self.balances()
+
+    def browse(self):
+        self.login()
+        self.dashboard()
+        self.balances()
+        self.call('GET', '/expenses/summary/{id}', f'/expenses/summary/{self.group_id}')
+
+    def chores(self):
+        self.login()
+        for _ in range(3):
+            self.complete_chore()
+        self.call('GET', '/chores/stats/{id}', f'/chores/stats/{self.group_id}')
+
+
+JOURNEYS = ('daily', 'browse', 'chores')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in JOURNEYS:
+            raise argparse.ArgumentTypeError(f'unknown journey {name!r}; expected one of {", ".join(JOURNEYS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_user(user, mix, deadline, think):
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = user.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            getattr(user, name)()
+            ok = True
+        except JourneyFailed:
+            ok = False
+        user.recorder.journey(name, ok, time.perf_counter() - start)
+        if think:
+            time.sleep(user.rng.uniform(0, 2 * think))
+
+
+# Nearest-rank percentile of sorted samples, in milliseconds.
+def percentile(samples, p):
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, max(0, int(round(p / 100 * len(samples))) - 1))] * 1000, 2)
+
+
+def latency_stats(samples):
+    samples = sorted(samples)
+    return {'p50_ms': percentile(samples, 50), 'p95_ms': percentile(samples, 95),
+            'p99_ms': percentile(samples, 99), 'max_ms': percentile(samples, 100)}
+
+
+def build_report(recorder, elapsed, settings):
+    routes = {}
+    total = errors = 0
+    for route in sorted(recorder.latencies):
+        statuses = recorder.statuses[route]
+        count = sum(statuses.values())
+        failed = sum(n for status, n in statuses.items() if status == 'connection_error' or status >= 400)
+        total += count
+        errors += failed
+        routes[route] = {'count': count, 'throughput_rps': round(count / elapsed, 2), 'errors': failed,
+                         'error_rate': round(failed / count, 4),
+                         'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+                         **latency_stats(recorder.latencies[route])}
+    journeys = {name: {'count': entry['count'], 'errors': entry['errors'],
+                       'error_rate': round(entry['errors'] / entry['count'], 4),
+                       **latency_stats(entry['latencies'])}
+                for name, entry in sorted(recorder.journeys.items())}
+    return {'settings': settings, 'elapsed_s': round(elapsed, 2), 'requests': total,
+            'throughput_rps': round(total / elapsed, 2), 'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'latency': latency_stats([x for samples in recorder.latencies.values() for x in samples]),
+            'routes': routes, 'journeys': journeys}
+
+
+def print_summary(report, out):
+    print(f"{'route':<32}{'count':>8}{'req/s':>9}{'err %':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}", file=out)
+    for route, r in report['routes'].items():
+        print(f"{route:<32}{r['count']:>8}{r['throughput_rps']:>9.1f}{r['error_rate'] * 100:>8.2f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}", file=out)
+    latency = report['latency']
+    print(f"{'total':<32}{report['requests']:>8}{report['throughput_rps']:>9.1f}{report['error_rate'] * 100:>8.2f}"
+          f"{latency['p50_ms'] or 0:>9.1f}{latency['p95_ms'] or 0:>9.1f}{latency['p99_ms'] or 0:>9.1f}", file=out)
+
+
+def start_server(args, env):
+    if args.server == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{args.port}', '--workers', str(args.workers),
+               '--threads', str(args.threads), 'wsgi:app']
+    else:
+        cmd = [sys.executable, '-c', WERKZEUG_SERVER % {'port': args.port}]
+    server = subprocess.Popen(cmd, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{args.port}'
+    for _ in range(300):
+        if server.poll() is not None:
+            raise SystemExit(f'server exited with status {server.returncode}')
+        try:
+            urllib.request.urlopen(base + '/healthz', timeout=1).read()
+            return server, base
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise SystemExit('server did not come up')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='Concurrent virtual users.')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('daily=6,browse=3,chores=1'))
+    parser.add_argument('--think', type=float, default=0.0, help='Mean pause between journeys, seconds.')
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--roommates', type=int, default=5)
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn only.')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn only.')
+    parser.add_argument('--port', type=int, default=5078)
+    parser.add_argument('--database-url', help='Scratch database; default is a temporary SQLite file.')
+    parser.add_argument('--url', help='Use a running server instead of launching one.')
+    parser.add_argument('--rate-limits', action='store_true', help='Keep per-user rate limits on.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+    args = parser.parse_args()
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONWARNINGS='ignore',
+               MAX_CONCURRENT_REQUESTS=os.environ.get('MAX_CONCURRENT_REQUESTS', str(args.users * 2)))
+    if not args.rate_limits:
+        env['RATELIMIT_ENABLED'] = '0'
+    os.environ.update(env)
+    roommates = seed(args.groups, args.roommates)
+
+    server, base = (None, args.url.rstrip('/')) if args.url else start_server(args, env)
+    try:
+        recorder = Recorder()
+        rng = random.Random(args.seed)
+        users = [VirtualUser(base, recorder, *roommates[i % len(roommates)], random.Random(rng.random()))
+                 for i in range(args.users)]
+        start = time.perf_counter()
+        deadline = start + args.seconds
+        threads = [threading.Thread(target=run_user, args=(user, args.mix, deadline, args.think))
+                   for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    settings = {'users': args.users, 'seconds': args.seconds, 'mix': args.mix, 'think': args.think,
+                'groups': args.groups, 'roommates': args.roommates, 'database': database_url.split(':')[0],
+                'server': 'external' if args.url else args.server, 'rate_limits': args.rate_limits}
+    report = build_report(recorder, elapsed, settings)
+    print_summary(report, sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
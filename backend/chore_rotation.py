@@ -0,0 +1,117 @@
+import heapq, json
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, update
+
+from extensions import db
+from models import Chore, ChoreStatsRollup, User
+from chore_stats import period_start
+
+# Members with these statuses are skipped by the rotation.
+UNAVAILABLE_STATUSES = ('away', 'dnd')
+# Weeks of completion history counted towards each member's starting load.
+HISTORY_WEEKS = 4
+# Chores per UPDATE statement.
+WRITE_CHUNK = 10000
+
+
+class RotationError(ValueError):
+    pass
+
+
+# Expected occurrences per week, used as the chore's weight.
+def chore_weight(chore_type, repeat_type=None, recurring_days=None, custom_days=None):
+    if chore_type != 'recurring':
+        return 1.0
+    if repeat_type == 'daily':
+        return 7.0
+    if repeat_type == 'weekly':
+        days = json.loads(recurring_days) if recurring_days else None
+        return float(len(days)) if days else 1.0
+    if repeat_type == 'monthly':
+        return 7 / 30
+    if repeat_type == 'custom':
+        return 7 / custom_days if custom_days else 1.0
+    return 1.0
+
+
+# Assign chores to members, heaviest chore first, always to whoever currently
+# has the least load (longest-processing-time greedy on a min-heap).
+# chores: [(chore_id, weight)]; loads: {user_id: starting load}.
+# Returns ({chore_id: user_id}, {user_id: final load}).
+def plan_rotation(chores, loads):
+    if not loads:
+        raise RotationError('No available members to assign chores to')
+    heap = [(load, user_id) for user_id, load in loads.items()]
+    heapq.heapify(heap)
+    assignments = {}
+    for chore_id, weight in sorted(chores, key=lambda c: (-c[1], c[0])):
+        load, user_id = heap[0]
+        assignments[chore_id] = user_id
+        heapq.heapreplace(heap, (load + weight, user_id))
+    return assignments, {user_id: load for load, user_id in heap}
+
+
+def _starting_loads(group_id):
+    members = db.session.query(User.id).filter(
+        User.group_id == group_id,
+        db.or_(User.status.is_(None), User.status.notin_(UNAVAILABLE_STATUSES))
+    ).all()
+    loads = {m.id: 0.0 for m in members}
+
+    # Recent completions per week carry over, so whoever has been doing more
+    # lately starts the new rotation a little further behind.
+    since = period_start(datetime.utcnow()) - timedelta(weeks=HISTORY_WEEKS - 1)
+    history = db.session.query(ChoreStatsRollup.user_id, db.func.sum(ChoreStatsRollup.completed_count)) \
+        .filter(ChoreStatsRollup.group_id == group_id, ChoreStatsRollup.period_start >= since) \
+        .group_by(ChoreStatsRollup.user_id)
+    for user_id, completed in history:
+        if user_id in loads:
+            loads[user_id] = completed / HISTORY_WEEKS
+    return loads
+
+
+def _write_assignments(changed, user_id):
+    # One UPDATE with a CASE branch per assignee (a handful of members, each
+    # with an IN list) rather than one branch per chore. Ids are chunked to
+    # stay under the driver's bind-parameter limit.
+    items = sorted(changed.items())
+    for i in range(0, len(items), WRITE_CHUNK):
+        by_user = {}
+        for chore_id, assignee in items[i:i + WRITE_CHUNK]:
+            by_user.setdefault(assignee, []).append(chore_id)
+        db.session.execute(
+            update(Chore)
+            .where(Chore.id.in_([chore_id for ids in by_user.values() for chore_id in ids]))
+            .values(assigned_to=case(*[(Chore.id.in_(ids), assignee) for assignee, ids in by_user.items()]),
+                    last_updated_by=user_id, version=Chore.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+# Rebalance every open chore in the group. With dry_run the plan is returned
+# without writing anything; otherwise every changed assignment is written in
+# a single bulk UPDATE (the caller commits).
+def rotate_group(group_id, user_id, dry_run=False):
+    chores = db.session.query(
+        Chore.id, Chore.assigned_to, Chore.type, Chore.repeat_type, Chore.recurring_days, Chore.custom_days
+    ).filter(Chore.group_id == group_id, Chore.completed.isnot(True)).all()
+
+    assignments, loads = plan_rotation(
+        [(c.id, chore_weight(c.type, c.repeat_type, c.recurring_days, c.custom_days)) for c in chores],
+        _starting_loads(group_id)
+    )
+    current = {c.id: c.assigned_to for c in chores}
+    changed = {chore_id: assignee for chore_id, assignee in assignments.items() if current[chore_id] != assignee}
+
+    if changed and not dry_run:
+        _write_assignments(changed, user_id)
+
+    return {
+        'group_id': group_id,
+        'dry_run': dry_run,
+        'assignments': [{'chore_id': chore_id, 'assigned_to': assignee, 'previous': current[chore_id]}
+                        for chore_id, assignee in sorted(assignments.items())],
+        'changed': len(changed),
+        'loads': [{'user_id': uid, 'load': round(load, 2)} for uid, load in sorted(loads.items())],
+    }
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import ChoreCompletion, ChoreStatsRollup, User
+
+MAX_WEEKS = 104
+
+
+def period_start(moment):
+    day = moment.date() if isinstance(moment, datetime) else moment
+    return day - timedelta(days=day.weekday())
+
+
+def is_on_time(due_date, completed_at):
+    return not due_date or completed_at.strftime('%Y-%m-%d') <= due_date
+
+
+def _upsert(values, increments):
+    # INSERT ... ON CONFLICT DO UPDATE keeps concurrent completions from racing
+    # on the first completion of a week.
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(ChoreStatsRollup).values(**values, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['group_id', 'user_id', 'period_start'],
+        set_={k: getattr(ChoreStatsRollup, k) + getattr(stmt.excluded, k) for k in increments}
+    )
+    db.session.execute(stmt)
+
+
+# Record a completion and bump the user's weekly rollup in the caller's
+# transaction.
+def record_completion(chore, user_id, completed_at, due_date):
+    return record_completions([(chore, user_id, completed_at, due_date)])[0]
+
+
+# Batch form of record_completion: one multi-row INSERT for the completions
+# and one rollup upsert per (group, user, week) touched. Items are
+# (chore, user_id, completed_at, due_date); returns the on_time flags in order.
+def record_completions(items):
+    rows = []
+    rollup = {}
+    for chore, user_id, completed_at, due_date in items:
+        on_time = is_on_time(due_date, completed_at)
+        rows.append({'chore_id': chore.id, 'group_id': chore.group_id, 'user_id': user_id,
+                     'due_date': due_date, 'completed_at': completed_at, 'on_time': on_time})
+        counts = rollup.setdefault((chore.group_id, user_id, period_start(completed_at)), [0, 0])
+        counts[0] += 1
+        counts[1] += 1 if on_time else 0
+    if not rows:
+        return []
+
+    db.session.execute(insert(ChoreCompletion), rows)
+    for (group_id, user_id, start), (completed, on_time) in rollup.items():
+        _upsert({'group_id': group_id, 'user_id': user_id, 'period_start': start},
+                {'completed_count': completed, 'on_time_count': on_time})
+    return [row['on_time'] for row in rows]
+
+
+# Per-user totals and per-week counts for the last `weeks` weeks, read only
+# from the rollup.
+def group_stats(group_id, weeks):
+    since = period_start(datetime.utcnow()) - timedelta(weeks=weeks - 1)
+    rows = db.session.query(
+        ChoreStatsRollup.user_id, User.name, ChoreStatsRollup.period_start,
+        ChoreStatsRollup.completed_count, ChoreStatsRollup.on_time_count
+    ).join(User, User.id == ChoreStatsRollup.user_id) \
+        .filter(ChoreStatsRollup.group_id == group_id, ChoreStatsRollup.period_start >= since) \
+        .order_by(ChoreStatsRollup.period_start, ChoreStatsRollup.user_id).all()
+
+    users = {}
+    periods = []
+    for user_id, name, start, completed, on_time in rows:
+        totals = users.setdefault(user_id, {'user_id': user_id, 'name': name, 'completed': 0, 'on_time': 0})
+        totals['completed'] += completed
+        totals['on_time'] += on_time
+        periods.append({'period_start': start.isoformat(), 'user_id': user_id,
+                        'completed': completed, 'on_time': on_time})
+
+    group_total = sum(u['completed'] for u in users.values())
+    for totals in users.values():
+        totals['on_time_rate'] = round(totals['on_time'] / totals['completed'], 3) if totals['completed'] else None
+        # Fraction of the group's completed chores done by this user.
+        totals['share'] = round(totals['completed'] / group_total, 3) if group_total else None
+
+    return {
+        'group_id': group_id,
+        'period': 'week',
+        'since': since.isoformat(),
+        'users': sorted(users.values(), key=lambda u: -u['completed']),
+        'periods': periods,
+    }
@@ -0,0 +1,106 @@
+import gzip, hashlib, threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, clients fall back to JSON
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+COMPRESSIBLE_MIMETYPES = {'application/json', MSGPACK_MIMETYPE, 'text/csv', 'application/x-ndjson'}
+# Small bodies don't shrink enough to be worth the CPU or the extra header.
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CACHE_ENTRIES = 256
+
+
+class CompressionCache:
+    # LRU of compressed bodies keyed by a digest of the uncompressed body, so a
+    # payload that hasn't changed since the last request (the same roster or
+    # history polled by every roommate) is only compressed once. Hashing is far
+    # cheaper than either codec.
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+cache = CompressionCache()
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def choose_encoding(accept_encoding):
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def wants_msgpack():
+    if msgpack is None:
+        return False
+    accept = request.accept_mimetypes
+    return accept[MSGPACK_MIMETYPE] > accept['application/json']
+
+
+def msgpack_body(obj, default):
+    return msgpack.packb(obj, default=default, use_bin_type=True)
+
+
+def compress_response(response):
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if 'Content-Encoding' in response.headers or response.status_code < 200 or response.status_code == 204:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = compress(body, encoding)
+        cache.put(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,65 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+
+# Never echoed back in a conflict response.
+HIDDEN_COLUMNS = {'password_hash'}
+
+
+# Raised when a versioned row changed under us; the app turns it into a 409
+# carrying the rows' current state so the client can retry against it.
+class VersionConflict(Exception):
+    def __init__(self, instances):
+        super().__init__('This record was changed by someone else; reload and retry')
+        self.instances = instances
+
+    def current(self):
+        states = [row_state(i) for i in self.instances]
+        return states[0] if len(states) == 1 else states
+
+
+def row_state(instance):
+    if instance is None:
+        return None
+    return {attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs
+            if attr.key not in HIDDEN_COLUMNS}
+
+
+# Reject the write up front when the client says which version it read
+# (`version` in the body) and that is no longer current.
+def expect_version(instance, data):
+    expected = (data or {}).get('version')
+    if expected is not None and expected != instance.version:
+        raise VersionConflict([instance])
+
+
+def _conflict(keys):
+    db.session.rollback()
+    return VersionConflict([db.session.get(model, identity, populate_existing=True) for model, identity in keys])
+
+
+def _keys(instances):
+    return [(type(i), inspect(i).identity) for i in instances]
+
+
+# Commit, turning a lost compare-and-swap on any versioned row into a
+# VersionConflict with the freshly loaded state of `instances`.
+def commit_or_conflict(*instances):
+    keys = _keys(instances)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        raise _conflict(keys)
+
+
+# Flush the versioned rows now, with the same conflict handling. Call it
+# before executing other statements in the transaction (rollup upserts,
+# event inserts): their autoflush would otherwise run the compare-and-swap
+# outside commit_or_conflict.
+def flush_or_conflict(*instances):
+    keys = _keys(instances)
+    try:
+        db.session.flush()
+    except StaleDataError:
+        raise _conflict(keys)
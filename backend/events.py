@@ -0,0 +1,40 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from extensions import db
+from models import Event
+
+
+def _encode(payload):
+    return json.dumps(payload, default=str, separators=(',', ':'))
+
+
+# Append an event to the log. It is only added to the session, so it commits
+# (or rolls back) together with the change it describes.
+def record_event(event_type, group_id=None, user_id=None, entity_id=None, **payload):
+    event = Event(type=event_type, group_id=group_id, user_id=user_id, entity_id=entity_id,
+                  payload=_encode(payload), created_at=datetime.utcnow())
+    db.session.add(event)
+    return event
+
+
+# Append many events with one multi-row INSERT. Each item is a dict with
+# 'type' and optional 'group_id', 'user_id', 'entity_id' and 'payload'.
+def record_events(events):
+    if not events:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(Event), [{
+        'type': e['type'],
+        'group_id': e.get('group_id'),
+        'user_id': e.get('user_id'),
+        'entity_id': e.get('entity_id'),
+        'payload': _encode(e.get('payload', {})),
+        'created_at': now,
+    } for e in events])
+
+
+def event_payload(event):
+    return json.loads(event.payload) if event.payload else {}
@@ -0,0 +1,304 @@
+import csv, io, json
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert
+
+from extensions import db
+from models import Expense, ExpenseSplit, Payment, User
+from events import record_events
+from splits import SplitError, allocate_equal, split_rows, settle_payment, to_cents
+
+# Rows are buffered and flushed to the database in chunks of this size, so an
+# import holds at most one chunk in memory no matter how large the file is.
+CHUNK_SIZE = 500
+# Only the first MAX_REPORTED_ERRORS row errors are returned in full; the rest
+# are just counted.
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+# The stream can't be read any further; rows already flushed stay imported.
+class ImportAborted(ValueError):
+    pass
+
+
+# Undecodable bytes are let through as lone surrogates (surrogateescape) so
+# the stream keeps going, and the row they end up in is reported as an error.
+def _undecodable(values):
+    for value in values:
+        if isinstance(value, list):
+            if _undecodable(value):
+                return True
+        elif isinstance(value, str):
+            try:
+                value.encode('utf-8')
+            except UnicodeEncodeError:
+                return True
+    return False
+
+
+# Stream (line_no, row_dict) pairs out of a CSV or NDJSON byte stream. A line
+# that can't be decoded or parsed comes out as (line_no, RowError).
+def iter_rows(stream, fmt):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        try:
+            fieldnames = reader.fieldnames
+        except csv.Error as e:
+            raise ImportAborted(f'Malformed CSV header on line {reader.reader.line_num}: {e}')
+        if _undecodable(fieldnames or []):
+            raise ImportAborted('CSV header is not valid UTF-8')
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # DictReader.line_num only moves on rows that parse.
+                yield reader.reader.line_num, RowError(f'Malformed CSV: {e}')
+                continue
+            if _undecodable(row.values()):
+                yield reader.line_num, RowError('Invalid UTF-8')
+                continue
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            if _undecodable([line]):
+                yield line_no, RowError('Invalid UTF-8')
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, RowError('Invalid JSON')
+                continue
+            yield line_no, row
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+# Guess the upload format from an explicit name, a content type or a filename.
+def detect_format(fmt=None, content_type=None, filename=None):
+    if fmt:
+        return fmt.lower()
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type or (filename or '').lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+class Roster:
+    # The group's members, loaded once per import and used to validate every
+    # row, plus the group's expenses that payment rows have referenced so far.
+    def __init__(self, group_id):
+        self.group_id = group_id
+        self.expense_ids = set()
+        users = db.session.query(User.id, User.email).filter(User.group_id == group_id).order_by(User.id).all()
+        self.ids = [u.id for u in users]
+        self.by_email = {u.email.lower(): u.id for u in users}
+
+    def resolve(self, value, field):
+        if value is None or value == '':
+            raise RowError(f'{field} is required')
+        if isinstance(value, int) or str(value).strip().isdigit():
+            user_id = int(value)
+            if user_id in self.ids:
+                return user_id
+        else:
+            user_id = self.by_email.get(str(value).strip().lower())
+            if user_id is not None:
+                return user_id
+        raise RowError(f'{field} {value!r} is not a member of this group')
+
+    # A payment's expense_id must name an expense of this group, already in
+    # the database (including ones committed by earlier chunks of the import).
+    def resolve_expense(self, value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, bool) or not (isinstance(value, int) or str(value).strip().isdigit()):
+            raise RowError('expense_id must be an integer')
+        expense_id = int(value)
+        if expense_id not in self.expense_ids:
+            found = db.session.query(Expense.id).filter(
+                Expense.id == expense_id, Expense.group_id == self.group_id).first()
+            if found is None:
+                raise RowError(f'expense_id {expense_id} is not an expense of this group')
+            self.expense_ids.add(expense_id)
+        return expense_id
+
+
+def _amount(value, field='amount', allow_zero=False):
+    try:
+        amount = round(float(value), 2)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} must be a number')
+    if amount < 0 or (amount == 0 and not allow_zero):
+        raise RowError(f'{field} must be positive')
+    return amount
+
+
+def _timestamp(value):
+    if not value:
+        return datetime.utcnow()
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise RowError('created_at must be an ISO 8601 timestamp')
+
+
+# CSV carries custom splits as "user:amount;user:amount", NDJSON as a list of
+# {"user_id": ..., "amount": ...} objects.
+def _parse_splits(value):
+    if isinstance(value, list):
+        return [(s.get('user_id'), s.get('amount')) for s in value]
+    pairs = []
+    for part in str(value).split(';'):
+        if not part.strip():
+            continue
+        user, _, amount = part.partition(':')
+        pairs.append((user.strip(), amount.strip()))
+    return pairs
+
+
+def _build_expense(row, roster, group_id):
+    amount = _amount(row.get('amount'))
+    description = (row.get('description') or '').strip()
+    if not description:
+        raise RowError('description is required')
+
+    total_cents = to_cents(amount)
+    split_type = (row.get('split_type') or 'equal').lower()
+    if split_type == 'equal':
+        splits = allocate_equal(total_cents, roster.ids)
+    elif split_type == 'custom':
+        splits = [(roster.resolve(u, 'split user'), to_cents(_amount(a, 'split amount', allow_zero=True)))
+                  for u, a in _parse_splits(row.get('splits') or '')]
+        if not splits:
+            raise RowError('Custom splits must list user and amount')
+        if sum(cents for _, cents in splits) != total_cents:
+            raise RowError('Split amounts must equal total amount')
+    else:
+        raise RowError('Invalid split_type')
+
+    expense = {
+        'description': description[:100],
+        'amount': amount,
+        'group_id': group_id,
+        'paid_by': roster.resolve(row.get('paid_by'), 'paid_by'),
+        'created_at': _timestamp(row.get('created_at')),
+    }
+    return expense, splits
+
+
+def _build_payment(row, roster, group_id):
+    return {
+        'expense_id': roster.resolve_expense(row.get('expense_id')),
+        'from_user': roster.resolve(row.get('from_user'), 'from_user'),
+        'to_user': roster.resolve(row.get('to_user'), 'to_user'),
+        'group_id': group_id,
+        'amount': _amount(row.get('amount')),
+        'created_at': _timestamp(row.get('created_at')),
+    }
+
+
+def _flush(expenses, payments, user_id=None):
+    events = []
+    if expenses:
+        # One multi-row INSERT for the expenses, returning ids in input order so
+        # the splits can be attached without a round-trip per expense.
+        ids = db.session.scalars(
+            insert(Expense).returning(Expense.id, sort_by_parameter_order=True),
+            [e for e, _ in expenses]
+        ).all()
+        db.session.execute(insert(ExpenseSplit), [
+            row
+            for expense_id, (expense, splits) in zip(ids, expenses)
+            for row in split_rows(expense_id, expense['paid_by'], splits)
+        ])
+        events.extend({
+            'type': 'expense.created', 'group_id': expense['group_id'], 'user_id': user_id,
+            'entity_id': expense_id,
+            'payload': {'description': expense['description'], 'paid_by': expense['paid_by'],
+                        'amount_cents': to_cents(expense['amount']), 'splits': splits,
+                        'is_recurring': False, 'imported': True},
+        } for expense_id, (expense, splits) in zip(ids, expenses))
+    if payments:
+        ids = db.session.scalars(
+            insert(Payment).returning(Payment.id, sort_by_parameter_order=True), payments
+        ).all()
+        for p in payments:
+            settle_payment(p['from_user'], p['to_user'], p['group_id'], to_cents(p['amount']), p['expense_id'])
+        events.extend({
+            'type': 'payment.recorded', 'group_id': p['group_id'], 'user_id': user_id, 'entity_id': payment_id,
+            'payload': {'from_user': p['from_user'], 'to_user': p['to_user'],
+                        'amount_cents': to_cents(p['amount']), 'expense_id': p['expense_id'], 'imported': True},
+        } for payment_id, p in zip(ids, payments))
+    record_events(events)
+    db.session.commit()
+
+
+def import_ledger(stream, group_id, fmt, user_id=None):
+    roster = Roster(group_id)
+    result = {'imported_expenses': 0, 'imported_payments': 0, 'error_count': 0, 'errors': []}
+    expenses, payments = [], []
+
+    try:
+        for line_no, row in iter_rows(stream, fmt):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                if not isinstance(row, dict):
+                    raise RowError('Row must be an object')
+                kind = (row.get('type') or 'expense').lower()
+                if kind == 'expense':
+                    expenses.append(_build_expense(row, roster, group_id))
+                elif kind == 'payment':
+                    payments.append(_build_payment(row, roster, group_id))
+                else:
+                    raise RowError(f'Unknown row type {kind!r}')
+            except (RowError, SplitError, ValueError) as e:
+                result['error_count'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append({'line': line_no, 'error': str(e)})
+                continue
+
+            if len(expenses) + len(payments) >= CHUNK_SIZE:
+                _flush(expenses, payments, user_id)
+                result['imported_expenses'] += len(expenses)
+                result['imported_payments'] += len(payments)
+                expenses, payments = [], []
+    except ImportAborted as e:
+        result['aborted'] = str(e)
+
+    _flush(expenses, payments, user_id)
+    result['imported_expenses'] += len(expenses)
+    result['imported_payments'] += len(payments)
+    return result
+
+
+@click.command('import-expenses')
+@click.argument('group_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format (defaults to the file extension).')
+@with_appcontext
+def import_expenses_command(group_id, path, fmt):
+    """Import expenses and payments for GROUP_ID from a CSV or NDJSON file."""
+    with open(path, 'rb') as f:
+        result = import_ledger(f, group_id, detect_format(fmt, filename=path))
+
+    click.echo(f"Imported {result['imported_expenses']} expenses and "
+               f"{result['imported_payments']} payments")
+    for err in result['errors']:
+        click.echo(f"line {err['line']}: {err['error']}", err=True)
+    if result['error_count'] > len(result['errors']):
+        click.echo(f"... and {result['error_count'] - len(result['errors'])} more errors", err=True)
+    if 'aborted' in result:
+        raise click.ClickException(f"Import stopped: {result['aborted']}")
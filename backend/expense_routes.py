@@ -1,13 +1,29 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extensions import db
-from models import Expense, ExpenseSplit, Payment, User, Group, InventoryItem
-from datetime import datetime
-from sqlalchemy import func
+from models import Expense, ExpenseSplit, Payment, User, InventoryItem, ArchivedExpense, ArchivedExpenseSplit, Job
+from datetime import datetime, timedelta
+from expense_import import import_ledger, detect_format
+from ledger import group_balances, archived_user_totals
+from events import record_event
+from splits import SplitError, compute_splits, insert_splits, settle_payment, to_cents, from_cents
+from pagination import keyset_page, paged_response
+from serializers import (MY_INVENTORY_FIELDS, GROUP_INVENTORY_FIELDS, parse_bool, requested_fields, select_columns,
+                         serialize_rows)
+from ledger_export import iter_ledger, negotiate_format, ENCODERS, EXPORT_MIMETYPES
+from jobs import enqueue, job_state
+from inventory_search import search_query
+from inventory_rollups import ThresholdError, group_rollups, item_state, record_inventory_change, set_threshold
+from concurrency import commit_or_conflict, expect_version, flush_or_conflict
 
 
 expense_routes = Blueprint('expense_routes', __name__)
 
+def record_expense_created(expense, splits, user_id, **extra):
+    record_event('expense.created', group_id=expense.group_id, user_id=user_id, entity_id=expense.id,
+                 description=expense.description, paid_by=expense.paid_by, amount_cents=to_cents(expense.amount),
+                 splits=splits, is_recurring=bool(expense.is_recurring), **extra)
+
 @expense_routes.route('/expense/create', methods=['POST'])
 @jwt_required()
 def create_expense():
@@ -19,6 +35,12 @@ def create_expense():
         if field not in data:
             return jsonify({'error': f'{field} is required'}), 400
         
+    try:
+        splits = compute_splits(data['group_id'], to_cents(data['amount']),
+                                data.get('split_type', 'equal'), data.get('splits'))
+    except SplitError as e:
+        return jsonify({'error': str(e)}), 400
+
     expense = Expense(
         description=data['description'],
         amount = data['amount'],
@@ -28,65 +50,40 @@ def create_expense():
     )
     db.session.add(expense)
     db.session.flush()
-    
-    split_type = data.get('split_type', 'equal')  # 'equal' or 'custom'
-    splits_data = data.get('splits')  # For custom: list of {'user_id': ..., 'amount': ...}
-
-    if split_type == 'equal':
-        users = User.query.filter_by(group_id=data['group_id']).all()
-        if not users:
-            return jsonify({'error': 'No users in group to split with'}), 400
-        
-        split_amount = round(data['amount'] / len(users), 2)
-
-        for user in users:
-            split = ExpenseSplit(
-                expense_id=expense.id,
-                user_id=user.id,
-                amount=split_amount
-            )
-            db.session.add(split)
+    insert_splits(expense.id, current_user_id, splits)
+    record_expense_created(expense, splits, current_user_id)
 
-    elif split_type == 'custom':
-        if not splits_data or not isinstance(splits_data, list):
-            return jsonify({'error': 'Custom splits must be a list of user_id and amount'}), 400
-
-        total_split = sum([s['amount'] for s in splits_data])
-        if round(total_split, 2) != round(data['amount'], 2):
-            return jsonify({'error': 'Split amounts must equal total amount'}), 400
-
-        for s in splits_data:
-            split = ExpenseSplit(
-                expense_id=expense.id,
-                user_id=s['user_id'],
-                amount=s['amount']
-            )
-            db.session.add(split)
+    db.session.commit()
+    return jsonify({'message': 'Expense created with splits', 'expense_id': expense.id}), 201
 
+@expense_routes.route('/expenses/import/<int:group_id>', methods=['POST'])
+@jwt_required()
+def import_expenses(group_id):
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    if not user or user.group_id != group_id:
+        return jsonify({'error': 'Not a member of this group'}), 403
+
+    # Accept either a multipart upload ("file") or the raw request body.
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        fmt = detect_format(request.args.get('format'), upload.content_type, upload.filename)
     else:
-        return jsonify({'error': 'Invalid split_type'}), 400
+        stream = request.stream
+        fmt = detect_format(request.args.get('format'), request.content_type)
 
-    db.session.commit()
-    return jsonify({'message': 'Expense created with splits', 'expense_id': expense.id}), 201
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    result = import_ledger(stream, group_id, fmt, current_user_id)
+    return jsonify(result), 400 if 'aborted' in result else 200
 
 @expense_routes.route('/expenses/balances/<int:group_id>', methods=['GET'])
 @jwt_required()
 def get_balances(group_id):
     users = User.query.filter_by(group_id=group_id).all()
-    balances = {user.id: 0 for user in users}
-
-    expenses = Expense.query.filter_by(group_id=group_id).all()
-    for exp in expenses:
-        paid_by = exp.paid_by
-        splits = ExpenseSplit.query.filter_by(expense_id=exp.id).all()
-        for split in splits:
-            balances[split.user_id] -= split.amount
-        balances[paid_by] += exp.amount
-
-    payments = Payment.query.filter_by(group_id=group_id).all()
-    for pay in payments:
-        balances[pay.from_user] += pay.amount
-        balances[pay.to_user] -= pay.amount
+    balances = group_balances(group_id)
 
     # convert to a list with user info
     result = []
@@ -94,7 +91,7 @@ def get_balances(group_id):
         result.append({
             'user_id': user.id,
             'name': user.name,
-            'balance': round(balances[user.id], 2)
+            'balance': from_cents(balances.get(user.id, 0))
         })
     return jsonify(result)
 
@@ -112,8 +109,15 @@ def record_payment():
 
     from_user = get_jwt_identity()
 
+    try:
+        cents = to_cents(data['amount'])
+    except SplitError as e:
+        return jsonify({'error': str(e)}), 400
+    if cents <= 0:
+        return jsonify({'error': 'amount must be positive'}), 400
+
     payment = Payment(
-        expense_id = data['expense_id'],
+        expense_id = data.get('expense_id'),
         from_user=from_user,
         to_user=data['to_user'],
         amount=data['amount'],
@@ -121,54 +125,106 @@ def record_payment():
         created_at=datetime.utcnow()
     )
     db.session.add(payment)
+    db.session.flush()
+    record_event('payment.recorded', group_id=payment.group_id, user_id=from_user, entity_id=payment.id,
+                 from_user=from_user, to_user=payment.to_user, amount_cents=cents, expense_id=payment.expense_id)
+    unallocated = settle_payment(from_user, data['to_user'], data['group_id'], cents, data.get('expense_id'))
     db.session.commit()
-    return jsonify({'message': 'Payment recorded'}), 201
+    return jsonify({'message': 'Payment recorded', 'unallocated': from_cents(unallocated)}), 201
 
 
 @expense_routes.route('/expenses/history/<int:group_id>')
 @jwt_required()
 def expense_history(group_id):
     current_user = get_jwt_identity()
-    expenses = Expense.query.filter_by(group_id=group_id).order_by(Expense.created_at.desc()).all()
-    results = []
-
-    for e in expenses:
-        payer = User.query.get(e.paid_by)
-        splits = ExpenseSplit.query.filter_by(expense_id=e.id).all()
-
-        owes = []
-        for s in splits:
-            if s.user_id == e.paid_by:
-                continue
-
-            # how much has already been paid back on this split?
-            paid_back = db.session.query(func.coalesce(func.sum(Payment.amount),0)) \
-                .filter_by(
-                  expense_id=e.id,
-                  from_user=s.user_id,
-                  to_user=payer.id
-                ).scalar()
-
-            remaining = round(s.amount - paid_back, 2)
-            if remaining > 0:
-                debtor = User.query.get(s.user_id)
-                owes.append({
-                  "from": {"user_id": debtor.id, "name": debtor.name},
-                  "to":   {"user_id": payer.id,  "name": payer.name},
-                  "amount": remaining
-                })
-
-        if owes:
-            results.append({
-              'expense_id':   e.id,
-              'description':  e.description,
-              'total_amount': e.amount,
-              'paid_by':      {"user_id": payer.id, "name": payer.name},
-              'created_at':   e.created_at.isoformat(),
-              'owes': owes
-            })
+    if request.args.get('archived'):
+        return archived_history(group_id)
+
+    # Only expenses with something still owed on them, read straight off the
+    # maintained outstanding_cents instead of re-summing payments.
+    open_expenses = Expense.query.filter(
+        Expense.group_id == group_id,
+        Expense.splits.any(ExpenseSplit.outstanding_cents > 0)
+    )
+    expenses, next_cursor = keyset_page(open_expenses, Expense.created_at, Expense.id, descending=True)
+
+    Payer = db.aliased(User)
+    open_splits = db.session.query(
+        ExpenseSplit.expense_id, ExpenseSplit.outstanding_cents, User.id, User.name, Payer.id, Payer.name
+    ).join(User, User.id == ExpenseSplit.user_id) \
+        .join(Expense, Expense.id == ExpenseSplit.expense_id) \
+        .join(Payer, Payer.id == Expense.paid_by) \
+        .filter(ExpenseSplit.expense_id.in_([e.id for e in expenses]),
+                ExpenseSplit.outstanding_cents > 0) \
+        .order_by(ExpenseSplit.id).all()
+
+    owes_by_expense = {}
+    payers = {}
+    for expense_id, outstanding, debtor_id, debtor_name, payer_id, payer_name in open_splits:
+        payers[expense_id] = {"user_id": payer_id, "name": payer_name}
+        owes_by_expense.setdefault(expense_id, []).append({
+          "from": {"user_id": debtor_id, "name": debtor_name},
+          "to":   payers[expense_id],
+          "amount": from_cents(outstanding)
+        })
 
-    return jsonify(results)
+    results = [{
+      'expense_id':   e.id,
+      'description':  e.description,
+      'total_amount': e.amount,
+      'paid_by':      payers[e.id],
+      'created_at':   e.created_at.isoformat(),
+      'owes': owes_by_expense[e.id]
+    } for e in expenses if e.id in owes_by_expense]
+
+    return paged_response(results, next_cursor)
+
+# Settled expenses that compaction moved to the archive tables, newest first,
+# with the split each member paid.
+def archived_history(group_id):
+    expenses, next_cursor = keyset_page(
+        ArchivedExpense.query.filter_by(group_id=group_id),
+        ArchivedExpense.created_at, ArchivedExpense.id, descending=True
+    )
+    splits = db.session.query(ArchivedExpenseSplit.expense_id, ArchivedExpenseSplit.amount, User.id, User.name) \
+        .join(User, User.id == ArchivedExpenseSplit.user_id) \
+        .filter(ArchivedExpenseSplit.expense_id.in_([e.id for e in expenses])) \
+        .order_by(ArchivedExpenseSplit.id).all()
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_({e.paid_by for e in expenses})))
+
+    splits_by_expense = {}
+    for expense_id, amount, user_id, name in splits:
+        splits_by_expense.setdefault(expense_id, []).append(
+            {"user_id": user_id, "name": name, "amount": amount})
+
+    return paged_response([{
+        'expense_id':   e.id,
+        'description':  e.description,
+        'total_amount': e.amount,
+        'paid_by':      {"user_id": e.paid_by, "name": names.get(e.paid_by)},
+        'created_at':   e.created_at.isoformat() if e.created_at else None,
+        'archived_at':  e.archived_at.isoformat() if e.archived_at else None,
+        'splits':       splits_by_expense.get(e.id, []),
+        'owes':         []
+    } for e in expenses], next_cursor)
+
+@expense_routes.route('/expenses/export/<int:group_id>', methods=['GET'])
+@jwt_required()
+def export_ledger(group_id):
+    user = User.query.get(get_jwt_identity())
+    if not user or user.group_id != group_id:
+        return jsonify({'error': 'Not a member of this group'}), 403
+
+    fmt = negotiate_format(request)
+    if fmt is None:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    body = ENCODERS[fmt](iter_ledger(group_id))
+    return Response(
+        stream_with_context(body),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=ledger-{group_id}.{fmt}'}
+    )
 
 @expense_routes.route('/expenses/me', methods=['GET'])
 @jwt_required()
@@ -226,6 +282,14 @@ def my_expense_history():
     paid_back = sum([p.amount for p in payments_made])
     received = sum([p.amount for p in payments_received])
 
+    # Settled history moved to the archive still counts towards the totals.
+    archived = archived_user_totals(current_user_id)
+    paid += archived['paid']
+    owed += archived['owed']
+    owed_by += archived['owed_by']
+    paid_back += archived['paid_back']
+    received += archived['received']
+
     return jsonify({
         'user_id': current_user_id,
         'name': user.name,
@@ -246,20 +310,9 @@ def my_expense_history():
 def group_summary(group_id):
     users = User.query.filter_by(group_id=group_id).all()
     user_map = {u.id: u.name for u in users}
-    balances = {u.id: 0 for u in users}
-
-    # Compute net balance
-    expenses = Expense.query.filter_by(group_id=group_id).all()
-    for exp in expenses:
-        splits = ExpenseSplit.query.filter_by(expense_id=exp.id).all()
-        for s in splits:
-            balances[s.user_id] -= s.amount
-        balances[exp.paid_by] += exp.amount
-
-    payments = Payment.query.filter_by(group_id=group_id).all()
-    for p in payments:
-        balances[p.from_user] += p.amount
-        balances[p.to_user] -= p.amount
+    ledger = group_balances(group_id)
+    # Settle in integer cents so the matching below terminates exactly.
+    balances = {u.id: ledger.get(u.id, 0) for u in users}
 
     # Minimize cash flow
     creditors = [(uid, bal) for uid, bal in balances.items() if bal > 0]
@@ -275,7 +328,7 @@ def group_summary(group_id):
         summary.append({
             'from': {'user_id': debtor_id, 'name': user_map[debtor_id]},
             'to': {'user_id': creditor_id, 'name': user_map[creditor_id]},
-            'amount': round(paid, 2)
+            'amount': from_cents(paid)
         })
 
         debtors[i] = (debtor_id, debt - paid)
@@ -285,6 +338,9 @@ def group_summary(group_id):
 
     return jsonify(summary)
 
+def _valid_quantity(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
 @expense_routes.route('/inventory/add', methods=['POST'])
 @jwt_required()
 def inventory_add():
@@ -295,7 +351,9 @@ def inventory_add():
     for field in required_fields:
         if field not in data:
             return jsonify({'error': f'{field} is required'}), 400
-        
+    if not _valid_quantity(data.get('quantity', 1)):
+        return jsonify({'error': 'quantity must be a non-negative integer'}), 400
+
     item = InventoryItem(
         name = data['name'],
         owner_id = owner_id,
@@ -309,6 +367,10 @@ def inventory_add():
     )
 
     db.session.add(item)
+    db.session.flush()
+    record_inventory_change(None, item_state(item), owner_id)
+    record_event('inventory.added', group_id=item.group_id, user_id=owner_id, entity_id=item.id,
+                 name=item.name, category=item.category, quantity=item.quantity, is_shared=item.is_shared)
     db.session.commit()
 
     return jsonify({'message': 'Item added to inventory', 'item_id': item.id}), 201
@@ -318,40 +380,147 @@ def inventory_add():
 @jwt_required()
 def get_my_inventory():
     current_user_id = get_jwt_identity()
-    items = InventoryItem.query.filter_by(owner_id=current_user_id).all()
+    fields = requested_fields(MY_INVENTORY_FIELDS)
+    query = db.session.query(
+        *select_columns(MY_INVENTORY_FIELDS, fields, extra=[InventoryItem.created_at, InventoryItem.id])
+    ).filter(InventoryItem.owner_id == current_user_id)
+    items, next_cursor = keyset_page(query, InventoryItem.created_at, InventoryItem.id)
 
-    results = [{
-        "id": item.id,
-        "name": item.name,
-        "quantity": item.quantity,
-        "category": item.category,
-        "custom_type": item.custom_type,
-        "is_shared": item.is_shared,
-        "notes": item.notes,
-        "created_at": item.created_at.isoformat()
-    } for item in items]
-
-    return jsonify(results), 200
+    return paged_response(serialize_rows(items, MY_INVENTORY_FIELDS, fields), next_cursor)
 
 @expense_routes.route('/inventory/group/<int:group_id>', methods=['GET'])
 @jwt_required()
 def get_group_inventory(group_id):
-    items = InventoryItem.query.filter_by(group_id=group_id).all()
+    fields = requested_fields(GROUP_INVENTORY_FIELDS)
+    # Owner names come from the same query instead of one lookup per item.
+    query = db.session.query(
+        *select_columns(GROUP_INVENTORY_FIELDS, fields, extra=[InventoryItem.created_at, InventoryItem.id])
+    ).select_from(InventoryItem).join(User, User.id == InventoryItem.owner_id) \
+        .filter(InventoryItem.group_id == group_id)
+    items, next_cursor = keyset_page(query, InventoryItem.created_at, InventoryItem.id)
+
+    return paged_response(serialize_rows(items, GROUP_INVENTORY_FIELDS, fields), next_cursor)
+
+INVENTORY_UPDATE_FIELDS = ('name', 'category', 'custom_type', 'quantity', 'is_shared', 'notes')
+
+
+# The owner can change an item; anyone in the group can change a shared one.
+def _inventory_item_for(item_id, user_id):
+    item = InventoryItem.query.get(item_id)
+    if not item:
+        return None, (jsonify({'error': 'Item not found'}), 404)
+    if item.owner_id != user_id:
+        user = User.query.get(user_id)
+        if not (item.is_shared and user and user.group_id == item.group_id):
+            return None, (jsonify({'error': 'Not authorized'}), 403)
+    return item, None
+
+@expense_routes.route('/inventory/<int:item_id>/update', methods=['POST'])
+@jwt_required()
+def inventory_update(item_id):
+    data = request.get_json() or {}
+    current_user_id = get_jwt_identity()
+    item, error = _inventory_item_for(item_id, current_user_id)
+    if error:
+        return error
+
+    if 'name' in data and not data['name']:
+        return jsonify({'error': 'name cannot be empty'}), 400
+    if 'quantity' in data and not _valid_quantity(data['quantity']):
+        return jsonify({'error': 'quantity must be a non-negative integer'}), 400
+
+    expect_version(item, data)
+    before = item_state(item)
+    changes = {}
+    for field in INVENTORY_UPDATE_FIELDS:
+        if field in data and data[field] != getattr(item, field):
+            setattr(item, field, data[field])
+            changes[field] = data[field]
+    if changes:
+        flush_or_conflict(item)
+        record_inventory_change(before, item_state(item), current_user_id)
+        record_event('inventory.updated', group_id=item.group_id, user_id=current_user_id, entity_id=item.id,
+                     changes=changes)
+    commit_or_conflict(item)
+    return jsonify({'message': 'Item updated', 'quantity': item.quantity, 'version': item.version})
+
+# Use up `amount` (default 1) of an item. With `version` in the body a
+# stale read is rejected up front; without it the write is still a
+# compare-and-swap on the version the handler loaded.
+@expense_routes.route('/inventory/<int:item_id>/consume', methods=['POST'])
+@jwt_required()
+def inventory_consume(item_id):
+    data = request.get_json(silent=True) or {}
+    current_user_id = get_jwt_identity()
+    item, error = _inventory_item_for(item_id, current_user_id)
+    if error:
+        return error
+
+    amount = data.get('amount', 1)
+    if not _valid_quantity(amount) or amount == 0:
+        return jsonify({'error': 'amount must be a positive integer'}), 400
+    expect_version(item, data)
+    if amount > (item.quantity or 0):
+        return jsonify({'error': f'Only {item.quantity or 0} left', 'quantity': item.quantity or 0,
+                        'version': item.version}), 400
+
+    before = item_state(item)
+    item.quantity = (item.quantity or 0) - amount
+    flush_or_conflict(item)
+    record_inventory_change(before, item_state(item), current_user_id)
+    record_event('inventory.consumed', group_id=item.group_id, user_id=current_user_id, entity_id=item.id,
+                 amount=amount, quantity=item.quantity)
+    commit_or_conflict(item)
+    return jsonify({'message': 'Item consumed', 'quantity': item.quantity, 'version': item.version})
+
+# Totals per category and shared flag (?shared=true|false, ?low_stock=true),
+# read from the rollup table instead of the items.
+@expense_routes.route('/inventory/rollups/<int:group_id>', methods=['GET'])
+@jwt_required()
+def inventory_rollups(group_id):
+    try:
+        shared = parse_bool(request.args.get('shared'), 'shared')
+        low_stock = parse_bool(request.args.get('low_stock'), 'low_stock')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(group_rollups(group_id, shared, bool(low_stock)))
+
+# Body: group_id, category (omit or null for uncategorized), is_shared and
+# threshold (null clears it). A bucket is low while its total quantity is at
+# or below the threshold; crossing it either way records an event.
+@expense_routes.route('/inventory/thresholds', methods=['POST'])
+@jwt_required()
+def inventory_threshold():
+    data = request.get_json() or {}
+    current_user_id = get_jwt_identity()
+    if 'group_id' not in data or 'threshold' not in data:
+        return jsonify({'error': 'group_id and threshold are required'}), 400
+    user = User.query.get(current_user_id)
+    if not user or user.group_id != data['group_id']:
+        return jsonify({'error': 'Not a member of this group'}), 403
+
+    try:
+        total, threshold = set_threshold(data['group_id'], data.get('category'), data.get('is_shared', False),
+                                         data['threshold'], current_user_id)
+    except ThresholdError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({'message': 'Threshold saved', 'total_quantity': total, 'low_stock_threshold': threshold,
+                    'low_stock': threshold is not None and total <= threshold})
 
-    results = [{
-        "id": item.id,
-        "name": item.name,
-        "owner_id": item.owner_id,
-        "owner_name": User.query.get(item.owner_id).name,
-        "quantity": item.quantity,
-        "category": item.category,
-        "custom_type": item.custom_type,
-        "is_shared": item.is_shared,
-        "notes": item.notes,
-        "created_at": item.created_at.isoformat()
-    } for item in items]
-
-    return jsonify(results), 200
+# ?group_id=&q=&category=&shared=, best matches first. Paginated like the
+# other lists; the cursor is on (search_rank, id).
+@expense_routes.route('/inventory/search', methods=['GET'])
+@jwt_required()
+def search_inventory():
+    group_id = request.args.get('group_id', type=int)
+    if group_id is None:
+        return jsonify({'error': 'group_id is required'}), 400
+    fields = requested_fields(GROUP_INVENTORY_FIELDS)
+    query, ranked = search_query(group_id, request.args.get('q'), fields)
+    items, next_cursor = keyset_page(query, ranked.c.search_rank, ranked.c.id, descending=True)
+
+    return paged_response(serialize_rows(items, GROUP_INVENTORY_FIELDS, fields), next_cursor)
 
 @expense_routes.route('/expenses/recurring/create', methods=['POST'])
 @jwt_required()
@@ -371,6 +540,12 @@ def create_recurring_expense():
     if not next_due_date:
         next_due_date = (datetime.utcnow().date().replace(day=1) + timedelta(days=32)).replace(day=1)
 
+    try:
+        splits = compute_splits(data['group_id'], to_cents(data['amount']),
+                                data.get('split_type', 'equal'), data.get('splits'))
+    except SplitError as e:
+        return jsonify({'error': str(e)}), 400
+
     expense = Expense(
         description=data['description'],
         amount=data['amount'],
@@ -383,39 +558,8 @@ def create_recurring_expense():
     )
     db.session.add(expense)
     db.session.flush()
-
-    # Splitting logic
-    split_type = data.get('split_type', 'equal')
-    splits_data = data.get('splits')
-
-    if split_type == 'equal':
-        users = User.query.filter_by(group_id=data['group_id']).all()
-        if not users:
-            return jsonify({'error': 'No users in group to split with'}), 400
-        
-        split_amount = round(data['amount'] / len(users), 2)
-        for user in users:
-            db.session.add(ExpenseSplit(
-                expense_id=expense.id,
-                user_id=user.id,
-                amount=split_amount
-            ))
-    elif split_type == 'custom':
-        if not splits_data or not isinstance(splits_data, list):
-            return jsonify({'error': 'Custom splits must be a list of user_id and amount'}), 400
-
-        total_split = sum([s['amount'] for s in splits_data])
-        if round(total_split, 2) != round(data['amount'], 2):
-            return jsonify({'error': 'Split amounts must equal total amount'}), 400
-
-        for s in splits_data:
-            db.session.add(ExpenseSplit(
-                expense_id=expense.id,
-                user_id=s['user_id'],
-                amount=s['amount']
-            ))
-    else:
-        return jsonify({'error': 'Invalid split_type'}), 400
+    insert_splits(expense.id, current_user_id, splits)
+    record_expense_created(expense, splits, current_user_id)
 
     db.session.commit()
 
@@ -425,43 +569,54 @@ def create_recurring_expense():
         'next_due_date': str(next_due_date)
     }), 201
 
-from dateutil.relativedelta import relativedelta
+# Clone every recurring expense that has come due (catching up on missed
+# months) and advance its next_due_date. The clones are ordinary expenses;
+# only the original keeps recurring. Runs as the expenses.generate_recurring
+# job. Returns the number of expenses created.
+def generate_due_recurring(today):
+    from dateutil.relativedelta import relativedelta  # only needed by this job
 
-@expense_routes.route('/expenses/recurring/generate', methods=['POST'])
-def generate_recurring_expenses():
-    today = datetime.utcnow().date()
     recurring_expenses = Expense.query.filter(
         Expense.is_recurring == True,
         Expense.next_due_date <= today
     ).all()
 
+    created = 0
     for old_exp in recurring_expenses:
-        # Clone the original expense
-        new_exp = Expense(
-            description=old_exp.description,
-            amount=old_exp.amount,
-            group_id=old_exp.group_id,
-            paid_by=old_exp.paid_by,
-            is_recurring=True,
-            recurrence_type='monthly',
-            created_at=datetime.utcnow(),
-            next_due_date=(old_exp.next_due_date + relativedelta(months=1))
-        )
-        db.session.add(new_exp)
-        db.session.flush()
-
-        # Clone splits
-        splits = ExpenseSplit.query.filter_by(expense_id=old_exp.id).all()
-        for s in splits:
-            db.session.add(ExpenseSplit(
-                expense_id=new_exp.id,
-                user_id=s.user_id,
-                amount=s.amount
-            ))
+        splits = [(s.user_id, to_cents(s.amount))
+                  for s in ExpenseSplit.query.filter_by(expense_id=old_exp.id).order_by(ExpenseSplit.id)]
+        while old_exp.next_due_date <= today:
+            new_exp = Expense(
+                description=old_exp.description,
+                amount=old_exp.amount,
+                group_id=old_exp.group_id,
+                paid_by=old_exp.paid_by,
+                created_at=datetime.utcnow()
+            )
+            db.session.add(new_exp)
+            db.session.flush()
+            insert_splits(new_exp.id, new_exp.paid_by, splits)
+            record_expense_created(new_exp, splits, None, generated_from=old_exp.id)
+            old_exp.next_due_date += relativedelta(months=1)
+            created += 1
 
-        # Update old expense
-        old_exp.next_due_date += relativedelta(months=1)
+    db.session.commit()
+    return created
 
+# Open to unauthenticated callers as before; a signed-in caller can poll the
+# job afterwards.
+@expense_routes.route('/expenses/recurring/generate', methods=['POST'])
+@jwt_required(optional=True)
+def generate_recurring_expenses():
+    job = enqueue('expenses.generate_recurring', created_by=get_jwt_identity())
     db.session.commit()
-    return jsonify({'message': 'Recurring expenses generated successfully'}), 200
+    return jsonify({'message': 'Recurring expense generation queued', 'job_id': job.id}), 202
 
+@expense_routes.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    # Other users' (and system) jobs are indistinguishable from missing ones.
+    if not job or job.created_by is None or job.created_by != get_jwt_identity():
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_state(job))
@@ -0,0 +1,203 @@
+import hashlib, threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import Response, g, jsonify, request
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from identity import request_identity
+from models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+KEY_TTL = timedelta(hours=24)
+MAX_KEY_LENGTH = 255
+CACHE_ENTRIES = 1024
+# Larger bodies (and file uploads) are fingerprinted by their headers only, so
+# an import isn't read into memory just to hash it.
+MAX_HASHED_BODY = 1024 * 1024
+
+StoredResponse = namedtuple('StoredResponse', 'request_hash status_code content_type body expires_at')
+
+
+class ResponseCache:
+    # LRU of completed responses in front of the table, so a retry storm from
+    # one client is answered without touching the database.
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                return None
+            if value.expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# All reads and writes go through their own short transactions, never the
+# request's session, so a claim is visible to other workers immediately and
+# the stored response outlives whatever the handler did.
+class IdempotencyStore:
+    def __init__(self, ttl=KEY_TTL):
+        self.ttl = ttl
+        self.cache = ResponseCache()
+
+    def lookup(self, scope, key):
+        now = datetime.utcnow()
+        stored = self.cache.get((scope, key), now)
+        if stored is not None:
+            return stored
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(IdempotencyRecord.request_hash, IdempotencyRecord.status_code,
+                       IdempotencyRecord.content_type, IdempotencyRecord.body, IdempotencyRecord.expires_at)
+                .where(IdempotencyRecord.scope == scope, IdempotencyRecord.key == key,
+                       IdempotencyRecord.expires_at > now)
+            ).first()
+        if row is None:
+            return None
+        stored = StoredResponse(*row)
+        if stored.status_code is not None:
+            self.cache.put((scope, key), stored)
+        return stored
+
+    # Reserve the key for this request. False if another request holds it.
+    def claim(self, scope, key, request_hash):
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(delete(IdempotencyRecord).where(
+                    IdempotencyRecord.scope == scope, IdempotencyRecord.key == key,
+                    IdempotencyRecord.expires_at <= now))
+                conn.execute(insert(IdempotencyRecord).values(
+                    scope=scope, key=key, request_hash=request_hash, created_at=now, expires_at=now + self.ttl))
+        except IntegrityError:
+            return False
+        return True
+
+    def complete(self, scope, key, request_hash, response):
+        expires_at = datetime.utcnow() + self.ttl
+        stored = StoredResponse(request_hash, response.status_code, response.content_type,
+                                response.get_data(), expires_at)
+        with db.engine.begin() as conn:
+            conn.execute(update(IdempotencyRecord)
+                         .where(IdempotencyRecord.scope == scope, IdempotencyRecord.key == key)
+                         .values(status_code=stored.status_code, content_type=stored.content_type,
+                                 body=stored.body, expires_at=expires_at))
+        self.cache.put((scope, key), stored)
+
+    # Give the key back after a failure so the client's retry runs again.
+    def release(self, scope, key):
+        with db.engine.begin() as conn:
+            conn.execute(delete(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope, IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code.is_(None)))
+
+    def purge(self):
+        with db.engine.begin() as conn:
+            return conn.execute(delete(IdempotencyRecord)
+                                .where(IdempotencyRecord.expires_at <= datetime.utcnow())).rowcount
+
+
+store = IdempotencyStore()
+
+
+# Keys are per caller: the JWT identity, or the client address for
+# anonymous requests (register, login) so unrelated clients never share them.
+def _scope():
+    identity = request_identity()
+    return f'ip:{request.remote_addr}' if identity is None else str(identity)
+
+
+def _request_hash():
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{request.method} {request.full_path}\n'.encode())
+    if request.mimetype == 'multipart/form-data' or (request.content_length or 0) > MAX_HASHED_BODY:
+        digest.update(f'{request.content_type}:{request.content_length}'.encode())
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(stored):
+    response = Response(stored.body, status=stored.status_code, content_type=stored.content_type)
+    response.headers[REPLAY_HEADER] = 'true'
+    return response
+
+
+# A POST carrying an Idempotency-Key runs at most once per caller: retries get
+# the stored response back instead of re-executing the handler.
+def check_idempotency_key():
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if request.method != 'POST' or not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+    scope = _scope()
+    request_hash = _request_hash()
+    stored = store.lookup(scope, key)
+    if stored is None:
+        if store.claim(scope, key, request_hash):
+            g.idempotency = (scope, key, request_hash)
+            return None
+        stored = store.lookup(scope, key)
+
+    if stored is not None and stored.request_hash != request_hash:
+        return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+    if stored is None or stored.status_code is None:
+        response = jsonify({'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'})
+        response.headers['Retry-After'] = '1'
+        return response, 409
+    return _replay(stored)
+
+
+def store_idempotent_response(response):
+    pending = g.pop('idempotency', None)
+    if pending is None:
+        return response
+    scope, key, request_hash = pending
+    # Server errors and streamed bodies aren't replayable; let the retry run.
+    if response.status_code >= 500 or response.is_streamed:
+        store.release(scope, key)
+    else:
+        store.complete(scope, key, request_hash, response)
+    return response
+
+
+def release_unfinished_key(exc):
+    pending = g.pop('idempotency', None)
+    if pending is not None:
+        store.release(pending[0], pending[1])
+
+
+# Registered after compression so the response is stored (and replayed)
+# before it is encoded for a particular client.
+def init_idempotency(app):
+    app.before_request(check_idempotency_key)
+    app.after_request(store_idempotent_response)
+    app.teardown_request(release_unfinished_key)
+
+
+@click.command('idempotency-purge')
+@with_appcontext
+def purge_command():
+    """Delete idempotency keys past their TTL."""
+    click.echo(f'purged {store.purge()} expired idempotency keys')
@@ -0,0 +1,37 @@
+import functools, time
+from datetime import timedelta
+
+from flask import current_app, request
+from flask_jwt_extended import decode_token
+
+TOKEN_CACHE_ENTRIES = 4096
+
+
+# Verified once per token string; a token can't be forged to hit another
+# user's entry without the signing key. The expiry is cached alongside the
+# identity and re-checked on every hit.
+@functools.lru_cache(maxsize=TOKEN_CACHE_ENTRIES)
+def _identity_for(token):
+    claims = decode_token(token)
+    return claims[current_app.config['JWT_IDENTITY_CLAIM']], claims.get('exp')
+
+
+def _leeway():
+    leeway = current_app.config.get('JWT_DECODE_LEEWAY', 0)
+    return leeway.total_seconds() if isinstance(leeway, timedelta) else leeway
+
+
+# The caller's JWT identity for request hooks (rate limiting, idempotency
+# scoping) without decoding the token again on every request. None when the
+# request carries no valid, unexpired token.
+def request_identity():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme != current_app.config['JWT_HEADER_TYPE'] or not token:
+        return None
+    try:
+        identity, exp = _identity_for(token)
+    except Exception:
+        return None
+    if exp is not None and exp + _leeway() <= time.time():
+        return None
+    return identity
@@ -0,0 +1,162 @@
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from events import record_event
+from models import InventoryItem, InventoryRollup
+
+UNCATEGORIZED = ''
+
+
+class ThresholdError(ValueError):
+    pass
+
+
+# (group_id, category, is_shared): the rollup row an item counts towards.
+def bucket(item):
+    return item.group_id, item.category or UNCATEGORIZED, bool(item.is_shared)
+
+
+# What an item contributes to the rollups; take it before changing the item
+# and pass it to record_inventory_change as `before`.
+def item_state(item):
+    return bucket(item), item.quantity or 0
+
+
+def _key_filter(key):
+    group_id, category, is_shared = key
+    return and_(InventoryRollup.group_id == group_id, InventoryRollup.category == category,
+                InventoryRollup.is_shared.is_(is_shared))
+
+
+def _upsert(key, increments, set_=None):
+    # INSERT ... ON CONFLICT DO UPDATE ... RETURNING: one statement, and the
+    # row lock it takes serializes concurrent writers to the same bucket, so
+    # the returned totals are the ones this transaction will commit.
+    group_id, category, is_shared = key
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(InventoryRollup).values(group_id=group_id, category=category, is_shared=is_shared,
+                                                  **increments, **(set_ or {}))
+    changes = {k: getattr(InventoryRollup, k) + getattr(stmt.excluded, k) for k in increments}
+    changes.update(set_ or {})
+    stmt = stmt.on_conflict_do_update(index_elements=['group_id', 'category', 'is_shared'], set_=changes) \
+        .returning(InventoryRollup.total_quantity, InventoryRollup.low_stock_threshold, InventoryRollup.low_since)
+    return db.session.execute(stmt).one()
+
+
+# Low-stock is decided here, on the write that moves the total, rather than
+# by scanning items. The conditional UPDATE makes the transition (and its
+# event) happen once even if two writers cross the threshold together.
+def _evaluate(key, total, threshold, low_since, user_id):
+    low = threshold is not None and total <= threshold
+    if low == (low_since is not None):
+        return
+    stmt = update(InventoryRollup).where(_key_filter(key))
+    if low:
+        stmt = stmt.where(InventoryRollup.low_since.is_(None)).values(low_since=datetime.utcnow())
+    else:
+        stmt = stmt.where(InventoryRollup.low_since.isnot(None)).values(low_since=None)
+    if db.session.execute(stmt).rowcount:
+        group_id, category, is_shared = key
+        record_event('inventory.low_stock' if low else 'inventory.restocked', group_id=group_id, user_id=user_id,
+                     category=category or None, is_shared=is_shared, total_quantity=total, threshold=threshold)
+
+
+# Move an item's contribution from `before` to `after` (item_state values;
+# None when the item is being added or removed), in the caller's
+# transaction.
+def record_inventory_change(before, after, user_id=None):
+    deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        key, quantity = state
+        counts = deltas.setdefault(key, [0, 0])
+        counts[0] += sign
+        counts[1] += sign * quantity
+    for key, (items, quantity) in deltas.items():
+        if items or quantity:
+            _evaluate(key, *_upsert(key, {'item_count': items, 'total_quantity': quantity}), user_id)
+
+
+# Set (or clear, with None) the low-stock threshold for a bucket and
+# evaluate it against the current total straight away.
+def set_threshold(group_id, category, is_shared, threshold, user_id=None):
+    if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, int) or threshold < 0):
+        raise ThresholdError('threshold must be a non-negative integer or null')
+    key = (group_id, category or UNCATEGORIZED, bool(is_shared))
+    total, threshold, low_since = _upsert(key, {'item_count': 0, 'total_quantity': 0},
+                                          {'low_stock_threshold': threshold})
+    _evaluate(key, total, threshold, low_since, user_id)
+    return total, threshold
+
+
+def serialize_rollup(row):
+    return {
+        'category': row.category or None,
+        'is_shared': row.is_shared,
+        'item_count': row.item_count,
+        'total_quantity': row.total_quantity,
+        'low_stock_threshold': row.low_stock_threshold,
+        'low_stock': row.low_since is not None,
+        'low_since': row.low_since.isoformat() if row.low_since else None,
+    }
+
+
+# A group's rollup rows, read only from the summary table. Buckets that are
+# empty and have no threshold are left out.
+def group_rollups(group_id, shared=None, low_stock=False):
+    query = select(InventoryRollup).where(
+        InventoryRollup.group_id == group_id,
+        (InventoryRollup.item_count > 0) | InventoryRollup.low_stock_threshold.isnot(None))
+    if shared is not None:
+        query = query.where(InventoryRollup.is_shared.is_(shared))
+    if low_stock:
+        query = query.where(InventoryRollup.low_since.isnot(None))
+    rows = db.session.scalars(query.order_by(InventoryRollup.category, InventoryRollup.is_shared)).all()
+    return [serialize_rollup(row) for row in rows]
+
+
+# Recompute the totals with a GROUP BY over inventory_item, keeping the
+# thresholds, and re-evaluate them. For repairing drift, e.g. after rows were
+# changed outside the app.
+def rebuild_rollups(group_id=None):
+    grouped = select(InventoryItem.group_id, func.coalesce(InventoryItem.category, UNCATEGORIZED),
+                     func.coalesce(InventoryItem.is_shared, False), func.count(),
+                     func.coalesce(func.sum(func.coalesce(InventoryItem.quantity, 0)), 0)) \
+        .group_by(InventoryItem.group_id, func.coalesce(InventoryItem.category, UNCATEGORIZED),
+                  func.coalesce(InventoryItem.is_shared, False))
+    reset = update(InventoryRollup).values(item_count=0, total_quantity=0)
+    if group_id is not None:
+        grouped = grouped.where(InventoryItem.group_id == group_id)
+        reset = reset.where(InventoryRollup.group_id == group_id)
+    totals = db.session.execute(grouped).all()
+
+    db.session.execute(reset)
+    for group, category, is_shared, count, quantity in totals:
+        _upsert((group, category, bool(is_shared)), {}, {'item_count': count, 'total_quantity': quantity})
+    rows = db.session.scalars(select(InventoryRollup).where(
+        InventoryRollup.group_id == group_id) if group_id is not None else select(InventoryRollup)).all()
+    for row in rows:
+        _evaluate((row.group_id, row.category, row.is_shared), row.total_quantity, row.low_stock_threshold,
+                  row.low_since, None)
+    return len(totals)
+
+
+@click.group('inventory')
+def inventory_cli():
+    """Maintain the inventory rollups."""
+
+
+@inventory_cli.command('rebuild-rollups')
+@click.option('--group-id', type=int, help='Only this group.')
+@with_appcontext
+def rebuild_command(group_id):
+    """Recompute the category rollups from inventory_item."""
+    buckets = rebuild_rollups(group_id)
+    db.session.commit()
+    click.echo(f'Rebuilt {buckets} inventory rollup(s)')
@@ -0,0 +1,118 @@
+import re
+
+from flask import request
+from sqlalchemy import case, event, func, literal, literal_column, or_, select, text
+
+from extensions import db
+from models import InventoryItem, User, inventory_search_document, inventory_search_vector
+from serializers import GROUP_INVENTORY_FIELDS, parse_bool, select_columns
+
+# Matching is by word prefix ("choc" finds "chocolate") or, for typos, by
+# trigram word similarity ("choclate" finds "chocolate"). Results are ranked
+# word matches first (name over category/type over notes), then by
+# similarity.
+MAX_TERMS = 8
+FUZZY_THRESHOLD = 0.4
+TERM = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchError(ValueError):
+    pass
+
+
+def query_terms(q):
+    return [t.lower() for t in TERM.findall(q or '')][:MAX_TERMS]
+
+
+def _trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# pg_trgm's word_similarity, approximated per word: for each query term the
+# best trigram overlap with any word of the document, averaged over terms.
+def word_similarity(query, document):
+    terms, words = query_terms(query), query_terms(document)
+    if not terms or not words:
+        return 0.0
+    word_grams = [_trigrams(w) for w in words]
+    total = 0.0
+    for term in terms:
+        grams = _trigrams(term)
+        total += max(len(grams & g) / len(grams | g) for g in word_grams)
+    return total / len(terms)
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function('word_similarity', 2, word_similarity, deterministic=True)
+
+
+def _bool_arg(name):
+    try:
+        return parse_bool(request.args.get(name), name)
+    except ValueError as e:
+        raise SearchError(str(e))
+
+
+def _postgres_match(terms):
+    phrase = ' '.join(terms)
+    vector, document = inventory_search_vector(), inventory_search_document()
+    tsquery = func.to_tsquery(literal_column("'simple'"), ' & '.join(f'{t}:*' for t in terms))
+    # <% is indexable with gin_trgm_ops; its cut-off is this setting, local
+    # to the transaction.
+    db.session.execute(select(func.set_config('pg_trgm.word_similarity_threshold', str(FUZZY_THRESHOLD), True)))
+    words = vector.op('@@')(tsquery)
+    match = or_(words, literal(phrase).op('<%')(document))
+    rank = case((words, 1 + func.ts_rank(vector, tsquery)), else_=0) + func.word_similarity(phrase, document)
+    return None, match, rank
+
+
+def _sqlite_match(terms):
+    phrase = ' '.join(terms)
+    # bm25 is lower-is-better; the column weights mirror the Postgres
+    # setweight() classes.
+    fts = select(literal_column('rowid').label('item_id'),
+                 (-func.bm25(literal_column('inventory_item_fts'), 10, 4, 4, 1)).label('score')) \
+        .select_from(text('inventory_item_fts')) \
+        .where(text('inventory_item_fts MATCH :fts_query')) \
+        .params(fts_query=' '.join(f'"{t}"*' for t in terms)).subquery('fts')
+    similarity = func.word_similarity(phrase, inventory_search_document())
+    words = fts.c.item_id.isnot(None)
+    match = or_(words, similarity >= FUZZY_THRESHOLD)
+    rank = case((words, 1 + fts.c.score), else_=0) + similarity
+    return fts, match, rank
+
+
+# Ranked search over a group's inventory, as an ORM query over a subquery
+# with the requested fields plus `search_rank` and `id` for keyset_page.
+def search_query(group_id, q, fields):
+    terms = query_terms(q)
+    query = select(*select_columns(GROUP_INVENTORY_FIELDS, fields, extra=[InventoryItem.id])) \
+        .select_from(InventoryItem).join(User, User.id == InventoryItem.owner_id) \
+        .where(InventoryItem.group_id == group_id)
+
+    category = request.args.get('category')
+    if category:
+        query = query.where(InventoryItem.category == category)
+    shared = _bool_arg('shared')
+    if shared is not None:
+        query = query.where(InventoryItem.is_shared.is_(shared))
+
+    if not terms:
+        rank = literal(0.0)
+    elif db.session.get_bind().dialect.name == 'postgresql':
+        _, match, rank = _postgres_match(terms)
+        query = query.where(match)
+    else:
+        fts, match, rank = _sqlite_match(terms)
+        query = query.outerjoin(fts, fts.c.item_id == InventoryItem.id).where(match)
+
+    ranked = query.add_columns(rank.label('search_rank')).subquery('ranked')
+    return db.session.query(ranked), ranked
+
+
+def init_inventory_search(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _register_sqlite_functions)
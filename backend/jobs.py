@@ -0,0 +1,354 @@
+import json, os, random, socket, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Job, JobSchedule
+
+DEFAULT_CONCURRENCY = 4
+POLL_INTERVAL = 1.0
+# Retry delay: BACKOFF_BASE seconds after the first failure, doubling per
+# attempt up to BACKOFF_MAX, with +-20% jitter.
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+# A job still 'running' this long after it was claimed is assumed lost with
+# its worker and goes back on the queue (counting as an attempt).
+LEASE = timedelta(minutes=30)
+# Finished jobs are kept this long for inspection.
+RETENTION = timedelta(days=7)
+METRICS_INTERVAL = 60
+
+# name -> (function, max_attempts)
+TASKS = {}
+# schedule name -> (cron expression, task name, payload)
+SCHEDULES = {}
+
+
+class JobError(ValueError):
+    pass
+
+
+def task(name, max_attempts=3):
+    def register(fn):
+        TASKS[name] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def schedule(name, cron, task_name, payload=None):
+    Cron(cron)  # fail at import on a bad expression
+    SCHEDULES[name] = (cron, task_name, payload)
+
+
+def _cron_field(spec, low, high):
+    values = set()
+    for part in spec.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = map(int, part.split('-'))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or step < 1:
+            raise JobError(f'cron field out of range: {spec}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+# Standard five-field cron (minute hour day-of-month month day-of-week) with
+# '*', lists, ranges and steps. Times are UTC.
+class Cron:
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise JobError(f'cron expression needs five fields: {expr!r}')
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}  # 0 and 7 are Sunday
+        self.any_day, self.any_weekday = fields[2] == '*', fields[4] == '*'
+
+    def _day_matches(self, t):
+        day = t.day in self.days
+        weekday = (t.weekday() + 1) % 7 in self.weekdays
+        # As in cron: when both day fields are restricted, either may match.
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after):
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise JobError('cron expression never fires')
+
+
+# Queue a job in the caller's transaction; it becomes visible to workers when
+# the caller commits.
+def enqueue(name, payload=None, run_at=None, max_attempts=None, created_by=None):
+    if name not in TASKS:
+        raise JobError(f'Unknown job: {name}')
+    now = datetime.utcnow()
+    job = Job(name=name, payload=json.dumps(payload) if payload is not None else None, status='queued',
+              attempts=0, max_attempts=max_attempts or TASKS[name][1], run_at=run_at or now, created_at=now,
+              created_by=created_by)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+# last_error holds a traceback for operators (see `flask jobs`); clients only
+# get its final line, the exception itself.
+def _error_summary(error):
+    lines = [line for line in (error or '').splitlines() if line.strip()]
+    return lines[-1].strip() if lines else None
+
+
+def job_state(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_at': job.run_at.isoformat() if job.run_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'duration_ms': job.duration_ms,
+        'last_error': _error_summary(job.last_error),
+        'result': json.loads(job.result) if job.result else None,
+    }
+
+
+# Atomically move up to `limit` due jobs to 'running' for this worker. On
+# Postgres the candidate rows are locked with FOR UPDATE SKIP LOCKED, so
+# concurrent workers claim disjoint sets without waiting on each other; SQLite
+# serializes writers, which makes the single UPDATE atomic on its own.
+def claim_jobs(worker_id, limit, now=None):
+    now = now or datetime.utcnow()
+    candidates = select(Job.id).where(Job.status == 'queued', Job.run_at <= now) \
+        .order_by(Job.run_at, Job.id).limit(limit)
+    if db.engine.dialect.name == 'postgresql':
+        candidates = candidates.with_for_update(skip_locked=True)
+    jobs = db.session.execute(
+        update(Job).where(Job.id.in_(candidates), Job.status == 'queued')
+        .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return jobs
+
+
+def backoff(attempts):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+# Put jobs whose worker vanished back on the queue, or fail them if that was
+# their last attempt.
+def requeue_expired(now):
+    db.session.execute(
+        update(Job).where(Job.status == 'running', Job.locked_at < now - LEASE)
+        .values(status=case((Job.attempts < Job.max_attempts, 'queued'), else_='failed'),
+                locked_by=None, locked_at=None, run_at=now, last_error='Lease expired')
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+# Enqueue one job per schedule that has come due. Runs missed while no worker
+# was up collapse into a single run.
+def enqueue_due_schedules(now):
+    for name, (cron, task_name, payload) in SCHEDULES.items():
+        next_run_at = Cron(cron).next_after(now)
+        row = db.session.get(JobSchedule, name)
+        if row is None:
+            db.session.add(JobSchedule(name=name, next_run_at=next_run_at))
+        elif row.next_run_at <= now:
+            advanced = db.session.execute(
+                update(JobSchedule).where(JobSchedule.name == name, JobSchedule.next_run_at == row.next_run_at)
+                .values(next_run_at=next_run_at).execution_options(synchronize_session=False)
+            ).rowcount
+            if advanced:
+                enqueue(task_name, payload)
+        else:
+            continue
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # another worker created the schedule first
+
+
+class JobMetrics:
+    # Per-task counts and timings for this worker process.
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration_ms, ok):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'runs': 0, 'failures': 0, 'total_ms': 0, 'max_ms': 0})
+            stats['runs'] += 1
+            stats['failures'] += 0 if ok else 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {**s, 'avg_ms': round(s['total_ms'] / s['runs'], 1)} for name, s in self._stats.items()}
+
+
+def run_job(app, job, worker_id, metrics):
+    fn = TASKS.get(job.name, (None,))[0]
+    started = time.perf_counter()
+    ok = False
+    with app.app_context():
+        try:
+            if fn is None:
+                raise JobError(f'Unknown job: {job.name}')
+            result = fn(**json.loads(job.payload)) if job.payload else fn()
+            values = {'status': 'done', 'result': json.dumps(result, default=str), 'last_error': None}
+            ok = True
+        except Exception:
+            db.session.rollback()
+            values = {'last_error': traceback.format_exc(limit=5)}
+            if job.attempts < job.max_attempts:
+                values.update(status='queued', run_at=datetime.utcnow() + timedelta(seconds=backoff(job.attempts)))
+            else:
+                values['status'] = 'failed'
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        # Only if we still hold it: a job that outlived its lease may have
+        # been handed to another worker.
+        db.session.execute(
+            update(Job).where(Job.id == job.id, Job.locked_by == worker_id)
+            .values(**values, locked_by=None, locked_at=None, finished_at=datetime.utcnow(),
+                    duration_ms=duration_ms)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    metrics.record(job.name, duration_ms, ok)
+
+
+class Worker:
+    def __init__(self, app, concurrency=DEFAULT_CONCURRENCY, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.id = f'{socket.gethostname()}:{os.getpid()}'
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(concurrency, thread_name_prefix='job')
+        self.metrics = JobMetrics()
+        self.running = set()
+        # Futures are added here and discarded from pool threads' done
+        # callbacks.
+        self._running_lock = threading.Lock()
+
+    def poll(self):
+        with self.app.app_context():
+            now = datetime.utcnow()
+            requeue_expired(now)
+            enqueue_due_schedules(now)
+            with self._running_lock:
+                free = self.concurrency - len(self.running)
+            jobs = claim_jobs(self.id, free, now) if free > 0 else []
+        for job in jobs:
+            future = self.pool.submit(run_job, self.app, job, self.id, self.metrics)
+            with self._running_lock:
+                self.running.add(future)
+            future.add_done_callback(self._finished)
+        return len(jobs)
+
+    def _finished(self, future):
+        with self._running_lock:
+            self.running.discard(future)
+
+    def _running_snapshot(self):
+        with self._running_lock:
+            return list(self.running)
+
+    # With once=True, run until nothing is due and every claimed job is done.
+    def run(self, once=False, log=print):
+        last_report = time.monotonic()
+        try:
+            while True:
+                claimed = self.poll()
+                if once and not claimed:
+                    wait(self._running_snapshot())
+                    if not self.poll():
+                        break
+                elif not claimed:
+                    time.sleep(self.poll_interval)
+                if time.monotonic() - last_report >= METRICS_INTERVAL:
+                    log(json.dumps(self.metrics.snapshot()))
+                    last_report = time.monotonic()
+        finally:
+            self.pool.shutdown(wait=True)
+        return self.metrics.snapshot()
+
+
+def prune_finished(now=None):
+    now = now or datetime.utcnow()
+    return db.session.execute(delete(Job).where(Job.status.in_(['done', 'failed']),
+                                                Job.finished_at < now - RETENTION)).rowcount
+
+
+@click.group('jobs')
+def jobs_cli():
+    """Background job queue."""
+
+
+@jobs_cli.command('worker')
+@click.option('--concurrency', type=int, default=DEFAULT_CONCURRENCY, show_default=True)
+@click.option('--poll-interval', type=float, default=POLL_INTERVAL, show_default=True)
+@click.option('--once', is_flag=True, help='Exit once no jobs are due.')
+@with_appcontext
+def worker_command(concurrency, poll_interval, once):
+    """Claim and run jobs, and enqueue scheduled ones."""
+    worker = Worker(current_app._get_current_object(), concurrency, poll_interval)
+    click.echo(f'worker {worker.id}: {concurrency} threads, tasks: {", ".join(sorted(TASKS))}')
+    metrics = worker.run(once=once, log=click.echo)
+    click.echo(json.dumps(metrics))
+
+
+@jobs_cli.command('enqueue')
+@click.argument('name')
+@click.option('--payload', default=None, help='JSON object of keyword arguments.')
+@with_appcontext
+def enqueue_command(name, payload):
+    """Queue a job to run now."""
+    job = enqueue(name, json.loads(payload) if payload else None)
+    db.session.commit()
+    click.echo(f'queued job {job.id} ({name})')
+
+
+@jobs_cli.command('stats')
+@click.option('--hours', type=int, default=24, show_default=True)
+@with_appcontext
+def stats_command(hours):
+    """Counts and run times per job over the last --hours."""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    rows = db.session.query(Job.name, Job.status, func.count(), func.avg(Job.duration_ms), func.max(Job.duration_ms)) \
+        .filter(Job.created_at >= since).group_by(Job.name, Job.status).order_by(Job.name, Job.status)
+    click.echo(f"{'job':<32}{'status':<10}{'count':>8}{'avg ms':>10}{'max ms':>10}")
+    for name, status, count, avg_ms, max_ms in rows:
+        click.echo(f'{name:<32}{status:<10}{count:>8}{avg_ms or 0:>10.0f}{max_ms or 0:>10}')
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, exists, func, insert, select
+
+from extensions import db
+from models import (
+    Expense, ExpenseSplit, Payment, Group, LedgerCheckpoint, CheckpointBalance,
+    ArchivedExpense, ArchivedExpenseSplit, ArchivedPayment
+)
+
+# Settled history younger than this stays in the hot tables.
+DEFAULT_RETENTION_DAYS = 180
+# Expenses moved per archive transaction.
+ARCHIVE_BATCH = 1000
+
+
+def latest_checkpoint(group_id):
+    return LedgerCheckpoint.query.filter_by(group_id=group_id) \
+        .order_by(LedgerCheckpoint.id.desc()).first()
+
+
+def _add(balances, rows, sign):
+    for user_id, total in rows:
+        balances[user_id] = balances.get(user_id, 0) + sign * int(round((total or 0) * 100))
+
+
+# The four aggregates behind a group's balances, as (statement, sign) pairs
+# over rows past the checkpoint watermarks. Shared with the async read path,
+# which runs them concurrently.
+def balance_statements(group_id, after_expense=0, after_payment=0, upto_expense_id=None, upto_payment_id=None):
+    expense_filter = [Expense.group_id == group_id, Expense.id > after_expense]
+    payment_filter = [Payment.group_id == group_id, Payment.id > after_payment]
+    if upto_expense_id is not None:
+        expense_filter.append(Expense.id <= upto_expense_id)
+    if upto_payment_id is not None:
+        payment_filter.append(Payment.id <= upto_payment_id)
+
+    return [
+        (select(Expense.paid_by, func.sum(Expense.amount))
+         .where(*expense_filter).group_by(Expense.paid_by), 1),
+        (select(ExpenseSplit.user_id, func.sum(ExpenseSplit.amount))
+         .join(Expense, Expense.id == ExpenseSplit.expense_id)
+         .where(*expense_filter).group_by(ExpenseSplit.user_id), -1),
+        (select(Payment.from_user, func.sum(Payment.amount))
+         .where(*payment_filter).group_by(Payment.from_user), 1),
+        (select(Payment.to_user, func.sum(Payment.amount))
+         .where(*payment_filter).group_by(Payment.to_user), -1),
+    ]
+
+
+# Net balance in cents per user for a group: the latest checkpoint plus the
+# aggregated expenses, splits and payments written after it. Positive means
+# the group owes the user.
+def group_balances(group_id, checkpoint=None, upto_expense_id=None, upto_payment_id=None):
+    if checkpoint is None:
+        checkpoint = latest_checkpoint(group_id)
+    balances = {}
+    after_expense, after_payment = 0, 0
+    if checkpoint:
+        after_expense, after_payment = checkpoint.last_expense_id, checkpoint.last_payment_id
+        for b in checkpoint.balances:
+            balances[b.user_id] = b.balance_cents
+
+    for stmt, sign in balance_statements(group_id, after_expense, after_payment, upto_expense_id, upto_payment_id):
+        _add(balances, db.session.execute(stmt), sign)
+    return balances
+
+
+# Snapshot the group's balances up to the current highest expense/payment ids.
+# Only the rows since the previous checkpoint are aggregated.
+def create_checkpoint(group_id):
+    if db.engine.dialect.name == 'postgresql':
+        # Wait out in-flight writers so no row below the new watermarks can
+        # commit after the snapshot is taken.
+        db.session.execute(db.text('LOCK TABLE expense, payment IN SHARE MODE'))
+
+    last_expense_id = db.session.scalar(
+        select(func.coalesce(func.max(Expense.id), 0)).where(Expense.group_id == group_id))
+    last_payment_id = db.session.scalar(
+        select(func.coalesce(func.max(Payment.id), 0)).where(Payment.group_id == group_id))
+
+    previous = latest_checkpoint(group_id)
+    if previous:
+        # Watermarks never move backwards, even if the newest rows were archived.
+        last_expense_id = max(last_expense_id, previous.last_expense_id)
+        last_payment_id = max(last_payment_id, previous.last_payment_id)
+    balances = group_balances(group_id, previous, last_expense_id, last_payment_id)
+
+    checkpoint = LedgerCheckpoint(group_id=group_id, last_expense_id=last_expense_id,
+                                  last_payment_id=last_payment_id, created_at=datetime.utcnow())
+    checkpoint.balances = [CheckpointBalance(user_id=user_id, balance_cents=cents)
+                           for user_id, cents in balances.items()]
+    db.session.add(checkpoint)
+    db.session.commit()
+    return checkpoint
+
+
+# A user's paid/owed/payment totals over archived history, in dollars, so
+# per-user summaries stay complete after compaction.
+def archived_user_totals(user_id):
+    def total(query):
+        return query.scalar() or 0
+
+    split_totals = db.session.query(func.sum(ArchivedExpenseSplit.amount)) \
+        .join(ArchivedExpense, ArchivedExpense.id == ArchivedExpenseSplit.expense_id)
+    return {
+        'paid': total(db.session.query(func.sum(ArchivedExpense.amount))
+                      .filter(ArchivedExpense.paid_by == user_id)),
+        'owed': total(split_totals.filter(ArchivedExpenseSplit.user_id == user_id,
+                                          ArchivedExpense.paid_by != user_id)),
+        'owed_by': total(split_totals.filter(ArchivedExpense.paid_by == user_id,
+                                             ArchivedExpenseSplit.user_id != user_id)),
+        'paid_back': total(db.session.query(func.sum(ArchivedPayment.amount))
+                           .filter(ArchivedPayment.from_user == user_id)),
+        'received': total(db.session.query(func.sum(ArchivedPayment.amount))
+                          .filter(ArchivedPayment.to_user == user_id)),
+    }
+
+
+def _archive_payments(*where):
+    db.session.execute(insert(ArchivedPayment).from_select(
+        ['id', 'expense_id', 'from_user', 'to_user', 'group_id', 'amount', 'created_at'],
+        select(Payment.id, Payment.expense_id, Payment.from_user, Payment.to_user,
+               Payment.group_id, Payment.amount, Payment.created_at).where(*where)))
+    db.session.execute(delete(Payment).where(*where))
+
+
+# Move fully settled expenses (with their splits and payments) older than the
+# retention window into the archive tables. Only rows already covered by a
+# checkpoint are moved, so balances are unaffected. Returns the number of
+# expenses archived.
+def archive_settled(group_id, retention_days=DEFAULT_RETENTION_DAYS):
+    checkpoint = create_checkpoint(group_id)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    archived = 0
+
+    while True:
+        expense_ids = db.session.scalars(
+            select(Expense.id).where(
+                Expense.group_id == group_id,
+                Expense.id <= checkpoint.last_expense_id,
+                Expense.created_at < cutoff,
+                # Recurring templates keep generating new expenses.
+                Expense.is_recurring.isnot(True),
+                ~exists().where(ExpenseSplit.expense_id == Expense.id, ExpenseSplit.outstanding_cents > 0),
+                # A payment newer than the checkpoint isn't in its balances yet.
+                ~exists().where(Payment.expense_id == Expense.id, Payment.id > checkpoint.last_payment_id)
+            ).order_by(Expense.id).limit(ARCHIVE_BATCH)
+        ).all()
+        if not expense_ids:
+            break
+
+        db.session.execute(insert(ArchivedExpense).from_select(
+            ['id', 'description', 'amount', 'group_id', 'paid_by', 'created_at'],
+            select(Expense.id, Expense.description, Expense.amount, Expense.group_id,
+                   Expense.paid_by, Expense.created_at).where(Expense.id.in_(expense_ids))))
+        db.session.execute(insert(ArchivedExpenseSplit).from_select(
+            ['id', 'expense_id', 'user_id', 'amount'],
+            select(ExpenseSplit.id, ExpenseSplit.expense_id, ExpenseSplit.user_id, ExpenseSplit.amount)
+            .where(ExpenseSplit.expense_id.in_(expense_ids))))
+        _archive_payments(Payment.expense_id.in_(expense_ids))
+
+        db.session.execute(delete(ExpenseSplit).where(ExpenseSplit.expense_id.in_(expense_ids)))
+        db.session.execute(delete(Expense).where(Expense.id.in_(expense_ids)))
+        db.session.commit()
+        archived += len(expense_ids)
+
+    # Old payments that were never tied to an expense.
+    _archive_payments(
+        Payment.group_id == group_id,
+        Payment.id <= checkpoint.last_payment_id,
+        Payment.expense_id.is_(None),
+        Payment.created_at < cutoff
+    )
+    db.session.commit()
+    return archived
+
+
+@click.command('ledger-checkpoint')
+@click.option('--group', 'group_id', type=int, default=None, help='Only this group (default: all).')
+@with_appcontext
+def checkpoint_command(group_id):
+    """Write a balance checkpoint for one or every group."""
+    group_ids = [group_id] if group_id else db.session.scalars(select(Group.id)).all()
+    for gid in group_ids:
+        cp = create_checkpoint(gid)
+        click.echo(f'group {gid}: checkpoint {cp.id} at expense {cp.last_expense_id}, payment {cp.last_payment_id}')
+
+
+@click.command('ledger-archive')
+@click.option('--group', 'group_id', type=int, default=None, help='Only this group (default: all).')
+@click.option('--retention-days', type=int, default=DEFAULT_RETENTION_DAYS, show_default=True)
+@with_appcontext
+def archive_command(group_id, retention_days):
+    """Checkpoint and archive settled expenses older than the retention window."""
+    group_ids = [group_id] if group_id else db.session.scalars(select(Group.id)).all()
+    for gid in group_ids:
+        count = archive_settled(gid, retention_days)
+        click.echo(f'group {gid}: archived {count} settled expenses')
@@ -0,0 +1,126 @@
+import csv, io, json
+
+from sqlalchemy import select, union_all
+
+from extensions import db
+from models import Expense, ExpenseSplit, Payment, ArchivedExpense, ArchivedExpenseSplit, ArchivedPayment
+
+# Rows fetched per round-trip from the server-side cursor.
+YIELD_PER = 1000
+
+EXPORT_COLUMNS = ['type', 'id', 'expense_id', 'description', 'amount', 'paid_by',
+                  'user_id', 'from_user', 'to_user', 'created_at']
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _stream(stmt):
+    # stream_results keeps a server-side cursor open (where the driver supports
+    # it) and yield_per hands rows over in fixed-size batches, so neither the
+    # driver nor the ORM ever buffers the whole ledger.
+    return db.session.execute(stmt.execution_options(yield_per=YIELD_PER, stream_results=True))
+
+
+def _expense_rows(expense, split, group_id):
+    return (
+        select(expense.id, expense.description, expense.amount, expense.paid_by,
+               expense.created_at, split.id.label('split_id'),
+               split.user_id, split.amount.label('split_amount'))
+        .outerjoin(split, split.expense_id == expense.id)
+        .where(expense.group_id == group_id)
+    )
+
+
+def _payment_rows(payment, group_id):
+    return select(payment.id, payment.expense_id, payment.from_user, payment.to_user,
+                  payment.amount, payment.created_at).where(payment.group_id == group_id)
+
+
+# Yield the group's ledger as flat dicts: each expense followed by its splits,
+# then every payment. Archived history is merged in by id, so an export looks
+# the same before and after compaction.
+def iter_ledger(group_id):
+    rows = union_all(_expense_rows(Expense, ExpenseSplit, group_id),
+                     _expense_rows(ArchivedExpense, ArchivedExpenseSplit, group_id)).subquery()
+    expenses = select(rows).order_by(rows.c.id, rows.c.split_id)
+    last_expense = None
+    for row in _stream(expenses):
+        if row.id != last_expense:
+            last_expense = row.id
+            yield {
+                'type': 'expense',
+                'id': row.id,
+                'description': row.description,
+                'amount': row.amount,
+                'paid_by': row.paid_by,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+            }
+        if row.split_id is not None:
+            yield {
+                'type': 'split',
+                'id': row.split_id,
+                'expense_id': row.id,
+                'user_id': row.user_id,
+                'amount': row.split_amount,
+            }
+
+    rows = union_all(_payment_rows(Payment, group_id),
+                     _payment_rows(ArchivedPayment, group_id)).subquery()
+    payments = select(rows).order_by(rows.c.id)
+    for row in _stream(payments):
+        yield {
+            'type': 'payment',
+            'id': row.id,
+            'expense_id': row.expense_id,
+            'from_user': row.from_user,
+            'to_user': row.to_user,
+            'amount': row.amount,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+        }
+
+
+# Encoders flush every YIELD_PER rows so the response goes out in a modest
+# number of reasonably sized chunks.
+def encode_csv(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % YIELD_PER == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def encode_ndjson(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row))
+        if len(chunk) == YIELD_PER:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
+
+
+# Pick the export format from ?format= or the Accept header (CSV by default).
+def negotiate_format(request):
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower() if fmt.lower() in ENCODERS else None
+    best = request.accept_mimetypes.best_match(
+        [EXPORT_MIMETYPES['csv'], EXPORT_MIMETYPES['ndjson'], 'application/json'],
+        default=EXPORT_MIMETYPES['csv']
+    )
+    return 'csv' if best == EXPORT_MIMETYPES['csv'] else 'ndjson'
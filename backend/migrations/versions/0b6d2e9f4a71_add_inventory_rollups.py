@@ -0,0 +1,39 @@
+"""Add inventory rollups and low-stock thresholds
+
+Revision ID: 0b6d2e9f4a71
+Revises: f1a4c7d2e8b5
+Create Date: 2026-10-19 20:11:52.903417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6d2e9f4a71'
+down_revision = 'f1a4c7d2e8b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inventory_rollup',
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String(length=50), nullable=False),
+        sa.Column('is_shared', sa.Boolean(), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('total_quantity', sa.Integer(), nullable=False),
+        sa.Column('low_stock_threshold', sa.Integer(), nullable=True),
+        sa.Column('low_since', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('group_id', 'category', 'is_shared')
+    )
+    op.execute(
+        "INSERT INTO inventory_rollup (group_id, category, is_shared, item_count, total_quantity) "
+        "SELECT group_id, coalesce(category, ''), coalesce(is_shared, false), count(*), "
+        "coalesce(sum(coalesce(quantity, 0)), 0) FROM inventory_item "
+        "GROUP BY group_id, coalesce(category, ''), coalesce(is_shared, false)"
+    )
+
+
+def downgrade():
+    op.drop_table('inventory_rollup')
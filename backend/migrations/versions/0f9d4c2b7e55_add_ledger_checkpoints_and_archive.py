@@ -0,0 +1,80 @@
+"""Add ledger checkpoints and archive tables
+
+Revision ID: 0f9d4c2b7e55
+Revises: e3b58d0c6a21
+Create Date: 2026-10-19 11:26:04.391770
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0f9d4c2b7e55'
+down_revision = 'e3b58d0c6a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ledger_checkpoint',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('last_expense_id', sa.Integer(), nullable=False),
+        sa.Column('last_payment_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['group_id'], ['group.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ledger_checkpoint_group_id', 'ledger_checkpoint', ['group_id'])
+    op.create_table('checkpoint_balance',
+        sa.Column('checkpoint_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('balance_cents', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['checkpoint_id'], ['ledger_checkpoint.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('checkpoint_id', 'user_id')
+    )
+    op.create_table('archived_expense',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('description', sa.String(length=100), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('paid_by', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_expense_group_id', 'archived_expense', ['group_id'])
+    op.create_table('archived_expense_split',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('expense_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_expense_split_expense_id', 'archived_expense_split', ['expense_id'])
+    op.create_table('archived_payment',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('expense_id', sa.Integer(), nullable=True),
+        sa.Column('from_user', sa.Integer(), nullable=False),
+        sa.Column('to_user', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_payment_group_id', 'archived_payment', ['group_id'])
+
+
+def downgrade():
+    op.drop_index('ix_archived_payment_group_id', table_name='archived_payment')
+    op.drop_table('archived_payment')
+    op.drop_index('ix_archived_expense_split_expense_id', table_name='archived_expense_split')
+    op.drop_table('archived_expense_split')
+    op.drop_index('ix_archived_expense_group_id', table_name='archived_expense')
+    op.drop_table('archived_expense')
+    op.drop_table('checkpoint_balance')
+    op.drop_index('ix_ledger_checkpoint_group_id', table_name='ledger_checkpoint')
+    op.drop_table('ledger_checkpoint')
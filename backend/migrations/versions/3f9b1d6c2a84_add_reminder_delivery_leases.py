@@ -0,0 +1,29 @@
+"""Add attempts and claim leases to reminder deliveries
+
+Revision ID: 3f9b1d6c2a84
+Revises: 0b6d2e9f4a71
+Create Date: 2026-10-19 21:34:07.215880
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9b1d6c2a84'
+down_revision = '0b6d2e9f4a71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reminder_delivery', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE reminder_delivery SET claimed_at = created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('reminder_delivery', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('attempts')
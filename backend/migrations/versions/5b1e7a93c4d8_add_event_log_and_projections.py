@@ -0,0 +1,67 @@
+"""Add event log and projection tables
+
+Revision ID: 5b1e7a93c4d8
+Revises: 0f9d4c2b7e55
+Create Date: 2026-10-19 13:41:52.807113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e7a93c4d8'
+down_revision = '0f9d4c2b7e55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_event_group_id', 'event', ['group_id'])
+    op.create_table('projection_offset',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('last_event_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('projected_balance',
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('balance_cents', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('group_id', 'user_id')
+    )
+    op.create_table('projected_chore_stats',
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('completed_count', sa.Integer(), nullable=False),
+        sa.Column('on_time_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('group_id', 'user_id')
+    )
+    op.create_table('projected_roster_member',
+        sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=100), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_projected_roster_member_group_id', 'projected_roster_member', ['group_id'])
+
+
+def downgrade():
+    op.drop_index('ix_projected_roster_member_group_id', table_name='projected_roster_member')
+    op.drop_table('projected_roster_member')
+    op.drop_table('projected_chore_stats')
+    op.drop_table('projected_balance')
+    op.drop_table('projection_offset')
+    op.drop_index('ix_event_group_id', table_name='event')
+    op.drop_table('event')
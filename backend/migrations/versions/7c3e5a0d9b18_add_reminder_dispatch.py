@@ -0,0 +1,56 @@
+"""Add device tokens, reminder deliveries and reminder scan indexes
+
+Revision ID: 7c3e5a0d9b18
+Revises: d2b7c91e0f64
+Create Date: 2026-10-19 14:52:11.038466
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e5a0d9b18'
+down_revision = 'd2b7c91e0f64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device_token',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=255), nullable=False),
+        sa.Column('platform', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_seen_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token')
+    )
+    op.create_index('ix_device_token_user_id', 'device_token', ['user_id'])
+    op.create_table('reminder_delivery',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('occurrence', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('kind', 'source_id', 'occurrence', 'user_id', name='uq_reminder_delivery')
+    )
+    op.create_index('ix_calendar_event_reminder_start', 'calendar_event', ['start_time'],
+                    postgresql_where=sa.text('is_reminder'), sqlite_where=sa.text('is_reminder = 1'))
+    op.create_index('ix_chore_due_date_completed', 'chore', ['due_date', 'completed'])
+
+
+def downgrade():
+    op.drop_index('ix_chore_due_date_completed', table_name='chore')
+    op.drop_index('ix_calendar_event_reminder_start', table_name='calendar_event')
+    op.drop_table('reminder_delivery')
+    op.drop_index('ix_device_token_user_id', table_name='device_token')
+    op.drop_table('device_token')
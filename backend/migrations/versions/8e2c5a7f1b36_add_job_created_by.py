@@ -0,0 +1,28 @@
+"""Add created_by to jobs
+
+Revision ID: 8e2c5a7f1b36
+Revises: 3f9b1d6c2a84
+Create Date: 2026-10-19 22:05:41.662093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2c5a7f1b36'
+down_revision = '3f9b1d6c2a84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_by', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_job_created_by_user', 'user', ['created_by'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_job_created_by_user', type_='foreignkey')
+        batch_op.drop_column('created_by')
@@ -0,0 +1,30 @@
+"""Add version columns for optimistic concurrency
+
+Revision ID: 9a6e3f1c8b42
+Revises: c84f2d6e1a37
+Create Date: 2026-10-19 12:41:08.217630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6e3f1c8b42'
+down_revision = 'c84f2d6e1a37'
+branch_labels = None
+depends_on = None
+
+TABLES = ('user', 'chore', 'expense', 'inventory_item')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
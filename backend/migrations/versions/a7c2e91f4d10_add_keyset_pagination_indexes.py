@@ -0,0 +1,32 @@
+"""Add keyset pagination indexes
+
+Revision ID: a7c2e91f4d10
+Revises: 5e27df99c7fb
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e91f4d10'
+down_revision = '5e27df99c7fb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_group_name_id', 'user', ['group_id', 'name', 'id'])
+    op.create_index('ix_expense_group_created_id', 'expense', ['group_id', 'created_at', 'id'])
+    op.create_index('ix_inventory_item_group_created_id', 'inventory_item', ['group_id', 'created_at', 'id'])
+    op.create_index('ix_inventory_item_owner_created_id', 'inventory_item', ['owner_id', 'created_at', 'id'])
+    op.create_index('ix_calendar_event_group_start_id', 'calendar_event', ['group_id', 'start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_calendar_event_group_start_id', table_name='calendar_event')
+    op.drop_index('ix_inventory_item_owner_created_id', table_name='inventory_item')
+    op.drop_index('ix_inventory_item_group_created_id', table_name='inventory_item')
+    op.drop_index('ix_expense_group_created_id', table_name='expense')
+    op.drop_index('ix_user_group_name_id', table_name='user')
@@ -0,0 +1,49 @@
+"""Add chore completion history and stats rollup
+
+Revision ID: c84f2d6e1a37
+Revises: 5b1e7a93c4d8
+Create Date: 2026-10-19 15:08:33.640219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c84f2d6e1a37'
+down_revision = '5b1e7a93c4d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chore_completion',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('chore_id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('due_date', sa.String(length=100), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=False),
+        sa.Column('on_time', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['chore_id'], ['chore.id'], ),
+        sa.ForeignKeyConstraint(['group_id'], ['group.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_chore_completion_chore_id', 'chore_completion', ['chore_id'])
+    op.create_index('ix_chore_completion_group_completed', 'chore_completion', ['group_id', 'completed_at'])
+    op.create_table('chore_stats_rollup',
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('completed_count', sa.Integer(), nullable=False),
+        sa.Column('on_time_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('group_id', 'user_id', 'period_start')
+    )
+
+
+def downgrade():
+    op.drop_table('chore_stats_rollup')
+    op.drop_index('ix_chore_completion_group_completed', table_name='chore_completion')
+    op.drop_index('ix_chore_completion_chore_id', table_name='chore_completion')
+    op.drop_table('chore_completion')
@@ -0,0 +1,36 @@
+"""Add idempotency key records
+
+Revision ID: d2b7c91e0f64
+Revises: 9a6e3f1c8b42
+Create Date: 2026-10-19 13:26:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7c91e0f64'
+down_revision = '9a6e3f1c8b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_record',
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=32), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('body', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'key')
+    )
+    op.create_index('ix_idempotency_record_expires_at', 'idempotency_record', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_record_expires_at', table_name='idempotency_record')
+    op.drop_table('idempotency_record')
@@ -0,0 +1,48 @@
+"""Add outstanding_cents to ExpenseSplit
+
+Revision ID: e3b58d0c6a21
+Revises: a7c2e91f4d10
+Create Date: 2026-10-19 10:03:17.552981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b58d0c6a21'
+down_revision = 'a7c2e91f4d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('expense_split', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('outstanding_cents', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from the payments already linked to each expense. Payments
+    # recorded without an expense_id were never attributed to a split, so they
+    # are not applied here.
+    op.execute("""
+        UPDATE expense_split SET outstanding_cents = CASE
+            WHEN user_id = (SELECT paid_by FROM expense WHERE expense.id = expense_split.expense_id) THEN 0
+            ELSE CAST(ROUND(amount * 100) AS INTEGER) - COALESCE((
+                SELECT CAST(ROUND(SUM(payment.amount) * 100) AS INTEGER) FROM payment
+                JOIN expense ON expense.id = payment.expense_id
+                WHERE payment.expense_id = expense_split.expense_id
+                  AND payment.from_user = expense_split.user_id
+                  AND payment.to_user = expense.paid_by
+            ), 0)
+        END
+    """)
+    op.execute("UPDATE expense_split SET outstanding_cents = 0 WHERE outstanding_cents < 0")
+
+    op.create_index('ix_expense_split_open', 'expense_split', ['user_id', 'expense_id'],
+                    postgresql_where=sa.text('outstanding_cents > 0'),
+                    sqlite_where=sa.text('outstanding_cents > 0'))
+
+
+def downgrade():
+    op.drop_index('ix_expense_split_open', table_name='expense_split')
+    with op.batch_alter_table('expense_split', schema=None) as batch_op:
+        batch_op.drop_column('outstanding_cents')
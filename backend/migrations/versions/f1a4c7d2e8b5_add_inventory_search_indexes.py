@@ -0,0 +1,60 @@
+"""Add inventory search indexes
+
+Revision ID: f1a4c7d2e8b5
+Revises: e5f08a7b2c93
+Create Date: 2026-10-19 19:02:11.427315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a4c7d2e8b5'
+down_revision = 'e5f08a7b2c93'
+branch_labels = None
+depends_on = None
+
+SEARCH_DOCUMENT = ("lower(coalesce(name, '') || ' ' || coalesce(category, '') || ' ' "
+                   "|| coalesce(custom_type, '') || ' ' || coalesce(notes, ''))")
+SEARCH_VECTOR = ("(setweight(to_tsvector('simple', coalesce(name, '')), 'A') "
+                 "|| setweight(to_tsvector('simple', coalesce(category, '') || ' ' || coalesce(custom_type, '')), 'B') "
+                 "|| setweight(to_tsvector('simple', coalesce(notes, '')), 'C'))")
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_item_fts USING fts5("
+    "name, category, custom_type, notes, content='inventory_item', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ai AFTER INSERT ON inventory_item BEGIN "
+    "INSERT INTO inventory_item_fts(rowid, name, category, custom_type, notes) "
+    "VALUES (new.id, new.name, new.category, new.custom_type, new.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ad AFTER DELETE ON inventory_item BEGIN "
+    "INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, category, custom_type, notes) "
+    "VALUES ('delete', old.id, old.name, old.category, old.custom_type, old.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_item_fts_au AFTER UPDATE OF name, category, custom_type, notes "
+    "ON inventory_item BEGIN "
+    "INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, category, custom_type, notes) "
+    "VALUES ('delete', old.id, old.name, old.category, old.custom_type, old.notes); "
+    "INSERT INTO inventory_item_fts(rowid, name, category, custom_type, notes) "
+    "VALUES (new.id, new.name, new.category, new.custom_type, new.notes); END",
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(f'CREATE INDEX ix_inventory_item_search_vector ON inventory_item USING gin ({SEARCH_VECTOR})')
+        op.execute(f'CREATE INDEX ix_inventory_item_search_trgm ON inventory_item '
+                   f'USING gin ({SEARCH_DOCUMENT} gin_trgm_ops)')
+    elif op.get_bind().dialect.name == 'sqlite':
+        for statement in FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO inventory_item_fts(inventory_item_fts) VALUES('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_inventory_item_search_trgm', table_name='inventory_item')
+        op.drop_index('ix_inventory_item_search_vector', table_name='inventory_item')
+    elif op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('inventory_item_fts_au', 'inventory_item_fts_ad', 'inventory_item_fts_ai'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS inventory_item_fts')
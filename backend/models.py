@@ -1,5 +1,6 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy import DDL, event, func, text as sa_text
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class Group(db.Model):
@@ -16,6 +17,13 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True)
     status = db.Column(db.String(50), default='home')  # options: 'home', 'busy', 'away', 'dnd', etc.
+    # Bumped on every ORM update; writes are compare-and-swap on it
+    # (UPDATE ... WHERE version = :v), see concurrency.py.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Keyset pagination indexes: (filter, sort_key, id)
+    __table_args__ = (db.Index('ix_user_group_name_id', 'group_id', 'name', 'id'),)
+    __mapper_args__ = {'version_id_col': version}
 
     
     def set_password(self, password):
@@ -44,6 +52,10 @@ class Chore(db.Model):
     completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (db.Index('ix_chore_due_date_completed', 'due_date', 'completed'),)
+    __mapper_args__ = {'version_id_col': version}
 
 class Expense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -59,16 +71,30 @@ class Expense(db.Model):
     is_recurring = db.Column(db.Boolean, default=False)
     recurrence_type = db.Column(db.String(20))  # 'monthly', 'weekly', etc.
     next_due_date = db.Column(db.Date)  # when the next one should auto-generate
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (db.Index('ix_expense_group_created_id', 'group_id', 'created_at', 'id'),)
+    __mapper_args__ = {'version_id_col': version}
 
 class ExpenseSplit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)  # how much they owe
+    # What is still unpaid on this split, kept current by every payment.
+    # Always 0 for the payer's own share.
+    outstanding_cents = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        # Open splits only: "what do I still owe" never touches settled rows.
+        db.Index('ix_expense_split_open', 'user_id', 'expense_id',
+                 postgresql_where=db.text('outstanding_cents > 0'),
+                 sqlite_where=db.text('outstanding_cents > 0')),
+    )
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
+    expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=True)
     from_user = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     to_user = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
@@ -90,6 +116,64 @@ class InventoryItem(db.Model):
     notes = db.Column(db.Text)  # Optional: "Don’t touch, this expires soon"
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (
+        db.Index('ix_inventory_item_group_created_id', 'group_id', 'created_at', 'id'),
+        db.Index('ix_inventory_item_owner_created_id', 'owner_id', 'created_at', 'id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+# Inventory search (see inventory_search.py). On Postgres: a weighted
+# tsvector for word/prefix matches and a trigram index over the lowercased
+# text for fuzzy matches. Queries must build the same expressions for the
+# indexes to be used, so both come from these functions.
+def inventory_search_document():
+    return func.lower(func.coalesce(InventoryItem.name, '') + ' '
+                      + func.coalesce(InventoryItem.category, '') + ' '
+                      + func.coalesce(InventoryItem.custom_type, '') + ' '
+                      + func.coalesce(InventoryItem.notes, ''))
+
+
+def inventory_search_vector():
+    def weighted(text, weight):
+        return func.setweight(func.to_tsvector(sa_text("'simple'"), text), weight)
+    return weighted(func.coalesce(InventoryItem.name, ''), 'A') \
+        .op('||')(weighted(func.coalesce(InventoryItem.category, '') + ' '
+                           + func.coalesce(InventoryItem.custom_type, ''), 'B')) \
+        .op('||')(weighted(func.coalesce(InventoryItem.notes, ''), 'C'))
+
+
+db.Index('ix_inventory_item_search_vector', inventory_search_vector(),
+         postgresql_using='gin').ddl_if(dialect='postgresql')
+db.Index('ix_inventory_item_search_trgm', inventory_search_document().label('search_document'),
+         postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+# On SQLite: an external-content FTS5 table with prefix indexes, kept in
+# sync with inventory_item by triggers. Quantity and version changes don't
+# touch it.
+INVENTORY_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_item_fts USING fts5("
+    "name, category, custom_type, notes, content='inventory_item', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ai AFTER INSERT ON inventory_item BEGIN "
+    "INSERT INTO inventory_item_fts(rowid, name, category, custom_type, notes) "
+    "VALUES (new.id, new.name, new.category, new.custom_type, new.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_item_fts_ad AFTER DELETE ON inventory_item BEGIN "
+    "INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, category, custom_type, notes) "
+    "VALUES ('delete', old.id, old.name, old.category, old.custom_type, old.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_item_fts_au AFTER UPDATE OF name, category, custom_type, notes "
+    "ON inventory_item BEGIN "
+    "INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, category, custom_type, notes) "
+    "VALUES ('delete', old.id, old.name, old.category, old.custom_type, old.notes); "
+    "INSERT INTO inventory_item_fts(rowid, name, category, custom_type, notes) "
+    "VALUES (new.id, new.name, new.category, new.custom_type, new.notes); END",
+]
+for statement in INVENTORY_FTS_DDL:
+    event.listen(InventoryItem.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(InventoryItem.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS inventory_item_fts').execute_if(dialect='sqlite'))
 
 class CalendarEvent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -102,3 +186,191 @@ class CalendarEvent(db.Model):
     is_all_day = db.Column(db.Boolean, default=False)
     is_reminder = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_calendar_event_group_start_id', 'group_id', 'start_time', 'id'),
+        # Reminder dispatch scans a start_time window over reminders only.
+        db.Index('ix_calendar_event_reminder_start', 'start_time',
+                 postgresql_where=db.text('is_reminder'), sqlite_where=db.text('is_reminder = 1')),
+    )
+
+# Per-group balance snapshot: a user's balance is their CheckpointBalance plus
+# every expense/payment with an id above the checkpoint's watermarks.
+class LedgerCheckpoint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False, index=True)
+    last_expense_id = db.Column(db.Integer, nullable=False, default=0)
+    last_payment_id = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    balances = db.relationship('CheckpointBalance', backref='checkpoint', lazy=True, cascade='all, delete-orphan')
+
+class CheckpointBalance(db.Model):
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('ledger_checkpoint.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    balance_cents = db.Column(db.Integer, nullable=False, default=0)
+
+# Archive tables for fully settled history moved out of the hot ledger. Rows
+# keep their original ids so exports and references stay stable.
+class ArchivedExpense(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    group_id = db.Column(db.Integer, nullable=False, index=True)
+    paid_by = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ArchivedExpenseSplit(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    expense_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+
+class ArchivedPayment(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    expense_id = db.Column(db.Integer, nullable=True)
+    from_user = db.Column(db.Integer, nullable=False)
+    to_user = db.Column(db.Integer, nullable=False)
+    group_id = db.Column(db.Integer, nullable=False, index=True)
+    amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Append-only log of every mutation, written in the same transaction as the
+# change itself. The id doubles as the log offset for projections.
+class Event(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)  # e.g. 'chore.completed', 'expense.created'
+    group_id = db.Column(db.Integer, nullable=True, index=True)
+    user_id = db.Column(db.Integer, nullable=True)  # who made the change
+    entity_id = db.Column(db.Integer, nullable=True)  # id of the row the event is about
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# How far each projection has consumed the event log.
+class ProjectionOffset(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Read models rebuilt from the event log.
+class ProjectedBalance(db.Model):
+    group_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    balance_cents = db.Column(db.Integer, nullable=False, default=0)
+
+class ProjectedChoreStats(db.Model):
+    group_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    on_time_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ProjectedRosterMember(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    group_id = db.Column(db.Integer, nullable=True, index=True)
+    name = db.Column(db.String(100))
+    status = db.Column(db.String(50))
+
+# One row per chore completion, kept even when a recurring chore rolls over.
+class ChoreCompletion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    chore_id = db.Column(db.Integer, db.ForeignKey('chore.id'), nullable=False, index=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    due_date = db.Column(db.String(100), nullable=True)  # the due date that was met (YYYY-MM-DD)
+    completed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    on_time = db.Column(db.Boolean, nullable=False, default=True)
+
+    __table_args__ = (db.Index('ix_chore_completion_group_completed', 'group_id', 'completed_at'),)
+
+# Completions per group, user and week (period_start is the Monday), updated
+# with every completion so stats never scan ChoreCompletion.
+class ChoreStatsRollup(db.Model):
+    group_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    on_time_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Running inventory totals per group, category ('' when uncategorized) and
+# shared flag, kept current by inventory_rollups.py on every inventory write.
+# low_since is set while total_quantity is at or below low_stock_threshold.
+class InventoryRollup(db.Model):
+    group_id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    is_shared = db.Column(db.Boolean, primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    low_stock_threshold = db.Column(db.Integer, nullable=True)
+    low_since = db.Column(db.DateTime, nullable=True)
+
+# Stored response for an Idempotency-Key, per caller (scope is the JWT
+# identity, 'ip:<address>' when anonymous). status_code is NULL while the
+# first request with the key is still running.
+class IdempotencyRecord(db.Model):
+    scope = db.Column(db.String(64), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(32), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Expo push tokens registered by a user's devices.
+class DeviceToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    token = db.Column(db.String(255), unique=True, nullable=False)
+    platform = db.Column(db.String(20), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# One row per reminder per recipient. The unique key makes claiming a
+# reminder atomic, so it is sent at most once even across restarts or with
+# several dispatchers. occurrence is the start time or due date it was for.
+class ReminderDelivery(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'calendar' or 'chore'
+    source_id = db.Column(db.Integer, nullable=False)
+    occurrence = db.Column(db.String(32), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # 'sending', 'sent', 'failed', 'no_device'
+    error = db.Column(db.String(255), nullable=True)
+    # Sends so far, and when the latest one was claimed (its lease start).
+    attempts = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.UniqueConstraint('kind', 'source_id', 'occurrence', 'user_id',
+                                          name='uq_reminder_delivery'),)
+
+# Background work, claimed by `flask jobs worker`. run_at is when the job is
+# next eligible (later after a failed attempt); duration_ms is the last run.
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    # The user who queued it, the only one who can read it over the API;
+    # NULL for scheduled and CLI jobs.
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+# When each cron schedule next fires; advanced with a compare-and-swap so
+# only one worker enqueues each run.
+class JobSchedule(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False)
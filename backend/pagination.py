@@ -0,0 +1,102 @@
+import base64, json
+from datetime import datetime
+
+from flask import request, jsonify
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+# Cursors are opaque to clients: a base64url-encoded JSON pair of the last
+# row's (sort_key, id). Datetimes are tagged so they round-trip exactly.
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = {'dt': sort_value.isoformat()}
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+        return sort_value, int(row_id)
+    except (ValueError, TypeError, KeyError):
+        raise PaginationError('Invalid cursor')
+
+
+def _limit_arg():
+    limit = request.args.get('limit')
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+# Keyset-paginate an ORM query on (sort_column, id_column) using the request's
+# ?limit= and ?cursor= arguments. Each page seeks straight past the previous
+# page's last row, so deep pages cost the same as the first one.
+#
+# Requests without limit/cursor get the full, ordered result so existing
+# clients keep working; the cursor for the next page is None when there are no
+# more rows.
+def keyset_page(query, sort_column, id_column, descending=False):
+    limit = _limit_arg()
+    cursor = request.args.get('cursor')
+
+    # NULL sort keys order after every value, as in a Postgres b-tree (so
+    # the same index serves both directions): last ascending, first
+    # descending. The seek predicates below follow the same rule.
+    if descending:
+        query = query.order_by(sort_column.desc().nulls_first(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc().nulls_last(), id_column.asc())
+
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        if descending and sort_value is None:
+            query = query.filter(or_(sort_column.isnot(None),
+                                     and_(sort_column.is_(None), id_column < last_id)))
+        elif descending:
+            query = query.filter(or_(sort_column < sort_value,
+                                     and_(sort_column == sort_value, id_column < last_id)))
+        elif sort_value is None:
+            query = query.filter(and_(sort_column.is_(None), id_column > last_id))
+        else:
+            query = query.filter(or_(sort_column > sort_value,
+                                     and_(sort_column == sort_value, id_column > last_id),
+                                     sort_column.is_(None)))
+
+    if limit is None and not cursor:
+        return query.all(), None
+
+    limit = limit or DEFAULT_LIMIT
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+
+# jsonify the payload and expose the next page's cursor in a header, leaving
+# the body shape of each endpoint unchanged.
+def paged_response(payload, next_cursor, status=200):
+    response = jsonify(payload)
+    response.status_code = status
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
@@ -0,0 +1,177 @@
+import cProfile, hmac, os, pstats, random, re, time
+from datetime import datetime
+
+from flask import Blueprint, current_app, g, jsonify, request, send_from_directory
+
+# Profiles a sample of requests (PROFILER_SAMPLE_RATE, 0-1) plus any request
+# carrying PROFILE_HEADER with the PROFILER_TOKEN secret, and keeps the newest
+# PROFILER_KEEP profiles per endpoint under PROFILER_DIR as .prof files
+# (readable with pstats or snakeviz). The admin endpoints below take the same
+# header.
+PROFILE_HEADER = 'X-Profile-Token'
+DEFAULT_KEEP = 20
+DEFAULT_TOP = 30
+MAX_AGGREGATED = 200
+SORT_KEYS = {'cumulative': 5, 'tottime': 4, 'ncalls': 3}  # index into aggregate()'s rows
+
+profiling = Blueprint('profiling', __name__, url_prefix='/admin/profiles')
+
+# <timestamp>-<METHOD>-<status>-<ms>ms.prof
+FILENAME = re.compile(r'^(\d{8}T\d{6}\.\d{6})-([A-Z]+)-(\d{3})-(\d+)ms\.prof$')
+
+
+def _authorized():
+    token = current_app.config.get('PROFILER_TOKEN')
+    supplied = request.headers.get(PROFILE_HEADER)
+    return bool(token and supplied) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _profile_dir():
+    return current_app.config.get('PROFILER_DIR') or os.path.join(current_app.instance_path, 'profiles')
+
+
+def _endpoint_dir(endpoint):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)
+
+
+def start_profile():
+    if request.endpoint is None or request.blueprint == 'profiling':
+        return
+    rate = current_app.config.get('PROFILER_SAMPLE_RATE', 0)
+    if not (_authorized() or (rate and random.random() < rate)):
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # another profiler is active on this interpreter
+        return
+    g.profile = (profile, time.perf_counter())
+
+
+def save_profile(response):
+    pending = g.pop('profile', None)
+    if pending is None:
+        return response
+    profile, started = pending
+    profile.disable()
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+
+    directory = os.path.join(_profile_dir(), _endpoint_dir(request.endpoint))
+    os.makedirs(directory, exist_ok=True)
+    name = f'{datetime.utcnow():%Y%m%dT%H%M%S.%f}-{request.method}-{response.status_code}-{elapsed_ms}ms.prof'
+    profile.dump_stats(os.path.join(directory, name))
+    _rotate(directory, current_app.config.get('PROFILER_KEEP', DEFAULT_KEEP))
+    return response
+
+
+# Profiles started by a request that then raised never reach after_request.
+def discard_profile(exc):
+    pending = g.pop('profile', None)
+    if pending is not None:
+        pending[0].disable()
+
+
+def _rotate(directory, keep):
+    names = sorted(n for n in os.listdir(directory) if FILENAME.match(n))
+    for name in names[:-keep] if keep else names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:  # removed by a concurrent rotation
+            pass
+
+
+# Stored profiles as dicts, newest first, optionally for one endpoint.
+def list_profiles(root, endpoint=None):
+    if not os.path.isdir(root):
+        return []
+    endpoints = [_endpoint_dir(endpoint)] if endpoint else sorted(os.listdir(root))
+    profiles = []
+    for name in endpoints:
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            match = FILENAME.match(filename)
+            if match:
+                stamp, method, status, ms = match.groups()
+                profiles.append({
+                    'endpoint': name, 'file': filename, 'method': method, 'status': int(status),
+                    'duration_ms': int(ms),
+                    'created_at': datetime.strptime(stamp, '%Y%m%dT%H%M%S.%f').isoformat(),
+                })
+    profiles.sort(key=lambda p: p['created_at'], reverse=True)
+    return profiles
+
+
+# Merge profiles and return the top functions by `sort`.
+def aggregate(root, profiles, sort='cumulative', top=DEFAULT_TOP):
+    if not profiles:
+        return []
+    paths = [os.path.join(root, p['endpoint'], p['file']) for p in profiles]
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    index = SORT_KEYS[sort]
+    rows = []
+    for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append((function, filename, line, ncalls, tottime, cumtime))
+    rows.sort(key=lambda r: r[index], reverse=True)
+    return [{'function': function, 'file': filename, 'line': line, 'ncalls': ncalls,
+             'tottime_ms': round(tottime * 1000, 3), 'cumtime_ms': round(cumtime * 1000, 3)}
+            for function, filename, line, ncalls, tottime, cumtime in rows[:top]]
+
+
+@profiling.before_request
+def require_token():
+    if not current_app.config.get('PROFILER_TOKEN'):
+        return jsonify({'error': 'Profiling is not enabled'}), 404
+    if not _authorized():
+        return jsonify({'error': f'A valid {PROFILE_HEADER} header is required'}), 403
+
+
+@profiling.route('', methods=['GET'])
+def recent_profiles():
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(list_profiles(_profile_dir(), request.args.get('endpoint'))[:max(limit, 0)])
+
+
+# Time by function across the newest `limit` profiles (of one endpoint if
+# given), e.g. ?endpoint=routes.complete_chore&sort=tottime&top=20
+@profiling.route('/aggregate', methods=['GET'])
+def aggregate_profiles():
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return jsonify({'error': f'sort must be one of {", ".join(SORT_KEYS)}'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 50)), MAX_AGGREGATED)
+        top = int(request.args.get('top', DEFAULT_TOP))
+    except ValueError:
+        return jsonify({'error': 'limit and top must be integers'}), 400
+    root = _profile_dir()
+    profiles = list_profiles(root, request.args.get('endpoint'))[:max(limit, 0)]
+    return jsonify({'profiles': len(profiles), 'sort': sort,
+                    'total_ms': sum(p['duration_ms'] for p in profiles),
+                    'functions': aggregate(root, profiles, sort, top)})
+
+
+# The raw .prof file, for pstats/snakeviz.
+@profiling.route('/<endpoint>/<filename>', methods=['GET'])
+def download_profile(endpoint, filename):
+    if not FILENAME.match(filename):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(os.path.join(_profile_dir(), _endpoint_dir(endpoint)), filename,
+                               mimetype='application/octet-stream', as_attachment=True)
+
+
+# Registered after the other hooks, so a profile covers the view itself but
+# not rate limiting, idempotency lookups or response compression.
+def init_profiling(app):
+    app.register_blueprint(profiling)
+    if not (app.config.get('PROFILER_SAMPLE_RATE') or app.config.get('PROFILER_TOKEN')):
+        return
+    app.before_request(start_profile)
+    app.after_request(save_profile)
+    app.teardown_request(discard_profile)
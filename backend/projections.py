@@ -0,0 +1,219 @@
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, select, update
+
+from extensions import db
+from models import Event, ProjectionOffset, ProjectedBalance, ProjectedChoreStats, ProjectedRosterMember
+from events import event_payload
+
+BATCH_SIZE = 1000
+# Event ids come from a sequence, so on Postgres a transaction can commit id N
+# after N+1 is already visible. A gap in the ids is only treated as a
+# rolled-back insert once the event after it is this old; until then the run
+# stops in front of it.
+GAP_TIMEOUT = 60
+
+
+# A projection folds events into a read model. apply() accumulates changes in
+# memory for one batch of events and flush() writes them, so each batch costs
+# one statement per touched row rather than per event.
+class Projection(ABC):
+    name = None
+    model = None
+    handles = ()
+
+    def reset(self):
+        db.session.execute(delete(self.model))
+
+    @abstractmethod
+    def apply(self, event, payload):
+        pass
+
+    @abstractmethod
+    def flush(self):
+        pass
+
+
+def _upsert(model, key, values, increment=False):
+    # UPDATE first and INSERT only for rows that don't exist yet; read models
+    # are small and mostly already present.
+    where = [getattr(model, k) == v for k, v in key.items()]
+    if increment:
+        changes = {c: getattr(model, c) + d for c, d in values.items()}
+    else:
+        changes = values
+    if db.session.execute(update(model).where(*where).values(changes)).rowcount == 0:
+        db.session.execute(insert(model).values({**key, **values}))
+
+
+class BalanceProjection(Projection):
+    name = 'balances'
+    model = ProjectedBalance
+    handles = ('expense.created', 'payment.recorded')
+
+    def __init__(self):
+        self.deltas = defaultdict(int)
+
+    def apply(self, event, payload):
+        group_id = event.group_id
+        if event.type == 'expense.created':
+            self.deltas[(group_id, payload['paid_by'])] += payload['amount_cents']
+            for user_id, cents in payload['splits']:
+                self.deltas[(group_id, user_id)] -= cents
+        else:
+            self.deltas[(group_id, payload['from_user'])] += payload['amount_cents']
+            self.deltas[(group_id, payload['to_user'])] -= payload['amount_cents']
+
+    def flush(self):
+        for (group_id, user_id), cents in self.deltas.items():
+            if cents:
+                _upsert(ProjectedBalance, {'group_id': group_id, 'user_id': user_id},
+                        {'balance_cents': cents}, increment=True)
+        self.deltas.clear()
+
+
+class ChoreStatsProjection(Projection):
+    name = 'chore_stats'
+    model = ProjectedChoreStats
+    handles = ('chore.completed',)
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0])
+
+    def apply(self, event, payload):
+        counts = self.deltas[(event.group_id, payload['completed_by'])]
+        counts[0] += 1
+        counts[1] += 1 if payload.get('on_time') else 0
+
+    def flush(self):
+        for (group_id, user_id), (completed, on_time) in self.deltas.items():
+            _upsert(ProjectedChoreStats, {'group_id': group_id, 'user_id': user_id},
+                    {'completed_count': completed, 'on_time_count': on_time}, increment=True)
+        self.deltas.clear()
+
+
+class RosterProjection(Projection):
+    name = 'roster'
+    model = ProjectedRosterMember
+    handles = ('user.registered', 'group.created', 'group.joined', 'user.status_changed')
+
+    def __init__(self):
+        self.members = defaultdict(dict)
+
+    def apply(self, event, payload):
+        member = self.members[event.user_id]
+        if event.type == 'user.registered':
+            member.update(name=payload['name'], status=payload.get('status', 'home'))
+        elif event.type == 'user.status_changed':
+            member['status'] = payload['status']
+        else:
+            member['group_id'] = event.group_id
+
+    def flush(self):
+        for user_id, values in self.members.items():
+            _upsert(ProjectedRosterMember, {'user_id': user_id}, values)
+        self.members.clear()
+
+
+PROJECTIONS = {p.name: p for p in (BalanceProjection, ChoreStatsProjection, RosterProjection)}
+
+
+# The leading events of `events` (ordered by id, all after `after_id`) that
+# are safe to apply: everything before the first gap that is still younger
+# than gap_timeout.
+def settled_events(events, after_id, gap_timeout, now):
+    expected = after_id + 1
+    for i, event in enumerate(events):
+        if event.id != expected and event.created_at and event.created_at > now - timedelta(seconds=gap_timeout):
+            return events[:i]
+        expected = event.id + 1
+    return events
+
+
+# Feed every event after each projection's stored offset through it, one batch
+# per transaction, advancing the offsets with the read-model writes. With
+# rebuild=True the read models are cleared and replayed from the first event.
+# Stops early in front of a recent id gap (see GAP_TIMEOUT); the next run
+# picks up from there. Returns (events processed, seconds elapsed).
+def run_projections(names=None, rebuild=False, batch_size=BATCH_SIZE, gap_timeout=GAP_TIMEOUT):
+    projections = [PROJECTIONS[name]() for name in (names or PROJECTIONS)]
+    offsets = {}
+    for projection in projections:
+        row = db.session.get(ProjectionOffset, projection.name)
+        if row is None:
+            row = ProjectionOffset(name=projection.name, last_event_id=0)
+            db.session.add(row)
+        if rebuild:
+            projection.reset()
+            row.last_event_id = 0
+        offsets[projection.name] = row
+    db.session.commit()
+
+    last_id = min(row.last_event_id for row in offsets.values())
+    processed = 0
+    started = time.perf_counter()
+    while True:
+        events = db.session.execute(
+            select(Event.id, Event.type, Event.group_id, Event.user_id, Event.entity_id, Event.payload,
+                   Event.created_at)
+            .where(Event.id > last_id).order_by(Event.id).limit(batch_size)
+        ).all()
+        events = settled_events(events, last_id, gap_timeout, datetime.utcnow())
+        if not events:
+            break
+
+        for event in events:
+            payload = None
+            for projection in projections:
+                if event.type in projection.handles and event.id > offsets[projection.name].last_event_id:
+                    if payload is None:
+                        payload = event_payload(event)
+                    projection.apply(event, payload)
+
+        last_id = events[-1].id
+        for projection in projections:
+            projection.flush()
+            row = offsets[projection.name]
+            row.last_event_id = max(row.last_event_id, last_id)
+            row.updated_at = datetime.utcnow()
+        db.session.commit()
+        processed += len(events)
+
+    return processed, time.perf_counter() - started
+
+
+@click.group('projections')
+def projections_cli():
+    """Maintain read models derived from the event log."""
+
+
+def _report(processed, elapsed):
+    rate = processed / elapsed if elapsed else 0
+    click.echo(f'{processed} events in {elapsed:.2f}s ({rate:,.0f} events/s)')
+
+
+@projections_cli.command('run')
+@click.option('--only', multiple=True, type=click.Choice(sorted(PROJECTIONS)), help='Projection(s) to run.')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True)
+@click.option('--gap-timeout', type=int, default=GAP_TIMEOUT, show_default=True,
+              help='Seconds before a gap in event ids is treated as a rolled-back insert.')
+@with_appcontext
+def run_command(only, batch_size, gap_timeout):
+    """Apply events recorded since each projection's stored offset."""
+    _report(*run_projections(only or None, batch_size=batch_size, gap_timeout=gap_timeout))
+
+
+@projections_cli.command('replay')
+@click.option('--only', multiple=True, type=click.Choice(sorted(PROJECTIONS)), help='Projection(s) to rebuild.')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True)
+@click.option('--gap-timeout', type=int, default=GAP_TIMEOUT, show_default=True,
+              help='Seconds before a gap in event ids is treated as a rolled-back insert.')
+@with_appcontext
+def replay_command(only, batch_size, gap_timeout):
+    """Clear the read models and rebuild them from the first event."""
+    _report(*run_projections(only or None, rebuild=True, batch_size=batch_size, gap_timeout=gap_timeout))
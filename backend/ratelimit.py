@@ -0,0 +1,222 @@
+import math, threading, time
+
+from flask import current_app, g, jsonify, request
+
+try:
+    import redis
+except ImportError:  # only needed for a shared backend across processes
+    redis = None
+
+from extensions import db
+from identity import request_identity
+from models import User
+
+# (burst capacity, tokens refilled per second)
+DEFAULT_USER_LIMIT = (60, 10)
+DEFAULT_GROUP_LIMIT = (200, 30)
+# Requests handled at once by this process before new ones are shed.
+DEFAULT_MAX_CONCURRENT = 64
+# Memory buckets are pruned once there are more than this many.
+MAX_MEMORY_KEYS = 100000
+# How long a caller's group membership is trusted before it is re-read.
+MEMBERSHIP_TTL = 30
+
+# Tokens per request by endpoint; anything not listed costs 1. The aggregate
+# reads scan a whole group's ledger or roster, so they cost more than /me.
+ROUTE_COSTS = {
+    'routes.list_group_users_with_chores': 3,
+    'routes.chore_stats': 3,
+    'routes.rotate_chores': 5,
+    'routes.bulk_complete_chores': 5,
+    'routes.bulk_update_chores': 5,
+    'expense_routes.my_expense_history': 5,
+    'expense_routes.group_summary': 5,
+    'expense_routes.get_balances': 3,
+    'expense_routes.expense_history': 3,
+    'expense_routes.export_ledger': 10,
+    'expense_routes.import_expenses': 10,
+    'expense_routes.generate_recurring_expenses': 10,
+    'expense_routes.search_inventory': 3,
+    'async_reads.balances': 3,
+    'async_reads.dashboard': 5,
+    'profiling.aggregate_profiles': 10,
+}
+
+
+class MemoryBackend:
+    # Token buckets for this process only.
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    # buckets: [(key, capacity, rate)]. Takes `cost` from every bucket or from
+    # none. Returns 0 when allowed, else the seconds until it would be.
+    def take(self, buckets, cost, now):
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels.append(tokens)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+            spent = 0 if wait else cost
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - spent, now)
+            if len(self._buckets) > MAX_MEMORY_KEYS:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # Idle buckets have refilled; dropping them loses nothing. The rate
+        # isn't stored, so anything untouched for a minute is treated as full.
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 60}
+
+
+# Same all-or-nothing take as MemoryBackend, run atomically inside Redis.
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + 2 * i])
+    local rate = tonumber(ARGV[2 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then wait = math.max(wait, (cost - tokens) / rate) end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + 2 * i])
+    local rate = tonumber(ARGV[2 + 2 * i])
+    local tokens = levels[i]
+    if wait == 0 then tokens = tokens - cost end
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    # Buckets shared by every worker process.
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('RATELIMIT_BACKEND is a Redis URL but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, buckets, cost, now):
+        args = [now, cost]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        return float(self._take(keys=[self.prefix + key for key, _, _ in buckets], args=args))
+
+
+def make_backend(url=None):
+    if not url or url == 'memory':
+        return MemoryBackend()
+    return RedisBackend(url)
+
+
+class RateLimiter:
+    def __init__(self, backend, user_limit=DEFAULT_USER_LIMIT, group_limit=DEFAULT_GROUP_LIMIT,
+                 costs=None, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.backend = backend
+        self.user_limit = user_limit
+        self.group_limit = group_limit
+        self.costs = ROUTE_COSTS if costs is None else costs
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    # Whether the caller belongs to group_id, so only a group's own members
+    # spend from its bucket. Memberships are cached briefly per identity.
+    def is_member(self, identity, group_id):
+        if identity is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            entry = self._groups.get(identity)
+        if entry is None or entry[0] <= now:
+            member_of = db.session.scalar(db.select(User.group_id).where(User.id == identity))
+            entry = (now + MEMBERSHIP_TTL, member_of)
+            with self._lock:
+                if len(self._groups) > MAX_MEMORY_KEYS:
+                    self._groups = {k: v for k, v in self._groups.items() if v[0] > now}
+                self._groups[identity] = entry
+        return entry[1] is not None and str(entry[1]) == str(group_id)
+
+    def cost(self, endpoint):
+        return self.costs.get(endpoint, 1)
+
+    # One bucket for the caller (JWT identity, or address when anonymous) and
+    # one for the group named in the URL, if any and the caller is a member.
+    def buckets(self, identity, group_id):
+        capacity, rate = self.user_limit
+        buckets = [(f'user:{identity}' if identity is not None else f'ip:{request.remote_addr}',
+                    capacity, rate)]
+        if group_id is not None:
+            capacity, rate = self.group_limit
+            buckets.append((f'group:{group_id}', capacity, rate))
+        return buckets
+
+    def acquire_slot(self):
+        return self._slots is None or self._slots.acquire(blocking=False)
+
+    def release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+
+def _rejection(message, status, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def check_limits():
+    limiter = current_app.extensions['ratelimit']
+    if request.method == 'OPTIONS' or request.endpoint in (None, 'static'):
+        return None
+
+    # Shed load before doing any work at all.
+    if not limiter.acquire_slot():
+        return _rejection('Server is busy, retry shortly', 503, 1)
+    g.ratelimit_slot = True
+
+    identity = request_identity()
+    group_id = (request.view_args or {}).get('group_id', request.args.get('group_id'))
+    if group_id is not None and not limiter.is_member(identity, group_id):
+        group_id = None
+    buckets = limiter.buckets(identity, group_id)
+    cost = min(limiter.cost(request.endpoint), *(capacity for _, capacity, _ in buckets))
+    wait = limiter.backend.take(buckets, cost, time.time())
+    if wait:
+        return _rejection('Rate limit exceeded', 429, wait)
+    return None
+
+
+def release_slot(exc):
+    if g.pop('ratelimit_slot', False):
+        current_app.extensions['ratelimit'].release_slot()
+
+
+# Registered before idempotency so a rejected request never claims its key.
+def init_rate_limits(app):
+    if not app.config.get('RATELIMIT_ENABLED', True):
+        return
+    app.extensions['ratelimit'] = RateLimiter(
+        make_backend(app.config.get('RATELIMIT_BACKEND')),
+        user_limit=app.config.get('RATELIMIT_USER', DEFAULT_USER_LIMIT),
+        group_limit=app.config.get('RATELIMIT_GROUP', DEFAULT_GROUP_LIMIT),
+        max_concurrent=app.config.get('MAX_CONCURRENT_REQUESTS', DEFAULT_MAX_CONCURRENT),
+    )
+    app.before_request(check_limits)
+    app.teardown_request(release_slot)
@@ -0,0 +1,226 @@
+import json, time, urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, exists, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import CalendarEvent, Chore, DeviceToken, ReminderDelivery, User
+
+EXPO_PUSH_URL = 'https://exp.host/--/api/v2/push/send'
+# Calendar reminders go out this long before the event starts...
+CALENDAR_LEAD = timedelta(minutes=15)
+# ...and are still sent late if the dispatcher was down for up to this long.
+CALENDAR_GRACE = timedelta(hours=1)
+# Expo accepts at most 100 messages per request.
+PUSH_BATCH = 100
+DEFAULT_INTERVAL = 60
+# A delivery left in 'sending' (dispatcher crashed or hung mid-send) can be
+# claimed again once its lease is this old; a 'failed' one after
+# RETRY_DELAY. Either way a reminder gets at most MAX_ATTEMPTS sends.
+SEND_LEASE = timedelta(minutes=5)
+RETRY_DELAY = timedelta(minutes=2)
+MAX_ATTEMPTS = 5
+
+
+class ExpoSender:
+    # Sends through Expo's push API; one HTTP request per batch of messages.
+    def __init__(self, url=EXPO_PUSH_URL, access_token=None, timeout=10):
+        self.url = url
+        self.access_token = access_token
+        self.timeout = timeout
+
+    def send(self, messages):
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if self.access_token:
+            headers['Authorization'] = f'Bearer {self.access_token}'
+        req = urllib.request.Request(self.url, data=json.dumps(messages).encode(), headers=headers, method='POST')
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.load(resp)['data']
+
+
+class StubSender:
+    # Records messages instead of sending them, for local runs and tests.
+    def __init__(self):
+        self.sent = []
+        self.requests = 0
+
+    def send(self, messages):
+        self.requests += 1
+        self.sent.extend(messages)
+        return [{'status': 'ok'} for _ in messages]
+
+
+def make_sender(name=None):
+    name = name or current_app.config.get('PUSH_SENDER', 'expo')
+    if name == 'stub':
+        return StubSender()
+    if name == 'expo':
+        return ExpoSender(access_token=current_app.config.get('EXPO_ACCESS_TOKEN'))
+    raise ValueError(f'Unknown push sender: {name}')
+
+
+# Deliveries that may be claimed again: a retry of a failure, or a send whose
+# lease ran out, within the attempt budget.
+def _reclaimable(now):
+    return and_(ReminderDelivery.attempts < MAX_ATTEMPTS, or_(
+        and_(ReminderDelivery.status == 'sending', ReminderDelivery.claimed_at <= now - SEND_LEASE),
+        and_(ReminderDelivery.status == 'failed', ReminderDelivery.claimed_at <= now - RETRY_DELAY)))
+
+
+# Candidate reminders as (kind, source_id, occurrence, user_id, title, body).
+# Both scans are bounded index range queries and skip anything claimed and
+# not yet reclaimable; the unique key on ReminderDelivery is what actually
+# guarantees a single claim.
+def due_reminders(now):
+    due = []
+    events = db.session.query(CalendarEvent.id, CalendarEvent.title, CalendarEvent.start_time, User.id) \
+        .join(User, User.group_id == CalendarEvent.group_id) \
+        .filter(CalendarEvent.is_reminder,
+                CalendarEvent.start_time > now - CALENDAR_GRACE,
+                CalendarEvent.start_time <= now + CALENDAR_LEAD,
+                ~exists().where(ReminderDelivery.kind == 'calendar',
+                                ReminderDelivery.source_id == CalendarEvent.id,
+                                ReminderDelivery.user_id == User.id,
+                                ~_reclaimable(now)))
+    for event_id, title, start_time, user_id in events:
+        due.append(('calendar', event_id, start_time.isoformat(), user_id,
+                    title, f'Starts at {start_time:%H:%M}'))
+
+    chores = db.session.query(Chore.id, Chore.name, Chore.due_date, Chore.assigned_to) \
+        .filter(Chore.due_date == now.strftime('%Y-%m-%d'),
+                Chore.completed.isnot(True),
+                Chore.assigned_to.isnot(None),
+                ~exists().where(ReminderDelivery.kind == 'chore',
+                                ReminderDelivery.source_id == Chore.id,
+                                ReminderDelivery.occurrence == Chore.due_date,
+                                ReminderDelivery.user_id == Chore.assigned_to,
+                                ~_reclaimable(now)))
+    for chore_id, name, due_date, user_id in chores:
+        due.append(('chore', chore_id, due_date, user_id, name, 'Due today'))
+    return due
+
+
+# Insert delivery rows for the candidates, or take over reclaimable ones,
+# skipping any another dispatcher (or an earlier run) holds. The upsert's
+# WHERE makes a re-claim a compare-and-swap. Returns the keys this run now
+# owns.
+def _claim(candidates, now):
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(ReminderDelivery).values([
+        {'kind': kind, 'source_id': source_id, 'occurrence': occurrence, 'user_id': user_id,
+         'status': 'sending', 'attempts': 1, 'created_at': now, 'claimed_at': now}
+        for kind, source_id, occurrence, user_id, _, _ in candidates
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['kind', 'source_id', 'occurrence', 'user_id'],
+        set_={'status': 'sending', 'attempts': ReminderDelivery.attempts + 1, 'claimed_at': now, 'error': None},
+        where=_reclaimable(now),
+    ).returning(
+        ReminderDelivery.id, ReminderDelivery.kind, ReminderDelivery.source_id,
+        ReminderDelivery.occurrence, ReminderDelivery.user_id)
+    claimed = {(kind, source_id, occurrence, user_id): delivery_id
+               for delivery_id, kind, source_id, occurrence, user_id in db.session.execute(stmt)}
+    # Committed before sending, so two dispatchers never send the same
+    # reminder at once. A crash after the send but before the outcome is
+    # recorded is the one case that sends twice: the lease expires and the
+    # reminder is retried.
+    db.session.commit()
+    return claimed
+
+
+# One notification per device token, however many reminders its user has due.
+def _build_messages(reminders, tokens):
+    messages = []
+    for user_id, items in reminders.items():
+        if len(items) == 1:
+            title, body = items[0][1], items[0][2]
+        else:
+            title, body = f'{len(items)} reminders', '; '.join(item[1] for item in items)
+        data = {'reminders': [{'kind': kind, 'id': source_id} for (kind, source_id), _, _, _ in items]}
+        for token in tokens.get(user_id, ()):
+            messages.append(({'to': token, 'sound': 'default', 'title': title, 'body': body, 'data': data},
+                             [item[3] for item in items]))
+    return messages
+
+
+# Claim every due reminder, push them in batched requests and record the
+# outcome per delivery. Returns counts for logging.
+def dispatch_reminders(sender, now=None):
+    now = now or datetime.utcnow()
+    stats = {'claimed': 0, 'messages': 0, 'requests': 0, 'sent': 0, 'failed': 0, 'no_device': 0}
+    candidates = due_reminders(now)
+    if not candidates:
+        return stats
+    claimed = _claim(candidates, now)
+    stats['claimed'] = len(claimed)
+    if not claimed:
+        return stats
+
+    reminders = defaultdict(list)
+    for kind, source_id, occurrence, user_id, title, body in candidates:
+        delivery_id = claimed.get((kind, source_id, occurrence, user_id))
+        if delivery_id is not None:
+            reminders[user_id].append(((kind, source_id), title, body, delivery_id))
+
+    tokens = defaultdict(list)
+    for user_id, token in db.session.query(DeviceToken.user_id, DeviceToken.token) \
+            .filter(DeviceToken.user_id.in_(list(reminders))):
+        tokens[user_id].append(token)
+
+    outcome = {}
+    for user_id, items in reminders.items():
+        if user_id not in tokens:
+            for item in items:
+                outcome[item[3]] = ('no_device', None)
+
+    messages = _build_messages(reminders, tokens)
+    stale_tokens = []
+    for i in range(0, len(messages), PUSH_BATCH):
+        batch = messages[i:i + PUSH_BATCH]
+        try:
+            tickets = sender.send([message for message, _ in batch])
+        except Exception as e:
+            tickets = [{'status': 'error', 'message': str(e)}] * len(batch)
+        stats['requests'] += 1
+        for (message, delivery_ids), ticket in zip(batch, tickets):
+            ok = ticket.get('status') == 'ok'
+            if (ticket.get('details') or {}).get('error') == 'DeviceNotRegistered':
+                stale_tokens.append(message['to'])
+            for delivery_id in delivery_ids:
+                # Delivered if any of the user's devices accepted it.
+                if ok or outcome.get(delivery_id, ('failed',))[0] != 'sent':
+                    outcome[delivery_id] = ('sent', None) if ok else ('failed', (ticket.get('message') or '')[:255])
+    stats['messages'] = len(messages)
+
+    sent_at = datetime.utcnow()
+    db.session.execute(update(ReminderDelivery), [
+        {'id': delivery_id, 'status': status, 'error': error, 'sent_at': sent_at if status == 'sent' else None}
+        for delivery_id, (status, error) in outcome.items()
+    ])
+    if stale_tokens:
+        db.session.execute(delete(DeviceToken).where(DeviceToken.token.in_(stale_tokens)))
+    db.session.commit()
+    for status, _ in outcome.values():
+        stats[status] += 1
+    return stats
+
+
+@click.command('dispatch-reminders')
+@click.option('--loop', is_flag=True, help='Keep running, scanning every --interval seconds.')
+@click.option('--interval', type=int, default=DEFAULT_INTERVAL, show_default=True)
+@click.option('--sender', type=click.Choice(['expo', 'stub']), default=None, help='Default: PUSH_SENDER config.')
+@with_appcontext
+def dispatch_command(loop, interval, sender):
+    """Send due calendar and chore reminders."""
+    push = make_sender(sender)
+    while True:
+        stats = dispatch_reminders(push)
+        click.echo(' '.join(f'{k}={v}' for k, v in stats.items()))
+        if not loop:
+            break
+        time.sleep(interval)
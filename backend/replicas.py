@@ -0,0 +1,118 @@
+import threading, time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+try:
+    import redis
+except ImportError:  # only needed to share stickiness across processes
+    redis = None
+
+from identity import request_identity
+
+# SQLALCHEMY_BINDS key of the read replica. Without it every query goes to
+# the primary and none of this is registered.
+READ_BIND = 'replica'
+READ_METHODS = {'GET', 'HEAD'}
+# How long after a write a user's reads stay on the primary, to cover
+# replication lag.
+DEFAULT_STICKY_SECONDS = 5
+MAX_MEMORY_KEYS = 100000
+
+
+class RoutingSession(Session):
+    # Reads go to the replica when the request was routed there. Flushes,
+    # Core DML and SELECT ... FOR UPDATE always go to the primary, and once a
+    # session has written it reads from the primary too, so a handler never
+    # reads past its own writes.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is None and self._reads_from_replica(clause) and engine is self._db.engines.get(None):
+            return self._db.engines[READ_BIND]
+        return engine
+
+    def _reads_from_replica(self, clause):
+        if not has_request_context():
+            return False
+        if self._flushing or (clause is not None and (getattr(clause, 'is_dml', False)
+                                                      or getattr(clause, '_for_update_arg', None) is not None)):
+            g.db_wrote = True
+            return False
+        return g.get('read_replica', False) and not g.get('db_wrote')
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+class MemoryStickiness:
+    # Recent writers for this process only; fine for a single worker, or
+    # behind a load balancer that pins a client to one.
+    def __init__(self):
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def mark(self, key, seconds, now):
+        with self._lock:
+            self._until[key] = now + seconds
+            if len(self._until) > MAX_MEMORY_KEYS:
+                self._until = {k: v for k, v in self._until.items() if v > now}
+
+    def is_sticky(self, key, now):
+        return self._until.get(key, 0) > now
+
+
+class RedisStickiness:
+    # Recent writers shared by every worker process.
+    def __init__(self, url, prefix='primary-reads:'):
+        if redis is None:
+            raise RuntimeError('REPLICA_STICKINESS_BACKEND is a Redis URL but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def mark(self, key, seconds, now):
+        self.client.set(self.prefix + key, 1, px=int(seconds * 1000))
+
+    def is_sticky(self, key, now):
+        return bool(self.client.exists(self.prefix + key))
+
+
+def make_stickiness(url=None):
+    if not url or url == 'memory':
+        return MemoryStickiness()
+    return RedisStickiness(url)
+
+
+# For handlers whose writer isn't the JWT identity yet, e.g. registration:
+# the new user's first reads must see their own row.
+def note_writer(identity):
+    g.db_writer = identity
+
+
+def route_reads():
+    if request.method not in READ_METHODS:
+        return
+    identity = request_identity()
+    stickiness = current_app.extensions['replica_stickiness']
+    g.read_replica = identity is None or not stickiness.is_sticky(str(identity), time.time())
+
+
+def remember_writer(response):
+    if g.get('db_wrote') and response.status_code < 400:
+        identity = g.get('db_writer', request_identity())
+        if identity is not None:
+            current_app.extensions['replica_stickiness'].mark(
+                str(identity), current_app.config.get('READ_AFTER_WRITE_SECONDS', DEFAULT_STICKY_SECONDS),
+                time.time())
+    return response
+
+
+def init_replicas(app):
+    if READ_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+    app.extensions['replica_stickiness'] = make_stickiness(app.config.get('REPLICA_STICKINESS_BACKEND'))
+    app.before_request(route_reads)
+    app.after_request(remember_writer)
@@ -2,7 +2,15 @@ from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 import random, string, json, calendar
 from extensions import db
-from models import User, Group, Chore, CalendarEvent
+from models import User, Group, Chore, CalendarEvent, DeviceToken
+from pagination import keyset_page, paged_response
+from splits import roster_cache
+from events import record_event, record_events
+from chore_stats import MAX_WEEKS, group_stats, record_completion, record_completions
+from chore_rotation import RotationError, rotate_group
+from concurrency import commit_or_conflict, expect_version, flush_or_conflict
+from replicas import note_writer
+from serializers import CHORE_FIELDS, EVENT_FIELDS, parse_bool, requested_fields, select_columns, serialize_rows
 from flask_jwt_extended import (
     jwt_required, get_jwt_identity, create_access_token
 )
@@ -38,6 +46,102 @@ def calculate_next_due_date(current_date, repeat_type, recurring_days=None, cust
     else:
         return None
 
+# Fields a chore update may change; the name is fixed at creation.
+CHORE_UPDATE_FIELDS = ['assigned_to', 'due_date', 'recurring_days', 'type', 'repeat_type', 'custom_days', 'status']
+# Most chores a single bulk request may touch.
+MAX_BULK_CHORES = 500
+
+# Apply update fields to a loaded chore. Returns the {field: {from, to}} diff.
+def apply_chore_update(chore, data, user_id):
+    changes = {}
+    for field in CHORE_UPDATE_FIELDS:
+        if field in data:
+            changes[field] = {'from': getattr(chore, field)}
+            if field == 'recurring_days':
+                setattr(chore, field, json.dumps(data[field]))
+            else:
+                setattr(chore, field, data[field])
+            changes[field]['to'] = getattr(chore, field)
+    chore.last_updated_by = user_id
+    return changes
+
+# Mark a loaded chore complete, rolling recurring chores over to their next
+# due date. Returns the due date the completion was for.
+def apply_completion(chore, completed_at):
+    chore.completed = True
+    chore.completed_at = completed_at
+    previous_due_date = chore.due_date
+
+    # Handle recurring logic: use the current due_date as base.
+    if chore.type == 'recurring':
+        try:
+            base_date = datetime.strptime(chore.due_date, '%Y-%m-%d') if chore.due_date else completed_at
+            next_due = calculate_next_due_date(
+                base_date,
+                repeat_type=chore.repeat_type,
+                recurring_days=json.loads(chore.recurring_days) if chore.recurring_days else None,
+                custom_days=chore.custom_days
+            )
+            if next_due:
+                chore.due_date = next_due
+                chore.completed = False  # Reset for next cycle.
+                chore.status = 'active'
+        except Exception as e:
+            print("Recurring date error:", e)
+    elif chore.type == 'as_needed':
+        chore.status = 'inactive'
+    return previous_due_date
+
+def completion_event(chore, user_id, previous_due_date, on_time):
+    return {
+        'type': 'chore.completed', 'group_id': chore.group_id, 'user_id': user_id, 'entity_id': chore.id,
+        'payload': {'completed_by': user_id, 'completed_at': chore.completed_at, 'due_date': previous_due_date,
+                    'next_due_date': chore.due_date if chore.due_date != previous_due_date else None,
+                    'on_time': on_time},
+    }
+
+# Load the chores a bulk request targets, in one query: either explicit
+# `chore_ids` or a `filter` on group_id (required), assigned_to ('me' for the
+# caller), type, status and due_before (YYYY-MM-DD, inclusive). Returns
+# (chores, requested ids or None, error).
+def load_bulk_chores(data, user_id, default_filter=None):
+    if 'chore_ids' in data:
+        ids = data['chore_ids']
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return None, None, 'chore_ids must be a non-empty list of integers'
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > MAX_BULK_CHORES:
+            return None, None, f'At most {MAX_BULK_CHORES} chores per request'
+        return Chore.query.filter(Chore.id.in_(ids)).all(), ids, None
+
+    criteria = {**(default_filter or {}), **(data.get('filter') or {})}
+    if 'group_id' not in criteria:
+        return None, None, 'Provide chore_ids or a filter with group_id'
+    user = User.query.get(user_id)
+    if not user or user.group_id != criteria['group_id']:
+        return None, None, 'Not a member of this group'
+
+    query = Chore.query.filter(Chore.group_id == criteria['group_id'], Chore.completed.isnot(True))
+    if 'assigned_to' in criteria:
+        query = query.filter(Chore.assigned_to == (user_id if criteria['assigned_to'] == 'me'
+                                                   else criteria['assigned_to']))
+    if 'type' in criteria:
+        query = query.filter(Chore.type == criteria['type'])
+    if 'status' in criteria:
+        query = query.filter(Chore.status == criteria['status'])
+    if 'due_before' in criteria:
+        query = query.filter(Chore.due_date <= criteria['due_before'])
+    chores = query.order_by(Chore.id).limit(MAX_BULK_CHORES + 1).all()
+    if len(chores) > MAX_BULK_CHORES:
+        return None, None, f'Filter matches more than {MAX_BULK_CHORES} chores'
+    return chores, None, None
+
+def bulk_result(done_key, done, errors, requested_ids, chores):
+    found = {c.id for c in chores}
+    if requested_ids:
+        errors += [{'chore_id': i, 'error': 'Chore not found'} for i in requested_ids if i not in found]
+    return jsonify({done_key: done, 'errors': sorted(errors, key=lambda e: e['chore_id'])})
+
 ### AUTHENTICATION ENDPOINTS
 
 @routes.route('/auth/register', methods=['POST'])
@@ -53,7 +157,10 @@ def register():
     user = User(name=data['name'], email=data['email'])
     user.set_password(data['password'])  # Hash and set the password.
     db.session.add(user)
+    db.session.flush()
+    record_event('user.registered', user_id=user.id, entity_id=user.id, name=user.name, status='home')
     db.session.commit()
+    note_writer(user.id)
 
     # Create a JWT token with the user's id as the identity.
     access_token = create_access_token(identity=user.id)
@@ -95,8 +202,12 @@ def create_group():
     db.session.add(group)
     db.session.flush()
 
+    previous_group = user.group_id
     user.group_id = group.id
-    db.session.commit()
+    record_event('group.created', group_id=group.id, user_id=user.id, entity_id=group.id,
+                 name=group.name, previous_group_id=previous_group)
+    commit_or_conflict(user)
+    roster_cache.invalidate(previous_group)
     return jsonify({'message': 'Group created', 'invite_code': group.invite_code, 'group_id': group.id})
 
 @routes.route('/groups/join', methods=['POST'])
@@ -117,8 +228,14 @@ def join_group():
     if not user:
         return jsonify({"error": "User not found"}), 404
     
+    expect_version(user, data)
+    previous_group = user.group_id
     user.group_id = group.id
-    db.session.commit()
+    record_event('group.joined', group_id=group.id, user_id=user.id, entity_id=group.id,
+                 previous_group_id=previous_group)
+    commit_or_conflict(user)
+    roster_cache.invalidate(previous_group)
+    roster_cache.invalidate(group.id)
     return jsonify({"message": f"{user.name} joined group {group.name}", "group_id": group.id}), 200
 
 
@@ -129,41 +246,35 @@ def list_group_users_with_chores(group_id):
     if not group:
         return jsonify({'error': 'Group not found'}), 404
     
-    users = User.query.filter_by(group_id=group_id).all()
-    result = []
-    for user in users:
-        chores = Chore.query.filter_by(assigned_to=user.id).all()
-        user_data = {
-            'id': user.id,
-            'name': user.name,
-            'email': user.email,
-            'status': user.status,
-            'chores': [{
-                'id': c.id,
-                'name': c.name,
-                'group_id': c.group_id,
-                'assigned_to': c.assigned_to,
-                'created_by': c.created_by,
-                'last_updated_by': c.last_updated_by,
-                'type': c.type,
-                'repeat_type': c.repeat_type,
-                'recurring_days': c.recurring_days,
-                'custom_days': c.custom_days,
-                'due_date': c.due_date,
-                'status': c.status,
-                'completed': c.completed,
-                'created_at': c.created_at.isoformat() if c.created_at else None,
-                'completed_at': c.completed_at.isoformat() if c.completed_at else None
-            } for c in chores]
-        }
-        result.append(user_data)
+    users, next_cursor = keyset_page(
+        db.session.query(User.id, User.name, User.email, User.status).filter(User.group_id == group_id),
+        User.name, User.id
+    )
+
+    # One query for every listed user's chores, selecting only the requested
+    # chore fields (plus assigned_to to group them by user).
+    chore_fields = requested_fields(CHORE_FIELDS)
+    chore_rows = db.session.query(
+        *select_columns(CHORE_FIELDS, chore_fields, extra=[Chore.assigned_to])
+    ).filter(Chore.assigned_to.in_([u.id for u in users])).order_by(Chore.id).all()
+    chores_by_user = {}
+    for row, chore in zip(chore_rows, serialize_rows(chore_rows, CHORE_FIELDS, chore_fields)):
+        chores_by_user.setdefault(row.assigned_to, []).append(chore)
+
+    result = [{
+        'id': user.id,
+        'name': user.name,
+        'email': user.email,
+        'status': user.status,
+        'chores': chores_by_user.get(user.id, [])
+    } for user in users]
         
-    return jsonify({
+    return paged_response({
         'group_id': group.id,
         'group_name': group.name,
         'invite_code': group.invite_code,
         'chores' : result
-    })
+    }, next_cursor)
 
 ### CHORE ROUTES
 
@@ -186,6 +297,10 @@ def create_chore():
         status=data.get('status', 'active')
     )
     db.session.add(chore)
+    db.session.flush()
+    record_event('chore.created', group_id=chore.group_id, user_id=current_user_id, entity_id=chore.id,
+                 name=chore.name, type=chore.type, assigned_to=chore.assigned_to, due_date=chore.due_date,
+                 repeat_type=chore.repeat_type, recurring_days=chore.recurring_days, custom_days=chore.custom_days)
     db.session.commit()
     return jsonify({'message': 'Chore created', 'chore_id': chore.id})
 
@@ -204,16 +319,12 @@ def update_chore(chore_id):
     if 'name' in data:
         return jsonify({'error': 'Chore name cannot be changed'}), 400
 
-    allowed_fields = ['assigned_to', 'due_date', 'recurring_days', 'type', 'repeat_type', 'custom_days', 'status']
-    for field in allowed_fields:
-        if field in data:
-            if field == 'recurring_days':
-                setattr(chore, field, json.dumps(data[field]))
-            else:
-                setattr(chore, field, data[field])
-    chore.last_updated_by = current_user_id
-    db.session.commit()
-    return jsonify({'message': 'Chore updated'})
+    expect_version(chore, data)
+    changes = apply_chore_update(chore, data, current_user_id)
+    record_event('chore.updated', group_id=chore.group_id, user_id=current_user_id, entity_id=chore.id,
+                 changes=changes)
+    commit_or_conflict(chore)
+    return jsonify({'message': 'Chore updated', 'version': chore.version})
 
 @routes.route('/chores/<int:chore_id>/complete', methods=['POST'])
 @jwt_required()
@@ -227,30 +338,117 @@ def complete_chore(chore_id):
     if current_user_id != chore.assigned_to:
         return jsonify({'error': 'Only the assignee can complete this chore'}), 403
 
-    chore.completed = True
-    chore.completed_at = datetime.utcnow()
+    expect_version(chore, data)
+    previous_due_date = apply_completion(chore, datetime.utcnow())
+    flush_or_conflict(chore)
+
+    # The overwritten due date is kept with the completion, so history
+    # survives the recurring rollover.
+    on_time = record_completion(chore, current_user_id, chore.completed_at, previous_due_date)
+    record_events([completion_event(chore, current_user_id, previous_due_date, on_time)])
+    commit_or_conflict(chore)
+    return jsonify({'message': 'Chore marked as complete (and rescheduled if recurring)', 'version': chore.version})
+
+# Complete many chores with one load and one commit. Same rule as the single
+# endpoint: only the assignee may complete a chore; the rest are reported in
+# `errors`. A filter defaults to the caller's own chores.
+@routes.route('/chores/bulk/complete', methods=['POST'])
+@jwt_required()
+def bulk_complete_chores():
+    data = request.get_json(silent=True) or {}
+    current_user_id = get_jwt_identity()
+    chores, requested_ids, error = load_bulk_chores(data, current_user_id, default_filter={'assigned_to': 'me'})
+    if error:
+        return jsonify({'error': error}), 400
+
+    now = datetime.utcnow()
+    completed, errors, completions = [], [], []
+    for chore in chores:
+        if current_user_id != chore.assigned_to:
+            errors.append({'chore_id': chore.id, 'error': 'Only the assignee can complete this chore'})
+            continue
+        completions.append((chore, current_user_id, now, apply_completion(chore, now)))
+
+    # If any chore was completed concurrently the whole batch is rolled back.
+    flush_or_conflict(*[chore for chore, _, _, _ in completions])
+    on_time = record_completions(completions)
+    record_events([completion_event(chore, user_id, due_date, flag)
+                   for (chore, user_id, _, due_date), flag in zip(completions, on_time)])
+    for (chore, _, _, due_date), flag in zip(completions, on_time):
+        completed.append({'chore_id': chore.id, 'due_date': due_date, 'next_due_date': chore.due_date
+                          if chore.due_date != due_date else None, 'on_time': flag})
+    commit_or_conflict(*[chore for chore, _, _, _ in completions])
+    return bulk_result('completed', completed, errors, requested_ids, chores)
+
+# Apply the same `changes` to many chores with one load and one commit. Only
+# the creator or assignee of each chore may update it.
+@routes.route('/chores/bulk/update', methods=['POST'])
+@jwt_required()
+def bulk_update_chores():
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({'error': 'changes must be a non-empty object'}), 400
+    if 'name' in changes:
+        return jsonify({'error': 'Chore name cannot be changed'}), 400
 
-    # Handle recurring logic: use the current due_date as base.
-    if chore.type == 'recurring':
-        try:
-            base_date = datetime.strptime(chore.due_date, '%Y-%m-%d') if chore.due_date else datetime.utcnow()
-            next_due = calculate_next_due_date(
-                base_date,
-                repeat_type=chore.repeat_type,
-                recurring_days=json.loads(chore.recurring_days) if chore.recurring_days else None,
-                custom_days=chore.custom_days
-            )
-            if next_due:
-                chore.due_date = next_due
-                chore.completed = False  # Reset for next cycle.
-                chore.status = 'active'
-        except Exception as e:
-            print("Recurring date error:", e)
-    elif chore.type == 'as_needed':
-        chore.status = 'inactive'
+    current_user_id = get_jwt_identity()
+    chores, requested_ids, error = load_bulk_chores(data, current_user_id)
+    if error:
+        return jsonify({'error': error}), 400
+
+    updated, errors, events, touched = [], [], [], []
+    for chore in chores:
+        if current_user_id != chore.created_by and current_user_id != chore.assigned_to:
+            errors.append({'chore_id': chore.id, 'error': 'Not authorized'})
+            continue
+        diff = apply_chore_update(chore, changes, current_user_id)
+        events.append({'type': 'chore.updated', 'group_id': chore.group_id, 'user_id': current_user_id,
+                       'entity_id': chore.id, 'payload': {'changes': diff}})
+        updated.append(chore.id)
+        touched.append(chore)
+
+    flush_or_conflict(*touched)
+    record_events(events)
+    commit_or_conflict(*touched)
+    return bulk_result('updated', updated, errors, requested_ids, chores)
+
+@routes.route('/chores/rotate/<int:group_id>', methods=['POST'])
+@jwt_required()
+def rotate_chores(group_id):
+    data = request.get_json(silent=True) or {}
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    if not user or user.group_id != group_id:
+        return jsonify({'error': 'Not a member of this group'}), 403
 
-    db.session.commit()
-    return jsonify({'message': 'Chore marked as complete (and rescheduled if recurring)'})
+    try:
+        dry_run = bool(parse_bool(data.get('dry_run', request.args.get('dry_run')), 'dry_run'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        plan = rotate_group(group_id, current_user_id, dry_run=dry_run)
+    except RotationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not dry_run:
+        record_event('chores.rotated', group_id=group_id, user_id=current_user_id,
+                     assignments={a['chore_id']: a['assigned_to'] for a in plan['assignments']
+                                  if a['assigned_to'] != a['previous']})
+        db.session.commit()
+    return jsonify(plan)
+
+@routes.route('/chores/stats/<int:group_id>', methods=['GET'])
+@jwt_required()
+def chore_stats(group_id):
+    try:
+        weeks = int(request.args.get('weeks', 12))
+    except ValueError:
+        return jsonify({'error': 'weeks must be an integer'}), 400
+    if weeks < 1:
+        return jsonify({'error': 'weeks must be positive'}), 400
+
+    return jsonify(group_stats(group_id, min(weeks, MAX_WEEKS)))
 
 @routes.route('/me', methods=['GET'])
 @jwt_required()
@@ -261,7 +459,8 @@ def get_me():
         "id": user.id,
         "name": user.name,
         "email": user.email,
-        "group_id": user.group_id
+        "group_id": user.group_id,
+        "version": user.version
     })
 
 @routes.route('/calendar/create', methods=['POST'])
@@ -294,6 +493,10 @@ def create_calendar():
     )
 
     db.session.add(event)
+    db.session.flush()
+    record_event('calendar.created', group_id=event.group_id, user_id=user_id, entity_id=event.id,
+                 title=event.title, start_time=event.start_time, end_time=event.end_time,
+                 is_reminder=event.is_reminder)
     db.session.commit()
 
     return jsonify({'message': 'Calendar event created', 'event_id': event.id}), 201
@@ -301,16 +504,12 @@ def create_calendar():
 @routes.route('/calendar/group/<int:group_id>', methods=['GET'])
 @jwt_required()
 def get_group_events(group_id):
-    events = CalendarEvent.query.filter_by(group_id=group_id).order_by(CalendarEvent.start_time).all()
-    return jsonify([{
-        'id': e.id,
-        'title': e.title,
-        'description': e.description,
-        'created_by': e.created_by,
-        'start_time': e.start_time.isoformat(),
-        'end_time': e.end_time.isoformat() if e.end_time else None,
-        'is_reminder': e.is_reminder
-    } for e in events])
+    fields = requested_fields(EVENT_FIELDS)
+    query = db.session.query(
+        *select_columns(EVENT_FIELDS, fields, extra=[CalendarEvent.start_time, CalendarEvent.id])
+    ).filter(CalendarEvent.group_id == group_id)
+    events, next_cursor = keyset_page(query, CalendarEvent.start_time, CalendarEvent.id)
+    return paged_response(serialize_rows(events, EVENT_FIELDS, fields), next_cursor)
 
 @routes.route('/user/status', methods=['PATCH'])
 @jwt_required()
@@ -323,9 +522,44 @@ def update_status():
         return jsonify({'error': 'Invalid status'}), 400
 
     user = User.query.get(user_id)
+    expect_version(user, data)
+    previous_status = user.status
     user.status = status
+    record_event('user.status_changed', group_id=user.group_id, user_id=user.id, entity_id=user.id,
+                 status=status, previous_status=previous_status)
+    commit_or_conflict(user)
+    return jsonify({'message': 'Status updated', 'version': user.version}), 200
+
+### DEVICES
+
+# Register (or re-register) an Expo push token for the current user. A token
+# that moves to another account follows the latest login.
+@routes.route('/devices/register', methods=['POST'])
+@jwt_required()
+def register_device():
+    data = request.get_json(silent=True) or {}
+    token = data.get('token')
+    if not token or not isinstance(token, str) or len(token) > 255:
+        return jsonify({'error': 'token is required'}), 400
+
+    user_id = get_jwt_identity()
+    device = DeviceToken.query.filter_by(token=token).first()
+    if device is None:
+        device = DeviceToken(token=token, created_at=datetime.utcnow())
+        db.session.add(device)
+    device.user_id = user_id
+    device.platform = data.get('platform', device.platform)
+    device.last_seen_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify({'message': 'Device registered'}), 200
+
+@routes.route('/devices/unregister', methods=['POST'])
+@jwt_required()
+def unregister_device():
+    data = request.get_json(silent=True) or {}
+    DeviceToken.query.filter_by(token=data.get('token'), user_id=get_jwt_identity()).delete()
     db.session.commit()
-    return jsonify({'message': 'Status updated'}), 200
+    return jsonify({'message': 'Device unregistered'}), 200
 
 
 
@@ -0,0 +1,156 @@
+from flask import request
+from flask.json.provider import DefaultJSONProvider, _default
+
+from models import User, Chore, CalendarEvent, InventoryItem
+from compression import msgpack, wants_msgpack, msgpack_body, MSGPACK_MIMETYPE
+
+try:
+    import orjson
+except ImportError:  # optional speedup, fall back to the stdlib encoder
+    orjson = None
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+# Field specs map each public field name to the column that backs it and an
+# optional formatter. Only the columns for the requested fields are put in the
+# SELECT, so unused columns are never fetched or hydrated into objects.
+CHORE_FIELDS = {
+    'id': (Chore.id, None),
+    'name': (Chore.name, None),
+    'group_id': (Chore.group_id, None),
+    'assigned_to': (Chore.assigned_to, None),
+    'created_by': (Chore.created_by, None),
+    'last_updated_by': (Chore.last_updated_by, None),
+    'type': (Chore.type, None),
+    'repeat_type': (Chore.repeat_type, None),
+    'recurring_days': (Chore.recurring_days, None),
+    'custom_days': (Chore.custom_days, None),
+    'due_date': (Chore.due_date, None),
+    'status': (Chore.status, None),
+    'completed': (Chore.completed, None),
+    'created_at': (Chore.created_at, _iso),
+    'completed_at': (Chore.completed_at, _iso),
+    'version': (Chore.version, None),
+}
+
+EVENT_FIELDS = {
+    'id': (CalendarEvent.id, None),
+    'title': (CalendarEvent.title, None),
+    'description': (CalendarEvent.description, None),
+    'created_by': (CalendarEvent.created_by, None),
+    'start_time': (CalendarEvent.start_time, _iso),
+    'end_time': (CalendarEvent.end_time, _iso),
+    'is_reminder': (CalendarEvent.is_reminder, None),
+}
+
+MY_INVENTORY_FIELDS = {
+    'id': (InventoryItem.id, None),
+    'name': (InventoryItem.name, None),
+    'quantity': (InventoryItem.quantity, None),
+    'category': (InventoryItem.category, None),
+    'custom_type': (InventoryItem.custom_type, None),
+    'is_shared': (InventoryItem.is_shared, None),
+    'notes': (InventoryItem.notes, None),
+    'created_at': (InventoryItem.created_at, _iso),
+    'version': (InventoryItem.version, None),
+}
+
+GROUP_INVENTORY_FIELDS = {
+    'id': (InventoryItem.id, None),
+    'name': (InventoryItem.name, None),
+    'owner_id': (InventoryItem.owner_id, None),
+    'owner_name': (User.name.label('owner_name'), None),
+    'quantity': (InventoryItem.quantity, None),
+    'category': (InventoryItem.category, None),
+    'custom_type': (InventoryItem.custom_type, None),
+    'is_shared': (InventoryItem.is_shared, None),
+    'notes': (InventoryItem.notes, None),
+    'created_at': (InventoryItem.created_at, _iso),
+    'version': (InventoryItem.version, None),
+}
+
+
+# Parse ?fields=a,b,c against a spec. Missing or empty means every field.
+def requested_fields(spec, arg='fields'):
+    raw = request.args.get(arg)
+    if not raw:
+        return list(spec)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in spec]
+    if unknown:
+        raise FieldsError(f'Unknown field(s): {", ".join(unknown)}')
+    return fields
+
+
+# true/false/1/0 (any case) from a query argument or JSON body, None when
+# absent or empty. Anything else is a ValueError naming the argument.
+def parse_bool(value, name):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).lower()
+    if lowered in ('true', '1'):
+        return True
+    if lowered in ('false', '0'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+# Columns to SELECT for the given fields. `extra` columns (sort keys, grouping
+# keys) are fetched for the query's own use but only emitted if requested.
+def select_columns(spec, fields, extra=()):
+    columns = [spec[f][0] for f in fields]
+    keys = {c.key for c in columns}
+    columns.extend(c for c in extra if c.key not in keys)
+    return columns
+
+
+# Build plain dicts from Core row tuples.
+def serialize_rows(rows, spec, fields):
+    plan = [(f, spec[f][0].key, spec[f][1]) for f in fields]
+    out = []
+    for row in rows:
+        mapping = row._mapping
+        item = {}
+        for name, key, fmt in plan:
+            value = mapping[key]
+            item[name] = fmt(value) if fmt else value
+        out.append(item)
+    return out
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    # orjson is several times faster than the stdlib encoder on the large list
+    # payloads these endpoints return; anything it can't encode natively goes
+    # through Flask's usual default hook. Clients that prefer
+    # application/msgpack get the same payload packed as MessagePack instead.
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if wants_msgpack():
+            response = self._app.response_class(msgpack_body(obj, _default), mimetype=MSGPACK_MIMETYPE)
+        elif orjson is None:
+            response = self._app.response_class(self.dumps(obj), mimetype=self.mimetype)
+        else:
+            body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+            response = self._app.response_class(body, mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
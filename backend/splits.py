@@ -0,0 +1,143 @@
+import threading, time
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+from sqlalchemy import insert, update
+
+from extensions import db
+from models import User, Expense, ExpenseSplit
+
+# Roster entries are reused for this long before being reloaded; membership
+# changes made through this process invalidate them immediately.
+ROSTER_TTL = 30
+
+
+class SplitError(ValueError):
+    pass
+
+
+def to_cents(amount):
+    try:
+        return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, TypeError):
+        raise SplitError('amount must be a number')
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+class RosterCache:
+    # group_id -> sorted member ids. Expense creation only needs the ids, so
+    # this skips loading User rows on every split.
+    def __init__(self, ttl=ROSTER_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # refresh=True skips the cached entry, e.g. to confirm a miss: another
+    # worker may have added the member since this process cached the roster.
+    def get(self, group_id, refresh=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(group_id)
+            if entry and entry[0] > now and not refresh:
+                return entry[1]
+        ids = tuple(db.session.scalars(
+            db.select(User.id).where(User.group_id == group_id).order_by(User.id)
+        ))
+        with self._lock:
+            self._entries[group_id] = (now + self.ttl, ids)
+        return ids
+
+    def invalidate(self, group_id=None):
+        with self._lock:
+            if group_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(group_id, None)
+
+
+roster_cache = RosterCache()
+
+
+# Split total_cents across user_ids so the shares add back up to the total
+# exactly: everyone gets the floor share and the leftover cents go one each to
+# the first members (by id).
+def allocate_equal(total_cents, user_ids):
+    if not user_ids:
+        raise SplitError('No users in group to split with')
+    share, remainder = divmod(total_cents, len(user_ids))
+    return [(user_id, share + (1 if i < remainder else 0)) for i, user_id in enumerate(user_ids)]
+
+
+# Turn an expense's split_type/splits request fields into [(user_id, cents)].
+def compute_splits(group_id, total_cents, split_type='equal', splits_data=None):
+    members = roster_cache.get(group_id)
+    if split_type == 'equal':
+        return allocate_equal(total_cents, members)
+
+    if split_type == 'custom':
+        if not splits_data or not isinstance(splits_data, list):
+            raise SplitError('Custom splits must be a list of user_id and amount')
+        try:
+            splits = [(int(s['user_id']), to_cents(s['amount'])) for s in splits_data]
+        except (KeyError, TypeError, ValueError):
+            raise SplitError('Custom splits must be a list of user_id and amount')
+        if any(user_id not in members for user_id, _ in splits):
+            members = roster_cache.get(group_id, refresh=True)
+        if any(user_id not in members for user_id, _ in splits):
+            raise SplitError('Split users must be members of the group')
+        if sum(cents for _, cents in splits) != total_cents:
+            raise SplitError('Split amounts must equal total amount')
+        return splits
+
+    raise SplitError('Invalid split_type')
+
+
+# Split rows for an expense. Each debtor starts out owing their whole share;
+# the payer's own share is never outstanding.
+def split_rows(expense_id, paid_by, splits):
+    return [
+        {'expense_id': expense_id, 'user_id': user_id, 'amount': from_cents(cents),
+         'outstanding_cents': 0 if user_id == paid_by else cents}
+        for user_id, cents in splits
+    ]
+
+
+# Write every split for an expense with a single multi-row INSERT.
+def insert_splits(expense_id, paid_by, splits):
+    if not splits:
+        return
+    db.session.execute(insert(ExpenseSplit).values(split_rows(expense_id, paid_by, splits)))
+
+
+# Apply a payment of `cents` from debtor to creditor against the debtor's open
+# splits: the named expense first (if any), then the oldest open splits owed to
+# that creditor in the group. All touched splits are written in one batched UPDATE.
+# Returns the cents that could not be allocated (an overpayment).
+def settle_payment(from_user, to_user, group_id, cents, expense_id=None):
+    open_splits = (
+        db.session.query(ExpenseSplit.id, ExpenseSplit.outstanding_cents)
+        .join(Expense, Expense.id == ExpenseSplit.expense_id)
+        .filter(ExpenseSplit.user_id == from_user,
+                ExpenseSplit.outstanding_cents > 0,
+                Expense.paid_by == to_user,
+                Expense.group_id == group_id)
+    )
+    if expense_id is not None:
+        open_splits = open_splits.order_by((Expense.id != expense_id), Expense.created_at, ExpenseSplit.id)
+    else:
+        open_splits = open_splits.order_by(Expense.created_at, ExpenseSplit.id)
+
+    changes = []
+    remaining = cents
+    for split_id, outstanding in open_splits.with_for_update(of=ExpenseSplit):
+        if remaining <= 0:
+            break
+        applied = min(outstanding, remaining)
+        remaining -= applied
+        changes.append({'id': split_id, 'outstanding_cents': outstanding - applied})
+
+    if changes:
+        db.session.execute(update(ExpenseSplit), changes)
+    return remaining
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from extensions import db
+from models import Group
+from jobs import task, schedule, prune_finished
+from expense_routes import generate_due_recurring
+from ledger import DEFAULT_RETENTION_DAYS, archive_settled
+from projections import run_projections
+from reminders import dispatch_reminders, make_sender
+from idempotency import store as idempotency_store
+
+# Job functions take the job's JSON payload as keyword arguments and return
+# something JSON-serializable, stored as the job's result.
+
+
+@task('expenses.generate_recurring')
+def generate_recurring():
+    return {'created': generate_due_recurring(datetime.utcnow().date())}
+
+
+# Not retried: the next scheduled scan picks up anything still due.
+@task('reminders.dispatch', max_attempts=1)
+def dispatch():
+    return dispatch_reminders(make_sender())
+
+
+@task('projections.run')
+def projections():
+    processed, elapsed = run_projections()
+    return {'processed': processed, 'seconds': round(elapsed, 3)}
+
+
+@task('ledger.archive')
+def archive(retention_days=DEFAULT_RETENTION_DAYS):
+    # Materialised first: archive_settled commits per group, which would
+    # invalidate a cursor still being iterated.
+    group_ids = db.session.scalars(select(Group.id)).all()
+    return {gid: archive_settled(gid, retention_days) for gid in group_ids}
+
+
+@task('idempotency.purge')
+def purge_idempotency_keys():
+    return {'purged': idempotency_store.purge()}
+
+
+@task('jobs.prune')
+def prune_jobs():
+    pruned = prune_finished()
+    db.session.commit()
+    return {'pruned': pruned}
+
+
+schedule('generate-recurring', '0 3 * * *', 'expenses.generate_recurring')
+schedule('dispatch-reminders', '* * * * *', 'reminders.dispatch')
+schedule('run-projections', '* * * * *', 'projections.run')
+schedule('archive-ledgers', '30 4 * * 0', 'ledger.archive')
+schedule('purge-idempotency-keys', '15 * * * *', 'idempotency.purge')
+schedule('prune-jobs', '45 4 * * *', 'jobs.prune')
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        # The app issues integer user ids as `sub`, which newer PyJWT rejects.
+        'JWT_VERIFY_SUB': False,
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    def register(name):
+        r = client.post('/auth/register', json={'name': name, 'email': f'{name}@example.com', 'password': 'pw'})
+        return r.json['user_id'], {'Authorization': f"Bearer {r.json['access_token']}"}
+    return register
@@ -0,0 +1,78 @@
+import csv
+
+import expense_import
+from extensions import db
+from models import Expense
+
+
+def _group(client, headers):
+    return client.post('/groups/create', json={'name': 'Flat'}, headers=headers).json['group_id']
+
+
+def _descriptions(app):
+    with app.app_context():
+        return sorted(db.session.scalars(db.select(Expense.description)).all())
+
+
+def test_bad_line_mid_file_is_reported_and_the_rest_imported(app, client, register, monkeypatch):
+    # One row per chunk, so rows on both sides of the bad line are committed
+    # by separate flushes.
+    monkeypatch.setattr(expense_import, 'CHUNK_SIZE', 1)
+    user_id, headers = register('alice')
+    group_id = _group(client, headers)
+    body = (b'description,amount,paid_by\n'
+            b'Rent,100,' + str(user_id).encode() + b'\n'
+            b'Caf\xe9,4,' + str(user_id).encode() + b'\n'
+            b'Food,30,' + str(user_id).encode() + b'\n')
+
+    r = client.post(f'/expenses/import/{group_id}?format=csv', data=body, headers=headers)
+
+    assert r.status_code == 200
+    assert r.json['imported_expenses'] == 2
+    assert r.json['errors'] == [{'line': 3, 'error': 'Invalid UTF-8'}]
+    assert _descriptions(app) == ['Food', 'Rent']
+
+
+def test_bad_ndjson_line_is_reported(app, client, register):
+    user_id, headers = register('alice')
+    group_id = _group(client, headers)
+    body = (f'{{"description": "Rent", "amount": 100, "paid_by": {user_id}}}\n'.encode()
+            + b'{"description": "Caf\xe9", "amount": 4}\n'
+            + f'{{"description": "Food", "amount": 30, "paid_by": {user_id}}}\n'.encode())
+
+    r = client.post(f'/expenses/import/{group_id}?format=ndjson', data=body, headers=headers)
+
+    assert r.status_code == 200
+    assert r.json['imported_expenses'] == 2
+    assert r.json['errors'] == [{'line': 2, 'error': 'Invalid UTF-8'}]
+
+
+def test_malformed_csv_line_is_reported(app, client, register):
+    user_id, headers = register('alice')
+    group_id = _group(client, headers)
+    body = (b'description,amount,paid_by\n'
+            b'Rent,100,' + str(user_id).encode() + b'\n'
+            b'"A very long description",4,' + str(user_id).encode() + b'\n'
+            b'Food,30,' + str(user_id).encode() + b'\n')
+
+    limit = csv.field_size_limit(16)
+    try:
+        r = client.post(f'/expenses/import/{group_id}?format=csv', data=body, headers=headers)
+    finally:
+        csv.field_size_limit(limit)
+
+    assert r.status_code == 200
+    assert r.json['imported_expenses'] == 2
+    assert [e['line'] for e in r.json['errors']] == [3]
+
+
+def test_unreadable_header_stops_with_a_report(app, client, register):
+    _, headers = register('alice')
+    group_id = _group(client, headers)
+
+    r = client.post(f'/expenses/import/{group_id}?format=csv', data=b'descr\xffption,amount\nRent,1\n',
+                    headers=headers)
+
+    assert r.status_code == 400
+    assert r.json['imported_expenses'] == 0
+    assert r.json['aborted'] == 'CSV header is not valid UTF-8'
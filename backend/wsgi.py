@@ -0,0 +1,7 @@
+# Production entry point, e.g.
+#   APP_PROFILE=production gunicorn --workers 4 --threads 8 wsgi:app
+# Every profile except development warms the app up before it is returned,
+# so the first real request doesn't pay for pool and mapper setup.
+from app import create_app
+
+app = create_app()
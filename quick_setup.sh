@@ -25,8 +25,9 @@ source venv/bin/activate
 pip install flask flask-sqlalchemy flask-cors werkzeug python-dotenv pyjwt
 python3 -c "
 try:
-    from app import app
+    from app import create_app
     from extensions import db
+    app = create_app()
     with app.app_context():
         db.create_all()
     print('✅ Database initialized')
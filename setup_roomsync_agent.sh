@@ -84,8 +84,9 @@ python3 -c "
 import sys
 sys.path.append('.')
 try:
-    from app import app
+    from app import create_app
     from extensions import db
+    app = create_app()
     with app.app_context():
         db.create_all()
     print('Database initialized successfully.')
@@ -152,7 +153,7 @@ cd Frontend && npm run ios           # Run on iOS
 cd backend && source venv/bin/activate && python3 app.py
 
 # Database
-cd backend && source venv/bin/activate && python3 -c "from app import app; from extensions import db; app.app_context().push(); db.create_all()"
+cd backend && source venv/bin/activate && python3 -c "from app import create_app; from extensions import db; app = create_app(); app.app_context().push(); db.create_all()"
 ```
 
 ## API Endpoints